@@ -0,0 +1,271 @@
+#!/usr/bin/python3
+
+# bench_statemachine.py -- Benchmarks of the ravidplay.py state machine
+# Copyright (C) 2021 schlizbäda
+#
+# bench_statemachine.py is free software: you can redistribute it and/or
+# modify it under the terms of the GNU General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# The state machine is driven through scripted scenarios against the
+# simulated omxplayer instances and GPIO pins of ravidplay.py. The time is
+# simulated as well, so each scenario covers hours of the video sequence.
+#
+# usage: bench_statemachine.py [--scenario=NAME ...] [--seconds=SECONDS]
+#                              [--spawn=SECONDS] [--dbus=SECONDS]
+#                              [--errors=RATE] [--hangs=RATE] [--seed=N]
+#                              [--output=FILE] [--compare=FILE]
+#                              [config parameters like -cntdn_mode=armed]
+
+
+import os
+import sys
+import time
+import json
+import random
+import tempfile
+import subprocess
+
+BENCHDIR = os.path.dirname(os.path.realpath(__file__))
+sys.path.insert(0, os.path.dirname(BENCHDIR))
+import ravidplay
+
+
+# Durations in seconds of the simulated videos:
+IDLE_DURATIONS = [12.0, 15.0, 18.0, 20.0]
+CNTDN_DURATION = 10.0
+APPL_DURATION = 8.0
+CHECK_INTERVAL = 0.01 # seconds between two checks of a scenario condition
+BUZZER_PAUSE = 5.0 # seconds between the end of a session and the next press
+
+
+def make_videos(dirnam, missing=False):
+    # Dummy video files and their simulated durations. The container format
+    # is unknown, so the durations are taken from the backend:
+    durations = {}
+    sources = {ravidplay.CATEGORY_IDLE: [], ravidplay.CATEGORY_CNTDN: [],
+               ravidplay.CATEGORY_APPL: []}
+    for i, duration in enumerate(IDLE_DURATIONS):
+        filenam = os.path.join(dirnam, 'idle{}.mp4'.format(i))
+        sources[ravidplay.CATEGORY_IDLE].append(filenam)
+        durations[filenam] = duration
+    for category, duration in ((ravidplay.CATEGORY_CNTDN, CNTDN_DURATION),
+                               (ravidplay.CATEGORY_APPL, APPL_DURATION)):
+        filenam = os.path.join(dirnam, '{}0.mp4'.format(category))
+        sources[category].append(filenam)
+        durations[filenam] = duration
+    for filenam in durations:
+        with open(filenam, 'wb') as f:
+            f.write(b'\0' * 64)
+    if missing:
+        # A file listed but not existing:
+        sources[ravidplay.CATEGORY_IDLE].insert(
+                1, os.path.join(dirnam, 'missing.mp4'))
+    return sources, durations
+
+
+def press_when(statemachine, backend, condition):
+    # Press the buzzer as soon as the condition is true for the state
+    # machine. The next press is prepared after the end of the session:
+    clock = backend.clock
+
+    def check():
+        now = clock.monotonic()
+        if statemachine.buzzer_enabled == 0 and condition(statemachine):
+            backend.press(ravidplay.GPIO_BUZZER, now)
+            clock.call_at(now + BUZZER_PAUSE, wait_for_session)
+        else:
+            clock.call_at(now + CHECK_INTERVAL, check)
+
+    def wait_for_session():
+        # The buzzer is enabled again at the end of the countdown video:
+        now = clock.monotonic()
+        if statemachine.buzzer_enabled == 0:
+            clock.call_at(now + BUZZER_PAUSE, check)
+        else:
+            clock.call_at(now + CHECK_INTERVAL, wait_for_session)
+
+    clock.call_at(clock.monotonic() + BUZZER_PAUSE, check)
+
+
+def scenario_idle_rotation(statemachine, backend):
+    # Steady rotation of the idle videos without any buzzer press.
+    pass
+
+
+def scenario_buzzer_mid_fade(statemachine, backend):
+    # The buzzer is pressed while the idle videos are fading:
+    press_when(statemachine, backend, lambda sm: sm.is_fading())
+
+
+def scenario_buzzer_while_loading(statemachine, backend):
+    # The buzzer is pressed while an omxplayer is spawned in the background:
+    press_when(statemachine, backend, lambda sm: len(sm.loading) > 0)
+
+
+def scenario_back_to_back(statemachine, backend):
+    # The next session starts as soon as the buzzer is enabled again:
+    press_when(statemachine, backend, lambda sm: True)
+
+
+def scenario_missing_file(statemachine, backend):
+    # A missing file in the idle list and a buzzer press at random times:
+    press_when(statemachine, backend,
+               lambda sm: backend.random.random() < 0.01)
+
+
+# name: [function, missing file in the list]
+SCENARIOS = {
+    'idle_rotation': [scenario_idle_rotation, False],
+    'buzzer_mid_fade': [scenario_buzzer_mid_fade, False],
+    'buzzer_while_loading': [scenario_buzzer_while_loading, False],
+    'back_to_back': [scenario_back_to_back, False],
+    'missing_file': [scenario_missing_file, True],
+}
+
+
+def run_scenario(name, options, params):
+    function, missing = SCENARIOS[name]
+    with tempfile.TemporaryDirectory(prefix='ravidplay-bench-') as dirnam:
+        sources, durations = make_videos(dirnam, missing)
+        argv = ['-verbosity=1', '-config_poll=0', '-watch=off',
+                '-metadata_index=off'] + params
+        for category in sources:
+            argv.append('-{}:'.format(category))
+            argv += sources[category]
+        backend = ravidplay.SimulationBackend(options['spawn'],
+                                              ravidplay.DEFAULT_SIM_DURATION,
+                                              options['dbus'],
+                                              options['errors'],
+                                              options['seed'], durations,
+                                              options['hangs'])
+        ravidplay.gl_metrics.reset()
+        random.seed(options['seed'])
+        statemachine = ravidplay.StateMachine(argv, backend)
+        function(statemachine, backend)
+        backend.press(ravidplay.GPIO_EXITBTN, options['seconds'], None)
+        t0 = time.monotonic()
+        statemachine.run()
+        walltime = time.monotonic() - t0
+    metrics = ravidplay.gl_metrics
+    hours = backend.clock.monotonic() / 3600
+    sessions = len([edge for edge
+                    in backend.leds[ravidplay.GPIO_TRIGGERPIN].edges
+                    if edge[1]])
+    return {
+        'simulated_seconds': backend.clock.monotonic(),
+        'wall_seconds': walltime,
+        'exitcode': statemachine.exitcode,
+        'ticks': statemachine.tick,
+        'spawns': backend.spawns,
+        'dbus_calls': backend.dbus_calls,
+        'buzzer_presses': metrics.buzzer.count,
+        'buzzer_latency_p50': metrics.buzzer.quantile(0.5),
+        'buzzer_latency_p99': metrics.buzzer.quantile(0.99),
+        'buzzer_input_p99': metrics.input_buzzer.quantile(0.99),
+        'black_gap_p50': metrics.black_gap.quantile(0.5),
+        'black_gap_p99': metrics.black_gap.quantile(0.99),
+        'black_gap_max': metrics.black_gap.max,
+        'trigger_error_p99': max(metrics.gpio_rising.quantile(0.99),
+                                 metrics.gpio_falling.quantile(0.99)),
+        'tick_overruns': metrics.tick_overrun.count,
+        'tick_overrun_p99': metrics.tick_overrun.quantile(0.99),
+        'tick_period_p99': metrics.tick_period.quantile(0.99),
+        'sessions_per_hour': sessions / hours if hours > 0 else 0.0,
+        'watchdog_recoveries': metrics.recoveries,
+    }
+
+
+def git_revision():
+    try:
+        result = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'],
+                                cwd=BENCHDIR, stdout=subprocess.PIPE,
+                                stderr=subprocess.DEVNULL)
+    except OSError:
+        return ''
+    return result.stdout.decode('utf-8').strip()
+
+
+def print_results(results, baseline=None):
+    for name, values in results['scenarios'].items():
+        print('{}:'.format(name))
+        old = {}
+        if baseline is not None:
+            old = baseline.get('scenarios', {}).get(name, {})
+        for key, value in values.items():
+            if type(value) is float:
+                line = '  {:22} {:12.4f}'.format(key, value)
+            else:
+                line = '  {:22} {:12}'.format(key, value)
+            if key in old and type(value) in (int, float) and \
+               old[key] != 0:
+                line += '  ({:+.1f}% against {})'.format(
+                            100.0 * (value - old[key]) / abs(old[key]),
+                            baseline.get('revision') or 'baseline')
+            print(line)
+
+
+def main(argv):
+    options = {'seconds': 3600.0, 'spawn': ravidplay.DEFAULT_SIM_SPAWN,
+               'dbus': ravidplay.DEFAULT_SIM_DBUS, 'errors': 0.0, 'hangs': 0.0,
+               'seed': 1, 'output': None, 'compare': None}
+    scenarios = []
+    params = [] # config parameters of ravidplay.py
+    for w in argv:
+        if w.startswith('-') and not w.startswith('--') and '=' in w:
+            params.append(w)
+            continue
+        key, _, value = w[2:].partition('=')
+        if not w.startswith('--') or value == '':
+            print('invalid parameter "{}"'.format(w))
+            return 2
+        if key == 'scenario':
+            if value not in SCENARIOS:
+                print('unknown scenario "{}", known are: {}'.format(
+                          value, ', '.join(SCENARIOS)))
+                return 2
+            scenarios.append(value)
+        elif key in ('output', 'compare'):
+            options[key] = value
+        elif key == 'seed':
+            options[key] = int(value)
+        elif key in options:
+            options[key] = float(value)
+        else:
+            print('unknown parameter "{}"'.format(w))
+            return 2
+    if len(scenarios) == 0:
+        scenarios = list(SCENARIOS)
+
+    results = {'revision': git_revision(),
+               'date': time.strftime('%Y-%m-%d %H:%M:%S'),
+               'options': {key: options[key]
+                           for key in ('seconds', 'spawn', 'dbus', 'errors',
+                                       'hangs', 'seed')},
+               'params': params,
+               'scenarios': {}}
+    for name in scenarios:
+        results['scenarios'][name] = run_scenario(name, options, params)
+
+    baseline = None
+    if options['compare'] is not None:
+        with open(options['compare'], 'r') as f:
+            baseline = json.load(f)
+    print_results(results, baseline)
+
+    output = options['output']
+    if output is None:
+        output = os.path.join(BENCHDIR, 'results', '{}-{}.json'.format(
+                                  time.strftime('%Y%m%d-%H%M%S'),
+                                  results['revision'] or 'unknown'))
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump(results, f, indent=2)
+    print('results saved in "{}"'.format(output))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv[1:]))
+#EOF
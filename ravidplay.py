@@ -31,16 +31,40 @@
 #
 
 
-# TODO:
-# - get video parameters (transparency, fade times) from cfg resp. meta files
-
 import time, random
-import io      # for command # if type(f) is io.TextIOWrapper:
+import math
+import io      # BytesIO
 import os      # getpid(): Get current process id
 import sys     # argv[], exitcode
+import copy
+import threading
+import queue
+import concurrent.futures
+import json
+import re
+import subprocess
+import struct
+import collections
+import select
+import ctypes
+import ctypes.util
+import mmap
+import shutil
+import hashlib
+import bisect
+import http.server
+import heapq
+import atexit
+import signal
 #from omxplayer.player import OMXPlayer
-import omxplayer.player
-import gpiozero
+try:
+    import omxplayer.player
+    import gpiozero
+except ImportError as e:
+    # "ravidplay.py --probe" works without the Raspberry Pi modules:
+    gl_import_error = e
+else:
+    gl_import_error = None
 
 
 
@@ -51,11 +75,33 @@ OMXINSTANCE_ERR_NO_VIDEO = -2 # No video defined for idle/applause
 OMXINSTANCE_NONE = -1 # No free omxplayer instance
 OMXINSTANCE_VIDEO1 = 0
 OMXINSTANCE_VIDEO2 = 1
+OMXINSTANCE_CNTDN = 2 # pre-armed countdown instance of cntdn_mode 'armed'
 OMXLAYER = [52, 51, 53]
 
+# Video categories as given on the command line ("-idle:", "-cntdn:", ...):
+CATEGORY_IDLE = 'idle'
+CATEGORY_CNTDN = 'cntdn'
+CATEGORY_APPL = 'appl'
+
+# GPIO pins (BCM numbering):
+GPIO_BUZZER = 17 # J8 pin 11
+GPIO_TRIGGERPIN = 7 # J8 pin 26
+GPIO_EXITBTN = 23 # J8 pin 16
+
 VID_INDEX = 0
 VID_FILENAM = 1
 
+# Files found in directories given on the command line resp. in playlists:
+VIDEO_EXTENSIONS = ('.mp4', '.m4v', '.mov', '.mkv', '.avi', '.mpg', '.mpeg',
+                    '.ts', '.h264', '.webm')
+PLAYLIST_EXTENSIONS = ('.m3u', '.m3u8')
+
+MPRIS_PLAYER_INTERFACE = 'org.mpris.MediaPlayer2.Player'
+
+# Curves of the fade envelopes (see fade_curve()):
+FADECURVES = ('linear', 'ease', 'scurve', 'equalpower')
+FADE_TABLE_SIZE = 256 # entries of the precomputed fade envelopes
+
 # states of class StateMachine:
 STATE_EXIT = 0
 STATE_ERROR = 1
@@ -63,10 +109,8 @@ STATE_PREPARE_CNTDN_VIDEO = 5
 STATE_SELECT_CNTDN_VIDEO = 7
 STATE_SELECT_APPL_VIDEO = 8
 STATE_SELECT_IDLE_VIDEO = 9
-STATE_START_IDLE1_VIDEO = 10
-STATE_PLAY_IDLE1_VIDEO = 11
-STATE_START_IDLE2_VIDEO = 20
-STATE_PLAY_IDLE2_VIDEO = 21
+STATE_START_IDLE_VIDEO = 10
+STATE_PLAY_IDLE_VIDEO = 11
 
 VERBOSE_NONE = 0
 VERBOSE_ERROR = 1
@@ -78,330 +122,3210 @@ VERBOSE_GPIO = 6
 VERBOSE_VIDEOINFO = 7
 VERBOSE_DEBUG = 8
 VERBOSE_SHOW_INSTANCES = 9
+# Categories of the JSON lines log, index VERBOSE_...:
+VERBOSE_NAMES = ('none', 'error', 'warning', 'version', 'state', 'progress',
+                 'gpio', 'videoinfo', 'debug', 'instances')
+
+
+# Global constants set by code, config file, command line parameters.
+# These are the default values by code if no config file nor cmdlin param:
+DEFAULT_VERBOSITY = VERBOSE_DEBUG
+DEFAULT_TIMESLOT = 0.02 # longest tick period while fading, debouncing etc.
+DEFAULT_TIMESLOT_IDLE = 1.0 # longest tick period during a steady playback
+TICK_MIN = 0.001 # shortest tick period, the deadlines aren't that exact
+DEFAULT_RANDOMINDEX_IDLE = 0  # -1 random selection 0 continuous selection
+DEFAULT_RANDOMINDEX_CNTDN = 0 # -1 random selection 0 continuous selection
+DEFAULT_RANDOMINDEX_APPL = 0  # -1 random selection 0 continuous selection
+DEFAULT_NO_REPEAT = 3 # random selection: videos not repeated within this window
+DEFAULT_WEIGHT = 1.0 # relative frequency of a video on random selection
+DEFAULT_POOL_SIZE = 3 # number of omxplayer instances (at least 2)
+DEFAULT_CNTDN_MODE = 'swap' # 'armed': countdown instance kept paused at 0
+DEFAULT_DEBOUNCE = 0.03 # seconds after a button edge taken for bouncing
+TRIGGER_PRIORITY = 50 # SCHED_FIFO priority of the camera trigger thread
+TRIGGER_SPIN = 0.001 # seconds spun before a trigger edge instead of sleeping
+DEFAULT_DBUS_TIMEOUT = 1.0 # seconds until a D-Bus call counts as hung, 0: off
+SPAWN_TIMEOUT = 10.0 # seconds until a respawn by load() counts as hung
+WATCHDOG_INTERVAL = 0.1 # seconds between two checks of the watchdog
+WATCHDOG_REAP = 2.0 # seconds to wait for a killed omxplayer process
+DEFAULT_RESYNC_INTERVAL = 0.3 # seconds between two D-Bus position queries
+DEFAULT_METADATA_INDEX = '' # '': ~/.cache/ravidplay.py.metadata.json, 'off'
+DEFAULT_VALIDATE_WORKERS = 4 # threads checking the video files in parallel
+DEFAULT_VALIDATE_RETRY = 30.0 # seconds until a bad video file is checked again
+DEFAULT_CONFIG_POLL = 2.0 # seconds between two checks of the config file, 0: off
+DEFAULT_WATCH = 'inotify' # watching of the video directories: 'poll', 'off'
+DEFAULT_WATCH_POLL = 5.0 # seconds between two checks of a polled directory
+DEFAULT_PREFETCH = 2 # next idle videos read into the page cache, 0: off
+DEFAULT_PIN_BUDGET = 64 # MB locked in memory for the next countdown video
+PREFETCH_REPEAT = 30.0 # seconds until the same file is prefetched again
+DEFAULT_STAGING_DIR = '' # copies of the next videos e.g. on a tmpfs, '': off
+DEFAULT_STAGING_SIZE = 128 # MB used in the staging directory at most
+STAGING_SUBDIR = 'ravidplay-staging' # owned by the StagingCache
+STAGING_STATS_LOOKUPS = 100 # lookups between two statistics lines
+DEFAULT_METRICS_FILE = '' # Prometheus text file of the metrics, '': off
+DEFAULT_METRICS_PORT = 0 # HTTP port of the metrics on localhost, 0: off
+DEFAULT_METRICS_INTERVAL = 10.0 # seconds between two writes of the text file
+DEFAULT_LOG_JSON = '' # JSON lines file of the log records, '': off
+LOG_BUFFER = 4096 # log records buffered at most, older ones are dropped
+# Simulated backend (ravidplay.py --simulate):
+DEFAULT_SIM_SPAWN = 2.5 # seconds of an omxplayer spawn on an RPi0/RPi1
+DEFAULT_SIM_DURATION = 20.0 # seconds of a video without known duration
+DEFAULT_SIM_DBUS = 0.002 # seconds of a D-Bus round trip
+DEFAULT_SIM_BUZZER = 60.0 # mean seconds between two buzzer presses, 0: none
+SIM_PRESS_TIME = 0.2 # seconds a simulated button is held down
+SIM_HANG_TIME = 3600.0 # seconds a hung simulated omxplayer doesn't answer
+VALIDATE_RETRY_MAX = 3600.0 # the retry delay doubles up to this limit
+
+DEFAULT_IDLE_FADETIME_START = 0.5 #1.75
+DEFAULT_IDLE_FADETIME_END = 0.5 #1.75
+DEFAULT_IDLE_ALPHA_START = 0
+DEFAULT_IDLE_ALPHA_PLAY = 255
+DEFAULT_IDLE_ALPHA_END = 0
+DEFAULT_CNTDN_FADETIME_START = 0.5 #1.75
+DEFAULT_CNTDN_FADETIME_END = 0.5 #1.75
+DEFAULT_CNTDN_GPIO_ON = 2.0  # time in seconds before video sequence ends
+DEFAULT_CNTDN_GPIO_OFF = 1.0 # time in seconds before video sequence ends
+DEFAULT_CNTDN_ALPHA_START = 0
+DEFAULT_CNTDN_ALPHA_PLAY = 255
+DEFAULT_CNTDN_ALPHA_END = 0
+DEFAULT_IDLE_FADECURVE = 'linear'
+DEFAULT_CNTDN_FADECURVE = 'linear'
+DEFAULT_ALPHA_STEP = 2 # smallest alpha change sent to the omxplayer
+DEFAULT_VOLUME_STEP = 0.02 # smallest volume change sent to the omxplayer
+
+
+# Upper bounds in seconds of the histogram buckets of the metrics:
+LATENCY_BUCKETS = (0.0005, 0.001, 0.002, 0.005, 0.01, 0.02, 0.05, 0.1, 0.2,
+                   0.5, 1.0, 2.0, 5.0)
+SPAWN_BUCKETS = (0.1, 0.25, 0.5, 1.0, 1.5, 2.0, 3.0, 4.0, 6.0, 10.0, 20.0)
+
+
+# Config keys: [key, type, minimum, maximum, attributes set by the key]
+# type is int, float, str or a tuple of the valid strings. Values out of
+# range are clipped. A general key sets all attributes of its group. The
+# keys are applied in this order, so the more specific keys of the
+# idle/cntdn and start/play/end hierarchy override the general ones.
+CONFIG_SCHEMA = (
+    ['verbosity', int, None, None, ['verbosity']], # see apply_verbosity()
+    ['timeslot', float, 0.001, None, ['timeslot']],
+    ['timeslot_idle', float, 0.001, None, ['timeslot_idle']],
+    ['resync_interval', float, 0.0, None, ['resync_interval']],
+    ['config_poll', float, 0.0, None, ['config_poll']],
+    ['randomindex', int, None, None, ['randomindex_idle',
+                                      'randomindex_cntdn',
+                                      'randomindex_appl']],
+    ['randomindex_idle', int, None, None, ['randomindex_idle']],
+    ['randomindex_cntdn', int, None, None, ['randomindex_cntdn']],
+    ['randomindex_appl', int, None, None, ['randomindex_appl']],
+    ['no_repeat', int, 0, None, ['no_repeat']],
+    ['weight', float, 0.0, None, ['weight']],
+    # Two instances are necessary for fading at least:
+    ['pool_size', int, 2, None, ['pool_size']],
+    ['cntdn_mode', ('swap', 'armed'), None, None, ['cntdn_mode']],
+    ['debounce', float, 0.0, None, ['debounce']],
+    ['dbus_timeout', float, 0.0, None, ['dbus_timeout']],
+    ['metadata_index', str, None, None, ['metadata_index']],
+    ['validate_workers', int, 1, None, ['validate_workers']],
+    ['validate_retry', float, 1.0, None, ['validate_retry']],
+    ['watch', ('inotify', 'poll', 'off'), None, None, ['watch']],
+    ['watch_poll', float, 0.1, None, ['watch_poll']],
+    ['prefetch', int, 0, None, ['prefetch']],
+    ['pin_budget', int, 0, None, ['pin_budget']],
+    ['staging_dir', str, None, None, ['staging_dir']],
+    ['staging_size', int, 1, None, ['staging_size']],
+    ['metrics_file', str, None, None, ['metrics_file']],
+    ['metrics_port', int, 0, 65535, ['metrics_port']],
+    ['metrics_interval', float, 0.1, None, ['metrics_interval']],
+    ['log_json', str, None, None, ['log_json']],
+    # fadetime in seconds:
+    ['fadetime', float, 0.0, None, ['fadetime_start_idle',
+                                    'fadetime_end_idle',
+                                    'fadetime_start_cntdn',
+                                    'fadetime_end_cntdn']],
+    ['fadetime_start', float, 0.0, None, ['fadetime_start_idle',
+                                          'fadetime_start_cntdn']],
+    ['fadetime_end', float, 0.0, None, ['fadetime_end_idle',
+                                        'fadetime_end_cntdn']],
+    ['fadetime_start_idle', float, 0.0, None, ['fadetime_start_idle']],
+    ['fadetime_end_idle', float, 0.0, None, ['fadetime_end_idle']],
+    ['fadetime_start_cntdn', float, 0.0, None, ['fadetime_start_cntdn']],
+    ['fadetime_end_cntdn', float, 0.0, None, ['fadetime_end_cntdn']],
+    # GPIO time in seconds:
+    ['gpio_on_cntdn', float, 0.0, None, ['gpio_on_cntdn']],
+    ['gpio_off_cntdn', float, 0.0, None, ['gpio_off_cntdn']],
+    # alpha (video transparency):
+    ['alpha', int, 0, 255, ['alpha_start_idle', 'alpha_play_idle',
+                            'alpha_end_idle', 'alpha_start_cntdn',
+                            'alpha_play_cntdn', 'alpha_end_cntdn']],
+    ['alpha_start', int, 0, 255, ['alpha_start_idle', 'alpha_start_cntdn']],
+    ['alpha_play', int, 0, 255, ['alpha_play_idle', 'alpha_play_cntdn']],
+    ['alpha_end', int, 0, 255, ['alpha_end_idle', 'alpha_end_cntdn']],
+    ['alpha_start_idle', int, 0, 255, ['alpha_start_idle']],
+    ['alpha_play_idle', int, 0, 255, ['alpha_play_idle']],
+    ['alpha_end_idle', int, 0, 255, ['alpha_end_idle']],
+    ['alpha_start_cntdn', int, 0, 255, ['alpha_start_cntdn']],
+    ['alpha_play_cntdn', int, 0, 255, ['alpha_play_cntdn']],
+    ['alpha_end_cntdn', int, 0, 255, ['alpha_end_cntdn']],
+    # fadecurve (shape of the fadings):
+    ['fadecurve', FADECURVES, None, None, ['fadecurve_idle',
+                                           'fadecurve_cntdn']],
+    ['fadecurve_idle', FADECURVES, None, None, ['fadecurve_idle']],
+    ['fadecurve_cntdn', FADECURVES, None, None, ['fadecurve_cntdn']],
+    ['alpha_step', int, 1, None, ['alpha_step']],
+    ['volume_step', float, 0.0, None, ['volume_step']],
+)
+CONFIG_KEYS = {entry[0]: entry for entry in CONFIG_SCHEMA}
+
+
+def config_value(entry, text):
+    # Convert the text of a config key into its value or None if invalid:
+    key, valuetype, minimum, maximum, attrs = entry
+    if type(valuetype) is tuple:
+        return text if text in valuetype else None
+    try:
+        value = valuetype(text)
+    except ValueError:
+        return None
+    if minimum is not None:
+        value = max(minimum, value)
+    if maximum is not None:
+        value = min(maximum, value)
+    return value
+
+
+gl_verbosity = DEFAULT_VERBOSITY
+# Does the omxplayer support org.freedesktop.DBus.Properties.GetAll?
+# None: unknown yet, True/False: found out by VideoPlayer.query_status()
+gl_getall_supported = None
+# C library for the system calls without Python binding, see libc():
+gl_libc = None
+
+
+def fade_curve(curve, x):
+    # Gain 0.0 ... 1.0 of a fading-in at the progress x = 0.0 ... 1.0.
+    # A fading-out uses the same curve with the remaining fraction as x.
+    if curve == 'ease':
+        # ease-in/out (smoothstep):
+        gain = x * x * (3 - 2 * x)
+    elif curve == 'scurve':
+        # steeper S-curve (smootherstep):
+        gain = x * x * x * (x * (6 * x - 15) + 10)
+    elif curve == 'equalpower':
+        # equal-power crossfade: sin² + cos² == 1
+        gain = math.sin(x * math.pi / 2)
+    else:
+        gain = x # linear
+    return gain
+
+
+class FadeEnvelope:
+    # Lookup table of alpha and volume values of a fading between the
+    # alpha values low (gain 0.0) and high (gain 1.0). It is computed once
+    # per video sequence instead of on each tick.
+    def __init__(self, low, high, curve, size=FADE_TABLE_SIZE):
+        self.size = size
+        self.alpha = []
+        self.volume = []
+        for i in range(size):
+            value = low + fade_curve(curve, i / (size - 1)) * (high - low)
+            self.alpha.append(int(round(value)))
+            self.volume.append(value / 255)
+
+    def at(self, x):
+        # Returns [alpha, volume] at x = 0.0 ... 1.0:
+        i = int(x * (self.size - 1) + 0.5)
+        if i < 0: i = 0
+        if i >= self.size: i = self.size - 1
+        return [self.alpha[i], self.volume[i]]
+
+
+def omxlayer(inst):
+    # Render layer of an omxplayer instance. Additional instances of a
+    # larger pool are stacked on top of the layers given in OMXLAYER:
+    if inst < len(OMXLAYER):
+        layer = OMXLAYER[inst]
+    else:
+        layer = max(OMXLAYER) + 1 + inst - len(OMXLAYER)
+    return layer
+
+class LogWriter(threading.Thread):
+    # Writes the records of print_verbose() from a ring buffer, so a slow
+    # terminal or journald pipe doesn't block the state machine. The text
+    # is formatted by this thread, not by the caller. If the buffer is full
+    # the oldest records are dropped. Optionally each record is written as
+    # a JSON line into a file, e.g. for an analysis of the timing.
+    def __init__(self, size=LOG_BUFFER):
+        super().__init__(name='LogWriter', daemon=True)
+        self.records = collections.deque(maxlen=size)
+        self.event = threading.Event()
+        self.lock = threading.Lock() # serialises the writing
+        self.dropped = 0
+        self.json_filenam = ''
+        self.json_file = None
+
+    def put(self, verbosity, txt, args, newline):
+        if len(self.records) == self.records.maxlen:
+            self.dropped += 1
+        self.records.append((time.time(), verbosity, txt, args, newline,
+                             threading.current_thread().name))
+        if not self.is_alive():
+            try:
+                self.start()
+            except RuntimeError:
+                pass # started by another thread in the meantime
+        self.event.set()
+
+    def open_json(self, filenam):
+        with self.lock:
+            if self.json_file is not None:
+                self.json_file.close()
+                self.json_file = None
+            self.json_filenam = filenam
+            if filenam == '':
+                return
+            try:
+                self.json_file = open(filenam, 'a')
+            except OSError as e:
+                self.records.append((time.time(), VERBOSE_WARNING,
+                                     'log file "{}" not opened: {}',
+                                     (filenam, e), True, self.name))
+
+    def format(self, verbosity, txt, args):
+        if len(args) > 0:
+            try:
+                txt = txt.format(*args)
+            except (IndexError, KeyError, ValueError) as e:
+                txt = '{} {} ({})'.format(txt, args, e)
+        return txt
+
+    def flush(self):
+        # Write all buffered records:
+        with self.lock:
+            text = []
+            lines = []
+            while True:
+                try:
+                    record = self.records.popleft()
+                except IndexError:
+                    break
+                when, verbosity, txt, args, newline, thread = record
+                txt = self.format(verbosity, txt, args)
+                if newline:
+                    text.append('\n')
+                if verbosity == VERBOSE_ERROR:
+                    text.append('ERROR:     ')
+                elif verbosity == VERBOSE_WARNING:
+                    text.append('Warning:   ')
+                elif verbosity == VERBOSE_SHOW_INSTANCES:
+                    text.append('SHOW_INSTANCES: ')
+                elif verbosity == VERBOSE_DEBUG:
+                    text.append('DEBUG:     ')
+                text.append(txt)
+                if self.json_file is not None and \
+                   verbosity != VERBOSE_STATE_PROGRESS:
+                    lines.append(json.dumps(
+                        {'time': round(when, 6),
+                         'category': VERBOSE_NAMES[verbosity]
+                                     if 0 <= verbosity < len(VERBOSE_NAMES)
+                                     else verbosity,
+                         'thread': thread, 'text': txt.strip()},
+                        separators=(',', ':')) + '\n')
+            if self.dropped > 0:
+                text.append('\nWarning:   {} log records dropped'.format(
+                                self.dropped))
+                self.dropped = 0
+            if len(text) > 0:
+                try:
+                    sys.stdout.write(''.join(text))
+                    sys.stdout.flush()
+                except (OSError, ValueError):
+                    pass
+            if len(lines) > 0:
+                try:
+                    self.json_file.write(''.join(lines))
+                    self.json_file.flush()
+                except OSError:
+                    pass
+
+    def run(self):
+        while True:
+            self.event.wait()
+            self.event.clear()
+            self.flush()
+
+
+# Writer of the log, the buffered records are written at the exit as well:
+gl_log = LogWriter()
+atexit.register(gl_log.flush)
+
+
+def print_verbose(txt, verbosity, *args, newline=True):
+    # txt is formatted with the args by the LogWriter. Disabled levels
+    # cost the comparison only:
+    if gl_verbosity >= verbosity:
+        gl_log.put(verbosity, txt, args, newline)
+
+def libc():
+    # The C library loaded by ctypes or None if it isn't available:
+    global gl_libc
+    if gl_libc is None:
+        try:
+            gl_libc = ctypes.CDLL(ctypes.util.find_library('c'),
+                                  use_errno=True)
+            gl_libc.mmap.restype = ctypes.c_void_p
+            gl_libc.mmap.argtypes = [ctypes.c_void_p, ctypes.c_size_t,
+                                     ctypes.c_int, ctypes.c_int,
+                                     ctypes.c_int, ctypes.c_long]
+            gl_libc.munmap.argtypes = [ctypes.c_void_p, ctypes.c_size_t]
+            gl_libc.mlock.argtypes = [ctypes.c_void_p, ctypes.c_size_t]
+            gl_libc.munlock.argtypes = [ctypes.c_void_p, ctypes.c_size_t]
+            gl_libc.mincore.argtypes = [ctypes.c_void_p, ctypes.c_size_t,
+                                        ctypes.POINTER(ctypes.c_ubyte)]
+        except Exception:
+            gl_libc = False
+    return gl_libc if gl_libc else None
+
+
+class Config():
+    def print_properties(self, caption=None, verbosity=VERBOSE_DEBUG):
+        if caption is not None:
+            print_verbose('==== {} ====', verbosity, caption)
+        print_verbose('gl_verbosity: {}', verbosity, gl_verbosity)
+        print_verbose('', VERBOSE_DEBUG)
+        print_verbose('timeslot=={}', verbosity, self.timeslot)
+        print_verbose('timeslot_idle=={}', verbosity, self.timeslot_idle)
+        print_verbose('resync_interval=={}', verbosity, self.resync_interval)
+        print_verbose('config_poll=={}', verbosity, self.config_poll)
+        print_verbose('randomindex_idle=={}', verbosity, self.randomindex_idle)
+        print_verbose('randomindex_cntdn=={}', verbosity,
+                      self.randomindex_cntdn)
+        print_verbose('randomindex_appl=={}', verbosity, self.randomindex_appl)
+        print_verbose('no_repeat=={}', verbosity, self.no_repeat)
+        print_verbose('weight=={}', verbosity, self.weight)
+        print_verbose('pool_size=={}', verbosity, self.pool_size)
+        print_verbose('cntdn_mode=={}', verbosity, self.cntdn_mode)
+        print_verbose('debounce=={}', verbosity, self.debounce)
+        print_verbose('dbus_timeout=={}', verbosity, self.dbus_timeout)
+        print_verbose('metadata_index=={}', verbosity, self.metadata_index)
+        print_verbose('validate_workers=={}', verbosity, self.validate_workers)
+        print_verbose('validate_retry=={}', verbosity, self.validate_retry)
+        print_verbose('watch=={}', verbosity, self.watch)
+        print_verbose('watch_poll=={}', verbosity, self.watch_poll)
+        print_verbose('prefetch=={}', verbosity, self.prefetch)
+        print_verbose('pin_budget=={}', verbosity, self.pin_budget)
+        print_verbose('staging_dir=={}', verbosity, self.staging_dir)
+        print_verbose('staging_size=={}', verbosity, self.staging_size)
+        print_verbose('metrics_file=={}', verbosity, self.metrics_file)
+        print_verbose('metrics_port=={}', verbosity, self.metrics_port)
+        print_verbose('metrics_interval=={}', verbosity, self.metrics_interval)
+        print_verbose('log_json=={}', verbosity, self.log_json)
+        print_verbose('', VERBOSE_DEBUG)
+        print_verbose('fadetime_start_idle=={}', verbosity,
+                      self.fadetime_start_idle)
+        print_verbose('fadetime_end_idle=={}', verbosity,
+                      self.fadetime_end_idle)
+        print_verbose('fadetime_start_cntdn=={}', verbosity,
+                      self.fadetime_start_cntdn)
+        print_verbose('fadetime_end_cntdn=={}', verbosity,
+                      self.fadetime_end_cntdn)
+        print_verbose('gpio_on_cntdn=={}', verbosity, self.gpio_on_cntdn)
+        print_verbose('gpio_off_cntdn=={}', verbosity, self.gpio_off_cntdn)
+        print_verbose('', VERBOSE_DEBUG)
+        print_verbose('alpha_start_idle=={}', verbosity, self.alpha_start_idle)
+        print_verbose('alpha_play_idle=={}', verbosity, self.alpha_play_idle)
+        print_verbose('alpha_end_idle=={}', verbosity, self.alpha_end_idle)
+        print_verbose('alpha_start_cntdn=={}', verbosity,
+                      self.alpha_start_cntdn)
+        print_verbose('alpha_play_cntdn=={}', verbosity, self.alpha_play_cntdn)
+        print_verbose('alpha_end_cntdn=={}', verbosity, self.alpha_end_cntdn)
+        print_verbose('', VERBOSE_DEBUG)
+        print_verbose('fadecurve_idle=={}', verbosity, self.fadecurve_idle)
+        print_verbose('fadecurve_cntdn=={}', verbosity, self.fadecurve_cntdn)
+        print_verbose('alpha_step=={}', verbosity, self.alpha_step)
+        print_verbose('volume_step=={}', verbosity, self.volume_step)
+        print_verbose('\n', VERBOSE_DEBUG)
+
+    def set_code_defaults(self):
+        # Set the config parameters from code defaults
+        # given in global constants DEFAULT_...
+        self.verbosity = DEFAULT_VERBOSITY
+        self.timeslot = DEFAULT_TIMESLOT
+        self.timeslot_idle = DEFAULT_TIMESLOT_IDLE
+        self.resync_interval = DEFAULT_RESYNC_INTERVAL
+        self.config_poll = DEFAULT_CONFIG_POLL
+        self.randomindex_idle = DEFAULT_RANDOMINDEX_IDLE
+        self.randomindex_cntdn = DEFAULT_RANDOMINDEX_CNTDN
+        self.randomindex_appl = DEFAULT_RANDOMINDEX_APPL
+        self.no_repeat = DEFAULT_NO_REPEAT
+        self.weight = DEFAULT_WEIGHT
+        self.pool_size = DEFAULT_POOL_SIZE
+        self.cntdn_mode = DEFAULT_CNTDN_MODE
+        self.debounce = DEFAULT_DEBOUNCE
+        self.dbus_timeout = DEFAULT_DBUS_TIMEOUT
+        self.metadata_index = DEFAULT_METADATA_INDEX
+        self.validate_workers = DEFAULT_VALIDATE_WORKERS
+        self.validate_retry = DEFAULT_VALIDATE_RETRY
+        self.watch = DEFAULT_WATCH
+        self.watch_poll = DEFAULT_WATCH_POLL
+        self.prefetch = DEFAULT_PREFETCH
+        self.pin_budget = DEFAULT_PIN_BUDGET
+        self.staging_dir = DEFAULT_STAGING_DIR
+        self.staging_size = DEFAULT_STAGING_SIZE
+        self.metrics_file = DEFAULT_METRICS_FILE
+        self.metrics_port = DEFAULT_METRICS_PORT
+        self.metrics_interval = DEFAULT_METRICS_INTERVAL
+        self.log_json = DEFAULT_LOG_JSON
+
+        self.fadetime_start_idle = DEFAULT_IDLE_FADETIME_START
+        self.fadetime_end_idle = DEFAULT_IDLE_FADETIME_END
+        self.alpha_start_idle = DEFAULT_IDLE_ALPHA_START
+        self.alpha_play_idle = DEFAULT_IDLE_ALPHA_PLAY
+        self.alpha_end_idle = DEFAULT_IDLE_ALPHA_END
+        self.fadetime_start_cntdn = DEFAULT_CNTDN_FADETIME_START
+        self.fadetime_end_cntdn = DEFAULT_CNTDN_FADETIME_END
+        self.gpio_on_cntdn = DEFAULT_CNTDN_GPIO_ON
+        self.gpio_off_cntdn = DEFAULT_CNTDN_GPIO_OFF
+        self.alpha_start_cntdn = DEFAULT_CNTDN_ALPHA_START
+        self.alpha_play_cntdn = DEFAULT_CNTDN_ALPHA_PLAY
+        self.alpha_end_cntdn = DEFAULT_CNTDN_ALPHA_END
+        self.fadecurve_idle = DEFAULT_IDLE_FADECURVE
+        self.fadecurve_cntdn = DEFAULT_CNTDN_FADECURVE
+        self.alpha_step = DEFAULT_ALPHA_STEP
+        self.volume_step = DEFAULT_VOLUME_STEP
+        
+    def config_filenam(self):
+        # Common config file at ~/.config:
+        filenam = os.path.realpath(sys.argv[0])
+        confnam = os.path.basename(filenam)  + '.conf'
+        confdir = os.path.join(os.path.expanduser('~'), '.config')
+        return os.path.join(confdir, confnam)
+
+    def parse_cfg(self, filenam=None):
+        # Read the config keys of a file resp. of the command line (None)
+        # in a single pass. Returns a dict of the valid values:
+        if filenam is None:
+            # Check the command line parameters for config stuff:
+            lines = [w[1:] for w in self.argv if w[0] == '-']
+        else:
+            try:
+                with open(filenam, 'r') as f:
+                    lines = f.readlines()
+            except Exception:
+                lines = []
+        values = {}
+        for lin in lines:
+            lin = lin.split('#')[0] # Remove comments marked with #
+            lin = [w.strip() for w in lin.split('=')]
+            if len(lin) < 2:
+                continue
+            entry = CONFIG_KEYS.get(lin[0])
+            if entry is None:
+                continue # unknown key
+            value = config_value(entry, lin[1])
+            if value is None:
+                print_verbose('invalid value "{}" of config key "{}" '
+                              'ignored', VERBOSE_WARNING, lin[1], lin[0])
+            else:
+                values[lin[0]] = value
+        return values
+
+    def read_from_cfg(self, filenam=None, local=False):
+        # filenam None: command line, '': common config file
+        # local == True: filenam is the config file of a single video.
+        # Global settings like the verbosity aren't touched then.
+        if filenam == '':
+            filenam = self.config_filenam()
+        values = self.parse_cfg(filenam)
+        for key, valuetype, minimum, maximum, attrs in CONFIG_SCHEMA:
+            if key in values:
+                if key == 'verbosity' and local:
+                    continue
+                for attr in attrs:
+                    setattr(self, attr, values[key])
+
+    def set_common_config(self, argv=None, apply=True):
+        # argv: command line parameters, sys.argv[1:] if not given
+        # apply == False: the global verbosity is set later by the main
+        # thread, e.g. on a reload (see apply_verbosity())
+        self.argv = sys.argv[1:] if argv is None else list(argv)
+        self.set_code_defaults() # Take hard-coded default parameters
+        self.read_from_cfg('')   # Overwrite parameters with common config file
+        self.read_from_cfg(None) # Overwrite parameters with command line
+        if apply:
+            self.apply_verbosity()
+
+    def apply_verbosity(self):
+        global gl_verbosity
+        gl_verbosity = self.verbosity
+
+    def metadata_filenam(self):
+        # Filename of the persistent metadata index or None if disabled:
+        if self.metadata_index == 'off':
+            filenam = None
+        elif self.metadata_index == '':
+            filenam = os.path.realpath(sys.argv[0])
+            cachenam = os.path.basename(filenam) + '.metadata.json'
+            cachedir = os.path.join(os.path.expanduser('~'), '.cache')
+            filenam = os.path.join(cachedir, cachenam)
+        else:
+            filenam = os.path.expanduser(self.metadata_index)
+        return filenam
+
+    def playlist_sources(self):
+        # Take the video sources (files, directories, M3U playlists) given
+        # by command line parameters, introduced by a category parameter
+        # like "-idle:", "-cntdn:", "-appl:". They are expanded later by the
+        # PlaylistLoader:
+        sources = {CATEGORY_IDLE: [], CATEGORY_CNTDN: [], CATEGORY_APPL: []}
+        category = None
+        for w in self.argv:
+            if w[0] == '-':
+                category = w[1:-1] if w[-1] == ':' else None
+                if category not in sources:
+                    category = None
+            elif category is not None:
+                sources[category].append(w)
+        return sources
+
+
+# Container formats recognised by probe_video():
+MP4_TOPLEVEL_BOXES = (b'ftyp', b'moov', b'mdat', b'free', b'skip', b'wide')
+EBML_MAGIC = b'\x1a\x45\xdf\xa3'
+MKV_SEGMENT = 0x18538067
+MKV_SEEKHEAD = 0x114D9B74
+MKV_SEEK = 0x4DBB
+MKV_SEEKID = 0x53AB
+MKV_SEEKPOSITION = 0x53AC
+MKV_INFO = 0x1549A966
+MKV_TIMECODESCALE = 0x2AD7B1
+MKV_DURATION = 0x4489
+MKV_TRACKS = 0x1654AE6B
+MKV_TRACKENTRY = 0xAE
+MKV_TRACKTYPE = 0x83
+MKV_CODECID = 0x86
+MKV_VIDEO = 0xE0
+MKV_PIXELWIDTH = 0xB0
+MKV_PIXELHEIGHT = 0xBA
+MKV_CLUSTER = 0x1F43B675
+PROBE_MAX_HEADER = 16 * 1024 * 1024 # largest moov box resp. MKV element read
+
+
+def mp4_boxes(data, start=0, end=None):
+    # Iterate over the boxes in data[start:end] as [type, payload start,
+    # payload end]:
+    if end is None:
+        end = len(data)
+    pos = start
+    while pos + 8 <= end:
+        size = int.from_bytes(data[pos:pos + 4], 'big')
+        boxtype = data[pos + 4:pos + 8]
+        header = 8
+        if size == 1:
+            size = int.from_bytes(data[pos + 8:pos + 16], 'big')
+            header = 16
+        elif size == 0:
+            size = end - pos
+        if size < header or pos + size > end:
+            raise ValueError('corrupt box "{}"'.format(
+                             boxtype.decode('latin-1')))
+        yield [boxtype, pos + header, pos + size]
+        pos += size
+
+
+def probe_mp4(f, filesize):
+    # Find the moov box on top level and read only this one:
+    moov = None
+    pos = 0
+    while pos + 8 <= filesize:
+        f.seek(pos)
+        header = f.read(16)
+        size = int.from_bytes(header[0:4], 'big')
+        boxtype = header[4:8]
+        hdrsize = 8
+        if size == 1:
+            size = int.from_bytes(header[8:16], 'big')
+            hdrsize = 16
+        elif size == 0:
+            size = filesize - pos
+        if size < hdrsize:
+            raise ValueError('corrupt top level box')
+        if boxtype == b'moov':
+            if size > PROBE_MAX_HEADER:
+                raise ValueError('moov box too large')
+            f.seek(pos + hdrsize)
+            moov = f.read(size - hdrsize)
+            break
+        pos += size
+    if moov is None:
+        raise ValueError('no moov box')
+
+    props = {'container': 'mp4'}
+    duration = None
+    fragmented = False
+    for boxtype, start, end in mp4_boxes(moov):
+        if boxtype == b'mvhd':
+            if moov[start] == 1: # version 1: 64 bit times
+                timescale = int.from_bytes(moov[start + 20:start + 24], 'big')
+                duration = int.from_bytes(moov[start + 24:start + 32], 'big')
+            else:
+                timescale = int.from_bytes(moov[start + 12:start + 16], 'big')
+                duration = int.from_bytes(moov[start + 16:start + 20], 'big')
+            if timescale <= 0:
+                raise ValueError('invalid timescale')
+            props['duration'] = duration / timescale
+        elif boxtype == b'mvex':
+            fragmented = True
+        elif boxtype == b'trak':
+            track = mp4_track(moov, start, end)
+            if track is not None and 'width' not in props:
+                props.update(track)
+    if duration is None:
+        raise ValueError('no mvhd box')
+    if 'width' not in props:
+        raise ValueError('no video track')
+    if props['duration'] <= 0 and not fragmented:
+        raise ValueError('zero-length video')
+    return props
+
+
+def mp4_track(data, start, end):
+    # Returns width, height and codec of a video track or None:
+    track = {}
+    handler = None
+    for boxtype, bstart, bend in mp4_boxes(data, start, end):
+        if boxtype == b'tkhd':
+            # width and height are the last two 16.16 fixed-point values:
+            track['width'] = int.from_bytes(data[bend - 8:bend - 4],
+                                            'big') >> 16
+            track['height'] = int.from_bytes(data[bend - 4:bend],
+                                             'big') >> 16
+        elif boxtype == b'mdia':
+            for mtype, mstart, mend in mp4_boxes(data, bstart, bend):
+                if mtype == b'hdlr':
+                    handler = data[mstart + 8:mstart + 12]
+                elif mtype == b'minf':
+                    codec = mp4_codec(data, mstart, mend)
+                    if codec is not None:
+                        track['codec'] = codec
+    if handler != b'vide':
+        return None
+    return track
+
+
+def mp4_codec(data, start, end):
+    # minf -> stbl -> stsd -> first sample entry:
+    for boxtype, bstart, bend in mp4_boxes(data, start, end):
+        if boxtype == b'stbl':
+            for stype, sstart, send in mp4_boxes(data, bstart, bend):
+                if stype == b'stsd' and send - sstart >= 16:
+                    return data[sstart + 12:sstart + 16].decode('latin-1')
+    return None
+
+
+def ebml_vint(f, keep_marker=False):
+    # Read a variable-size integer of EBML (element ID or data size).
+    # Returns [value, length] or [None, 0] at end of file. A data size
+    # with all bits set (unknown size) is returned as -1.
+    first = f.read(1)
+    if not first:
+        return [None, 0]
+    first = first[0]
+    length = 1
+    mask = 0x80
+    while length <= 8 and not first & mask:
+        mask >>= 1
+        length += 1
+    if length > 8:
+        raise ValueError('invalid EBML number')
+    value = first if keep_marker else first & (mask - 1)
+    rest = f.read(length - 1)
+    if len(rest) != length - 1:
+        raise ValueError('truncated EBML number')
+    for b in rest:
+        value = (value << 8) | b
+    if not keep_marker and value == (1 << (7 * length)) - 1:
+        value = -1
+    return [value, length]
+
+
+def ebml_elements(f, end):
+    # Iterate over the elements from the current position up to end as
+    # [id, data start, data size]. The caller may seek within the data.
+    pos = f.tell()
+    while pos < end:
+        f.seek(pos)
+        elem_id, idlen = ebml_vint(f, keep_marker=True)
+        if elem_id is None:
+            break
+        size, sizelen = ebml_vint(f)
+        start = pos + idlen + sizelen
+        yield [elem_id, start, size]
+        if size < 0:
+            break # unknown size: the rest can't be skipped
+        pos = start + size
+
+
+def ebml_read(f, start, size):
+    if size < 0 or size > PROBE_MAX_HEADER:
+        raise ValueError('EBML element too large')
+    f.seek(start)
+    data = f.read(size)
+    if len(data) != size:
+        raise ValueError('truncated EBML element')
+    return data
+
+
+def probe_mkv(f, filesize):
+    props = {'container': 'mkv'}
+    f.seek(0)
+    segment = None
+    for elem_id, start, size in ebml_elements(f, filesize):
+        if elem_id == MKV_SEGMENT:
+            segment = [start, filesize if size < 0 else start + size]
+            break
+    if segment is None:
+        raise ValueError('no Segment')
+
+    info = None
+    tracks = None
+    seek = {}
+    f.seek(segment[0])
+    for elem_id, start, size in ebml_elements(f, segment[1]):
+        if elem_id == MKV_INFO:
+            info = [start, size]
+        elif elem_id == MKV_TRACKS:
+            tracks = [start, size]
+        elif elem_id == MKV_SEEKHEAD:
+            seek.update(mkv_seekhead(ebml_read(f, start, size)))
+        elif elem_id == MKV_CLUSTER:
+            break # the headers are in front of the clusters
+        if info is not None and tracks is not None:
+            break
+    # Info and Tracks may be stored behind the clusters:
+    for elem_id in (MKV_INFO, MKV_TRACKS):
+        if elem_id in seek and \
+           (elem_id == MKV_INFO and info is None or
+            elem_id == MKV_TRACKS and tracks is None):
+            f.seek(segment[0] + seek[elem_id])
+            for found_id, start, size in ebml_elements(f, segment[1]):
+                if found_id == elem_id:
+                    if elem_id == MKV_INFO:
+                        info = [start, size]
+                    else:
+                        tracks = [start, size]
+                break
+    if info is None:
+        raise ValueError('no Segment Info')
+    if tracks is None:
+        raise ValueError('no Tracks')
+
+    timecodescale = 1000000 # ns
+    duration = None
+    data = ebml_read(f, info[0], info[1])
+    for elem_id, value in ebml_children(data):
+        if elem_id == MKV_TIMECODESCALE:
+            timecodescale = int.from_bytes(value, 'big')
+        elif elem_id == MKV_DURATION:
+            duration = struct.unpack('>f' if len(value) == 4 else '>d',
+                                     value)[0]
+    if duration is not None:
+        # The Duration is optional, e.g. left out by live recordings:
+        if duration <= 0:
+            raise ValueError('zero-length video')
+        props['duration'] = duration * timecodescale / 1e9
+
+    data = ebml_read(f, tracks[0], tracks[1])
+    for elem_id, entry in ebml_children(data):
+        if elem_id != MKV_TRACKENTRY:
+            continue
+        track = {}
+        tracktype = None
+        for entry_id, value in ebml_children(entry):
+            if entry_id == MKV_TRACKTYPE:
+                tracktype = int.from_bytes(value, 'big')
+            elif entry_id == MKV_CODECID:
+                track['codec'] = value.decode('latin-1').rstrip('\0')
+            elif entry_id == MKV_VIDEO:
+                for video_id, dim in ebml_children(value):
+                    if video_id == MKV_PIXELWIDTH:
+                        track['width'] = int.from_bytes(dim, 'big')
+                    elif video_id == MKV_PIXELHEIGHT:
+                        track['height'] = int.from_bytes(dim, 'big')
+        if tracktype == 1: # video track
+            props.update(track)
+            break
+    if 'width' not in props:
+        raise ValueError('no video track')
+    return props
+
+
+def ebml_children(data):
+    # Iterate over the child elements of a master element read into data
+    # as [id, payload bytes]:
+    f = io.BytesIO(data)
+    for elem_id, start, size in ebml_elements(f, len(data)):
+        if size < 0:
+            break
+        yield [elem_id, data[start:start + size]]
+
+
+def mkv_seekhead(data):
+    # Returns the positions of the top level elements {id: position}:
+    seek = {}
+    for elem_id, entry in ebml_children(data):
+        if elem_id == MKV_SEEK:
+            seek_id = None
+            position = None
+            for entry_id, value in ebml_children(entry):
+                if entry_id == MKV_SEEKID:
+                    seek_id = int.from_bytes(value, 'big')
+                elif entry_id == MKV_SEEKPOSITION:
+                    position = int.from_bytes(value, 'big')
+            if seek_id is not None and position is not None:
+                seek[seek_id] = position
+    return seek
+
+
+def probe_video(filenam):
+    # Examine a video file by reading only the headers of the container:
+    # moov/mvhd/tkhd of MP4/MOV resp. Segment Info/Tracks of Matroska.
+    # Returns a dict of container, duration (in seconds, missing if not
+    # given), width, height and codec, a dict {'error': <text>} for an empty or undecodable
+    # file, or None if the container format is unknown.
+    try:
+        filesize = os.path.getsize(filenam)
+        if filesize == 0:
+            return {'error': 'empty file'}
+        with open(filenam, 'rb') as f:
+            magic = f.read(8)
+            try:
+                if magic[0:4] == EBML_MAGIC:
+                    props = probe_mkv(f, filesize)
+                elif magic[4:8] in MP4_TOPLEVEL_BOXES:
+                    props = probe_mp4(f, filesize)
+                else:
+                    props = None # unknown container
+            except (ValueError, IndexError, struct.error) as e:
+                props = {'error': str(e)}
+    except OSError as e:
+        props = {'error': e.strerror or str(e)}
+    return props
+
+
+def probe_main(sources):
+    # Command line: ravidplay.py --probe files...
+    exitcode = 0
+    for filenam in playlist_videos(sources):
+        t0 = time.monotonic()
+        props = probe_video(filenam)
+        ms = (time.monotonic() - t0) * 1000
+        if props is None:
+            print('{}: unknown container format'.format(filenam))
+        elif 'error' in props:
+            print('{}: ERROR: {}'.format(filenam, props['error']))
+            exitcode = 1
+        else:
+            print('{}: {} duration={} {}x{} codec={} ({:.1f}ms)'.format(
+                  filenam, props['container'],
+                  '{:.3f}s'.format(props['duration'])
+                  if 'duration' in props else 'unknown',
+                  props.get('width', 0), props.get('height', 0),
+                  props.get('codec', '?'), ms))
+    return exitcode
+
+
+def probe_omxplayer_info(filenam, timeout=10):
+    # Examine a video file by "omxplayer --info" without starting the
+    # playback. Returns a dict of duration, width, height and codec or
+    # None if the file couldn't be examined.
+    try:
+        result = subprocess.run(['omxplayer', '--info', filenam],
+                                stdout=subprocess.PIPE,
+                                stderr=subprocess.STDOUT,
+                                timeout=timeout)
+    except Exception:
+        return None
+    info = result.stdout.decode('utf-8', 'replace')
+    match = re.search(r'Duration: (\d+):(\d+):(\d+(?:\.\d+)?)', info)
+    if match is None:
+        return None
+    props = {'duration': int(match.group(1)) * 3600
+                         + int(match.group(2)) * 60
+                         + float(match.group(3))}
+    match = re.search(r'Video: (\w+).*?, (\d+)x(\d+)', info)
+    if match is not None:
+        props['codec'] = match.group(1)
+        props['width'] = int(match.group(2))
+        props['height'] = int(match.group(3))
+    return props
+
+
+class MetadataIndex(threading.Thread):
+    # Persistent index of video metadata (duration, resolution, codec)
+    # shared across runs. The entries are keyed by realpath and are valid
+    # as long as size and mtime of the file are unchanged. Missing or
+    # outdated entries are filled in by this worker thread. The lookups by
+    # the state machine don't touch the file system at all.
+    def __init__(self, filenam):
+        super().__init__(name='MetadataIndex', daemon=True)
+        self.filenam = filenam
+        self.entries = {}
+        self.lock = threading.Lock()
+        self.requests = queue.Queue()
+        self.dirty = False
+        self.probed = 0 # number of files examined during this run
+        self.read()
+
+    def read(self):
+        try:
+            with open(self.filenam, 'r') as f:
+                entries = json.load(f)
+        except Exception:
+            entries = {}
+        if type(entries) is dict:
+            self.entries = entries
+
+    def write(self):
+        if not self.dirty:
+            return
+        with self.lock:
+            data = json.dumps(self.entries, indent=1, sort_keys=True)
+            self.dirty = False
+        try:
+            os.makedirs(os.path.dirname(self.filenam), exist_ok=True)
+            tmpnam = self.filenam + '.tmp'
+            with open(tmpnam, 'w') as f:
+                f.write(data)
+            os.replace(tmpnam, self.filenam)
+        except Exception as e:
+            print_verbose('metadata index "{}" not written: {}',
+                          VERBOSE_WARNING, self.filenam, e)
+
+    def get(self, filenam):
+        with self.lock:
+            return self.entries.get(filenam)
+
+    def duration(self, filenam):
+        entry = self.get(filenam)
+        if entry is not None and entry.get('duration', 0) > 0:
+            return entry['duration']
+        return None
+
+    def update(self, filenams):
+        # Check the given files in the background:
+        for filenam in filenams:
+            self.requests.put(['check', filenam, None])
+
+    def learn(self, filenam, **props):
+        # Store properties found out by other means, e.g. by the omxplayer:
+        self.requests.put(['learn', filenam, props])
+
+    def stop(self):
+        self.requests.put(None)
+        self.join()
+        self.write()
+
+    def check(self, filenam, props=None):
+        try:
+            st = os.stat(filenam)
+        except OSError:
+            with self.lock:
+                if self.entries.pop(filenam, None) is not None:
+                    self.dirty = True
+            return
+        entry = self.get(filenam)
+        if entry is None or \
+           entry.get('size') != st.st_size or \
+           entry.get('mtime') != st.st_mtime:
+            # new or changed file:
+            entry = {'size': st.st_size, 'mtime': st.st_mtime}
+            if props is None:
+                # The container headers are examined much faster than by
+                # the omxplayer which is the fallback for other formats:
+                props = probe_video(filenam)
+                if props is None:
+                    props = probe_omxplayer_info(filenam)
+                elif 'error' in props:
+                    props = {'undecodable': props['error']}
+                self.probed += 1
+                if props is None:
+                    props = {} # not examinable
+        elif props is None:
+            return # entry is up to date
+        entry = dict(entry)
+        entry.update(props)
+        if 'duration' in props and 'undecodable' not in props:
+            entry.pop('undecodable', None)
+        with self.lock:
+            self.entries[filenam] = entry
+            self.dirty = True
+
+    def run(self):
+        while True:
+            try:
+                req = self.requests.get(timeout=5.0)
+            except queue.Empty:
+                # Save the changes when there is nothing to do:
+                self.write()
+                continue
+            if req is None:
+                break
+            cmd, filenam, props = req
+            try:
+                self.check(filenam, props)
+            except Exception as e:
+                print_verbose('metadata of "{}" not examined: {}',
+                              VERBOSE_WARNING, filenam, e)
+
+
+class SidecarCache:
+    # Parameters of single videos (fade times, alpha, GPIO timing) given by
+    # a config file with the same filename as the video plus '.conf', e.g.
+    # "idle1.mp4.conf". The files use the same keys as the common config
+    # file. They are parsed in the background and kept in memory together
+    # with their mtime, so a lookup at a transition is just a dict hit.
+    # Changes are made under a lock by the background threads only.
+    def __init__(self, cfg):
+        self.cfg = cfg # common config as base of the video parameters
+        self.entries = {} # video filenam: [mtime of sidecar, Config]
+        self.weights = {} # video filenam: weight if not the common one
+        self.version = 0 # incremented on every change of self.weights
+        self.lock = threading.Lock()
+
+    def sidecar_filenam(self, filenam):
+        return filenam + '.conf'
+
+    def parse(self, filenam, base):
+        cfg = copy.copy(base)
+        cfg.read_from_cfg(self.sidecar_filenam(filenam), local=True)
+        print_verbose('video parameters read from "{}"', VERBOSE_VIDEOINFO,
+                      self.sidecar_filenam(filenam))
+        return cfg
+
+    def refresh(self, filenam):
+        # Check the sidecar file of a video and parse it if it has been
+        # changed. This touches the file system: don't call it in the loop!
+        with self.lock:
+            try:
+                mtime = os.stat(self.sidecar_filenam(filenam)).st_mtime
+            except OSError:
+                # no sidecar file (anymore):
+                self.entries.pop(filenam, None)
+                self.set_weight(filenam, self.cfg.weight)
+                return
+            entry = self.entries.get(filenam)
+            if entry is None or entry[0] != mtime:
+                cfg = self.parse(filenam, self.cfg)
+                self.entries[filenam] = [mtime, cfg]
+                self.set_weight(filenam, cfg.weight)
+
+    def rebase(self, cfg):
+        # Take a new common config and read all sidecar files again. The
+        # new dicts are swapped in at once, the state machine meanwhile
+        # still looks up the old ones:
+        with self.lock:
+            entries = {}
+            weights = {}
+            for filenam in self.entries:
+                try:
+                    mtime = os.stat(self.sidecar_filenam(filenam)).st_mtime
+                except OSError:
+                    continue
+                entries[filenam] = [mtime, self.parse(filenam, cfg)]
+                if entries[filenam][1].weight != cfg.weight:
+                    weights[filenam] = entries[filenam][1].weight
+            self.cfg = cfg
+            self.entries = entries
+            self.weights = weights
+            self.version += 1
+
+    def set_weight(self, filenam, weight):
+        # Called under the lock:
+        if weight != self.cfg.weight:
+            if self.weights.get(filenam) != weight:
+                self.weights[filenam] = weight
+                self.version += 1
+        elif self.weights.pop(filenam, None) is not None:
+            self.version += 1
+
+    def weight(self, filenam):
+        return self.weights.get(filenam, self.cfg.weight)
+
+    def get(self, filenam):
+        # Config of the given video or None if there is no sidecar file:
+        entry = self.entries.get(filenam)
+        return None if entry is None else entry[1]
+
+
+def video_file_error(filenam):
+    # Catch some well-known error conditions of a video file before the
+    # long-lasting omxplayer init. Returns 0 if the file can be read:
+    if filenam is None:
+        # No video filename was given, e.g. due to empty video list:
+        ret = 10
+    elif not os.path.exists(filenam):
+        # Given filename doesn't exist:
+        ret = 11
+    elif os.path.isdir(filenam):
+    #elif os.path.ismount(filenam) or os.path.isdir(filenam):
+        # Given filename is a (mount point) directory:
+        ret = 12
+    elif not os.access(filenam, os.R_OK):
+        # Read permission denied to filenam:
+        ret = 13
+    else:
+        ret = 0
+    return ret
+
+
+# Reasons of video files being skipped (see video_file_error() and
+# VideoPlayer.load_omxplayer()):
+VIDEO_FILE_ERRORS = {1: 'omxplayer initialisation failed',
+                     2: 'video duration not available',
+                     11: 'file not found',
+                     12: 'file is a directory',
+                     13: 'read permission denied',
+                     14: 'not a playable video'}
+LOAD_ERRORS = (1, 2) # the omxplayer failed on a file which looked playable
+
+
+def playlist_files(source, visited, on_directory=None):
+    # Expand a video source to the realpaths of its video files. The source
+    # may be a video file, an M3U/M3U8 playlist or a directory which is
+    # searched recursively. This is a generator, so even a huge library is
+    # never held as a whole. visited keeps the directories and playlists
+    # already expanded and stops loops by symbolic links. on_directory is
+    # called for every directory before it is read.
+    path = os.path.realpath(os.path.expanduser(source))
+    if os.path.isdir(path):
+        if path in visited:
+            return
+        visited.add(path)
+        if on_directory is not None:
+            on_directory(path)
+        stack = [path]
+        while len(stack) > 0:
+            dirnam = stack.pop()
+            try:
+                with os.scandir(dirnam) as it:
+                    entries = sorted(it, key=lambda entry: entry.name)
+            except OSError as e:
+                print_verbose('directory "{}" not readable: {}',
+                              VERBOSE_WARNING, dirnam, e)
+                continue
+            subdirs = []
+            for entry in entries:
+                if entry.name[0] == '.':
+                    continue # hidden file or directory
+                try:
+                    if entry.is_dir(): # follows symbolic links
+                        realdir = os.path.realpath(entry.path)
+                        if realdir not in visited:
+                            visited.add(realdir)
+                            if on_directory is not None:
+                                on_directory(realdir)
+                            subdirs.append(realdir)
+                    elif os.path.splitext(entry.name)[1].lower() \
+                         in VIDEO_EXTENSIONS and entry.is_file():
+                        if entry.is_symlink():
+                            yield os.path.realpath(entry.path)
+                        else:
+                            yield entry.path # dirnam is a realpath already
+                except OSError:
+                    continue
+            # Depth first in alphabetical order:
+            stack.extend(reversed(subdirs))
+    elif os.path.splitext(path)[1].lower() in PLAYLIST_EXTENSIONS:
+        if path in visited:
+            return
+        visited.add(path)
+        # M3U files are latin-1 traditionally, M3U8 files are UTF-8:
+        encoding = 'utf-8' if path.lower().endswith('.m3u8') else 'latin-1'
+        try:
+            with open(path, 'r', encoding=encoding, errors='replace') as f:
+                for lin in f:
+                    lin = lin.strip().lstrip('\ufeff')
+                    if lin == '' or lin[0] == '#':
+                        continue # empty line, comment or #EXTINF etc.
+                    if '://' in lin:
+                        print_verbose('"{}": stream "{}" skipped',
+                                      VERBOSE_WARNING, path, lin)
+                        continue
+                    # Relative paths are relative to the playlist:
+                    yield from playlist_files(
+                                os.path.join(os.path.dirname(path), lin),
+                                visited, on_directory)
+        except OSError as e:
+            print_verbose('playlist "{}" not readable: {}', VERBOSE_WARNING,
+                          path, e)
+    else:
+        # A single file is taken as it is, even if it doesn't exist.
+        # It is checked when it is loaded:
+        yield path
+
+
+def playlist_videos(sources, visited=None, on_directory=None):
+    # Expand all sources of a category, see playlist_files():
+    if visited is None:
+        visited = set()
+    for source in sources:
+        yield from playlist_files(source, visited, on_directory)
+
+
+class VideoValidator:
+    # Checks the video files of the playlists in parallel on a thread pool
+    # before they are selected. Missing, unreadable and undecodable files
+    # are kept in a negative cache and checked again after a delay which
+    # doubles on every failure. The state machine only looks up the result.
+    def __init__(self, metadata=None,
+                 workers=DEFAULT_VALIDATE_WORKERS,
+                 retry=DEFAULT_VALIDATE_RETRY):
+        self.metadata = metadata
+        self.retry = retry
+        self.executor = concurrent.futures.ThreadPoolExecutor(
+                                        max_workers=workers)
+        self.lock = threading.Lock()
+        self.good = set()
+        self.bad = {} # filenam: [ret, number of failures, time of next check]
+        self.pending = set() # files being checked
+        self.owners = {} # filenam: [Playlist, ...]
+        self.retries = [] # heap of [time of next check, filenam]
+
+    def submit(self, filenam, playlist=None):
+        with self.lock:
+            owners = self.owners.setdefault(filenam, [])
+            if playlist is not None and playlist not in owners:
+                owners.append(playlist)
+            if filenam in self.pending:
+                return
+            self.pending.add(filenam)
+        self.executor.submit(self.validate, filenam)
+
+    def check(self, filenam):
+        # Returns 0 if the file seems to be playable, otherwise the error
+        # code of video_file_error() resp. 14 for an undecodable file:
+        ret = video_file_error(filenam)
+        if ret != 0:
+            return ret
+        entry = None
+        if self.metadata is not None:
+            # Take the result of the metadata index if it is up to date:
+            st = os.stat(filenam)
+            entry = self.metadata.get(filenam)
+            if entry is not None and \
+               (entry.get('size') != st.st_size or
+                entry.get('mtime') != st.st_mtime):
+                entry = None
+        if entry is None:
+            props = probe_video(filenam)
+            if props is not None and 'error' in props:
+                return 14
+        elif entry.get('undecodable') is not None:
+            return 14
+        return 0
+
+    def validate(self, filenam):
+        try:
+            ret = self.check(filenam)
+        except Exception:
+            ret = 13
+        if ret == 0:
+            with self.lock:
+                self.good.add(filenam)
+                self.bad.pop(filenam, None)
+                self.pending.discard(filenam)
+                owners = list(self.owners.get(filenam, []))
+            for playlist in owners:
+                playlist.touch(filenam)
+                playlist.playable.set()
+        else:
+            self.failed(filenam, ret)
+
+    def failed(self, filenam, ret):
+        # Put a file into the negative cache, e.g. after a failed load:
+        with self.lock:
+            failures = self.bad[filenam][1] + 1 if filenam in self.bad else 1
+            delay = min(self.retry * 2 ** (failures - 1), VALIDATE_RETRY_MAX)
+            self.bad[filenam] = [ret, failures, time.monotonic() + delay]
+            heapq.heappush(self.retries, [self.bad[filenam][2], filenam])
+            self.good.discard(filenam)
+            self.pending.discard(filenam)
+            owners = list(self.owners.get(filenam, []))
+        for playlist in owners:
+            playlist.touch(filenam)
+        print_verbose('video "{}" skipped: {} (next check in {:.0f}s)',
+                      VERBOSE_WARNING, filenam,
+                      VIDEO_FILE_ERRORS.get(ret, ret), delay)
+
+    def forget(self, filenam):
+        # The file has been removed from the playlists:
+        with self.lock:
+            self.good.discard(filenam)
+            self.bad.pop(filenam, None)
+            self.owners.pop(filenam, None)
+
+    def is_good(self, filenam):
+        return filenam in self.good
+
+    def retry_due(self):
+        # Called by the state machine: a bad file whose delay has expired
+        # is checked again in the background. A file the omxplayer failed
+        # on passes that check anyway, so it is simply tried again. Its
+        # entry is kept to double the delay on the next failure:
+        now = time.monotonic()
+        while len(self.retries) > 0 and self.retries[0][0] <= now:
+            with self.lock:
+                due, filenam = heapq.heappop(self.retries)
+                entry = self.bad.get(filenam)
+                if entry is None or entry[2] != due:
+                    continue # good or removed meanwhile, or failed again
+                if entry[0] in LOAD_ERRORS:
+                    self.good.add(filenam)
+                    owners = list(self.owners.get(filenam, []))
+                else:
+                    entry[2] = now + self.retry # until checked
+                    heapq.heappush(self.retries, [entry[2], filenam])
+                    owners = None
+            if owners is None:
+                self.submit(filenam)
+            else:
+                for playlist in owners:
+                    playlist.touch(filenam)
+
+    def load_failed(self, filenam):
+        # True if only the omxplayer failed on the file, maybe temporarily:
+        entry = self.bad.get(filenam)
+        return entry is not None and entry[0] in LOAD_ERRORS
+
+    def busy(self):
+        # True while any file is being checked:
+        return len(self.pending) > 0
+
+    def stop(self):
+        self.executor.shutdown(wait=False)
+
+
+class Playlist:
+    # Video files of a category. The list is filled by the PlaylistLoader
+    # in the background and kept up to date by the DirectoryWatcher. It
+    # never shrinks: a removed video leaves a gap (None) which is filled by
+    # the next new one. So len() and the indices of the VideoSelector stay
+    # valid meanwhile. Files given twice (e.g. by a symbolic link) are
+    # taken only once. The indices of added, removed and (in)validated
+    # videos are passed to the VideoSelectors listening.
+    def __init__(self, category):
+        self.category = category
+        self.files = []
+        self.index = {} # filenam: index in self.files
+        self.gaps = [] # indices of removed videos
+        self.visited = set() # directories and playlists already expanded
+        self.lock = threading.Lock()
+        self.complete = False
+        self.ready = threading.Event() # first video found or list complete
+        self.playable = threading.Event() # first video validated as good
+        self.listeners = [] # deque of changed indices per VideoSelector
+
+    def __len__(self):
+        return len(self.files)
+
+    def __getitem__(self, index):
+        return self.files[index]
+
+    def count(self):
+        # Number of videos without the gaps:
+        return len(self.index)
+
+    def listen(self):
+        changes = collections.deque()
+        with self.lock:
+            self.listeners.append(changes)
+        return changes
+
+    def changed(self, i):
+        for changes in self.listeners:
+            changes.append(i)
+
+    def touch(self, filenam):
+        # The validation of a video has changed:
+        i = self.index.get(filenam)
+        if i is not None:
+            self.changed(i)
+
+    def add(self, filenam):
+        with self.lock:
+            if filenam in self.index:
+                return False
+            if len(self.gaps) > 0:
+                i = self.gaps.pop()
+                self.files[i] = filenam
+            else:
+                i = len(self.files)
+                self.files.append(filenam)
+            self.index[filenam] = i
+            self.changed(i)
+        self.ready.set()
+        return True
+
+    def remove(self, filenam):
+        with self.lock:
+            i = self.index.pop(filenam, None)
+            if i is None:
+                return False
+            self.files[i] = None
+            self.gaps.append(i)
+            self.changed(i)
+        return True
+
+    def finish(self):
+        self.complete = True
+        self.ready.set()
+
+    def wait_ready(self, timeout=None):
+        return self.ready.wait(timeout)
+
+
+def alias_table(weights):
+    # Walker's alias method (Vose's variant): Returns [prob, alias] for
+    # drawing index i with a probability proportional to weights[i] by
+    # one random index and one random number.
+    n = len(weights)
+    total = sum(weights)
+    if total <= 0:
+        return [[1.0] * n, list(range(n))] # uniform distribution
+    prob = [w * n / total for w in weights]
+    alias = list(range(n))
+    small = [i for i in range(n) if prob[i] < 1.0]
+    large = [i for i in range(n) if prob[i] >= 1.0]
+    while len(small) > 0 and len(large) > 0:
+        i = small.pop()
+        j = large.pop()
+        alias[i] = j
+        prob[j] += prob[i] - 1.0
+        if prob[j] < 1.0:
+            small.append(j)
+        else:
+            large.append(j)
+    for i in small + large:
+        prob[i] = 1.0 # rounding errors
+    return [prob, alias]
+
+
+class VideoSelector:
+    # Selects the videos of a category in O(1) per draw:
+    # - continuous selection (randomindex >= 0) in the order of the list
+    # - random selection (randomindex < 0) by a shuffle bag: every video is
+    #   played once per round. The last no_repeat videos are held back at
+    #   the start of a new round until they have left that window, so none
+    #   of them is taken again as long as there are more videos.
+    # - weighted random selection by the alias method as soon as any video
+    #   has a weight of its own (key "weight" in its sidecar file). A recent
+    #   video drawn is rejected, after a few tries the draw is made among
+    #   the other videos directly.
+    # Only playable videos are drawn: the gaps of the playlist and the files
+    # the validator has found bad are dropped from the bag and the table as
+    # soon as the playlist reports them.
+    # The next videos can be looked at by peek() without taking them, and
+    # a taken video can be put back in front by undo().
+    def __init__(self, playlist, randomindex=0, no_repeat=DEFAULT_NO_REPEAT,
+                 sidecars=None, playable=None):
+        self.playlist = playlist
+        self.randomindex = randomindex
+        self.sidecars = sidecars
+        self.playable = playable # True for a validated filenam
+        self.upcoming = collections.deque() # indices drawn but not taken
+        self.recent = collections.deque(maxlen=no_repeat)
+        self.no_repeat = no_repeat
+        self.eligible = set() # indices of the playable videos
+        self.bag = [] # indices left in the current round of the shuffle bag
+        self.bagpos = {} # index: position in self.bag
+        self.held = set() # indices left in the current round but recent
+        self.members = [] # indices of the weighted selection
+        self.weights = [] # weights of self.members
+        self.table = None # [prob, alias] of the weighted selection
+        self.table_key = None # weight version of table
+        self.changes = playlist.listen()
+        for index in range(len(playlist)):
+            self.update(index)
+
+    def update(self, index):
+        # Take a change of the playlist resp. of the validation of a video:
+        filenam = self.playlist[index]
+        good = filenam is not None and \
+               (self.playable is None or self.playable(filenam))
+        self.table = None # the weight may have changed, too
+        if good == (index in self.eligible):
+            return
+        if good:
+            self.eligible.add(index)
+            if index in self.recent:
+                self.held.add(index)
+            else:
+                self.put(index)
+        else:
+            self.eligible.discard(index)
+            self.held.discard(index)
+            self.take(index)
+
+    def apply(self):
+        if len(self.changes) == 0:
+            return
+        while len(self.changes) > 0:
+            self.update(self.changes.popleft())
+        self.upcoming = collections.deque(index for index in self.upcoming
+                                          if index in self.eligible)
+
+    def put(self, index):
+        if index not in self.bagpos:
+            self.bagpos[index] = len(self.bag)
+            self.bag.append(index)
+
+    def take(self, index):
+        pos = self.bagpos.pop(index, None)
+        if pos is not None:
+            last = self.bag.pop()
+            if last != index:
+                self.bag[pos] = last
+                self.bagpos[last] = pos
+
+    def oldest(self, indices):
+        # The one of the given indices whose last play is the longest ago.
+        # An index not played recently comes first, the last video played
+        # comes only if there is no other:
+        last = {}
+        for pos, index in enumerate(self.recent):
+            last[index] = pos
+        best = None
+        for index in indices:
+            pos = last.get(index, -1)
+            if best is None or pos < best[0]:
+                best = [pos, index]
+        return best[1]
+
+    def draw_continuous(self, length):
+        for tries in range(length):
+            index = self.randomindex
+            if index >= length:
+                index = 0
+            self.randomindex = index + 1
+            if index in self.eligible:
+                return index
+        return -1
+
+    def draw_shuffled(self):
+        if len(self.bag) == 0 and len(self.held) == 0:
+            # next round:
+            recent = set(self.recent)
+            for index in self.eligible:
+                if index in recent:
+                    self.held.add(index)
+                else:
+                    self.put(index)
+        if len(self.bag) > 0:
+            index = self.bag[random.randrange(len(self.bag))]
+            self.take(index)
+        else:
+            # not more videos than no_repeat: round robin
+            index = self.oldest(self.eligible)
+            self.held.discard(index)
+        return index
+
+    def draw_weighted(self):
+        if self.table is None or self.table_key != self.sidecars.version:
+            # Rebuild the table in O(n) only when the videos or the weights
+            # have changed:
+            self.members = list(self.eligible)
+            self.weights = [self.sidecars.weight(self.playlist[index])
+                            for index in self.members]
+            self.table = alias_table(self.weights)
+            self.table_key = self.sidecars.version
+        prob, alias = self.table
+        for tries in range(8):
+            i = random.randrange(len(prob))
+            index = self.members[i if random.random() < prob[i] else alias[i]]
+            if index not in self.recent:
+                return index
+        # Mostly recent videos drawn: draw among the others (weight 0 never)
+        recent = set(self.recent)
+        uniform = sum(self.weights) <= 0
+        drawable = [i for i in range(len(self.members))
+                    if uniform or self.weights[i] > 0]
+        others = [i for i in drawable if self.members[i] not in recent]
+        if len(others) == 0:
+            # not more videos than no_repeat:
+            return self.oldest(set(self.members[i] for i in drawable))
+        weights = None if uniform else [self.weights[i] for i in others]
+        return self.members[random.choices(others, weights)[0]]
+
+    def draw(self):
+        self.apply()
+        if len(self.eligible) == 0:
+            return -1
+        if self.randomindex >= 0:
+            index = self.draw_continuous(len(self.playlist))
+        elif self.sidecars is not None and len(self.sidecars.weights) > 0:
+            index = self.draw_weighted()
+        else:
+            index = self.draw_shuffled()
+        if self.no_repeat > 0:
+            evicted = self.recent[0] \
+                      if len(self.recent) == self.no_repeat else -1
+            self.recent.append(index)
+            if evicted in self.held and evicted not in self.recent:
+                # left the window: back into the current round
+                self.held.discard(evicted)
+                self.put(evicted)
+        return index
+
+    def video(self, index):
+        if index < 0:
+            return [-1, None]
+        return [index, self.playlist[index]]
+
+    def next(self):
+        # Take the next video as [index, filenam]:
+        self.apply()
+        if len(self.upcoming) > 0:
+            index = self.upcoming.popleft()
+        else:
+            index = self.draw()
+        return self.video(index)
+
+    def peek(self, count=1):
+        # The next count videos without taking them:
+        self.apply()
+        while len(self.upcoming) < count:
+            index = self.draw()
+            if index < 0:
+                break
+            self.upcoming.append(index)
+        return [self.video(self.upcoming[i])
+                for i in range(min(count, len(self.upcoming)))]
+
+    def undo(self, index):
+        # Put a taken video back to be the next one:
+        if index >= 0 and index in self.eligible:
+            self.upcoming.appendleft(index)
+
+
+class PlaylistLoader(threading.Thread):
+    # Expands the video sources of all categories in the background. The
+    # categories are served round robin: every playlist gets its first
+    # videos immediately even if another one is a huge directory tree.
+    # New videos are passed to the sidecar cache and the metadata index.
+    def __init__(self, playlists, sources, sidecars=None, metadata=None,
+                 validator=None, watcher=None):
+        super().__init__(name='PlaylistLoader', daemon=True)
+        self.playlists = playlists # [Playlist, ...]
+        self.sources = sources # {category: [source, ...]}
+        self.sidecars = sidecars
+        self.metadata = metadata
+        self.validator = validator
+        self.watcher = watcher # DirectoryWatcher of the directories read
+        self.known = set() # videos of all categories
+
+    def videos(self, playlist):
+        on_directory = None
+        if self.watcher is not None:
+            on_directory = lambda dirnam: self.watcher.watch(dirnam, playlist)
+        return playlist_videos(self.sources[playlist.category],
+                               playlist.visited, on_directory)
+
+    def run(self):
+        pending = [[playlist, self.videos(playlist)]
+                   for playlist in self.playlists]
+        while len(pending) > 0:
+            for item in list(pending):
+                playlist, files = item
+                try:
+                    filenam = next(files)
+                except StopIteration:
+                    filenam = None
+                except Exception as e:
+                    print_verbose('{} videos not completely read: {}',
+                                  VERBOSE_WARNING, playlist.category, e)
+                    filenam = None
+                if filenam is None:
+                    playlist.finish()
+                    pending.remove(item)
+                    print_verbose('{} {} videos found', VERBOSE_VIDEOINFO,
+                                  playlist.count(), playlist.category)
+                    continue
+                if playlist.add(filenam) and self.validator is not None:
+                    self.validator.submit(filenam, playlist)
+                if filenam not in self.known:
+                    self.known.add(filenam)
+                    if self.sidecars is not None:
+                        self.sidecars.refresh(filenam)
+                    if self.metadata is not None:
+                        self.metadata.update([filenam])
+
+
+# inotify(7) events:
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_ISDIR = 0x40000000
+INOTIFY_MASK = IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | \
+               IN_DELETE | IN_DELETE_SELF | IN_ONLYDIR
+INOTIFY_EVENT = struct.Struct('iIII') # wd, mask, cookie, len (+ name)
+
+
+class DirectoryWatcher(threading.Thread):
+    # Keeps the playlists up to date while running: video files copied into,
+    # removed from or renamed in the directories given on the command line
+    # are added to resp. removed from the playlists one by one. The caches
+    # of the validator, the sidecar files and the metadata index are
+    # updated for these files only. On Linux the directories are watched by
+    # inotify. Otherwise, or if no more inotify watches are available, the
+    # mtime of the directories is polled and only a changed directory is
+    # read again.
+    def __init__(self, validator=None, sidecars=None, metadata=None,
+                 mode=DEFAULT_WATCH, interval=DEFAULT_WATCH_POLL):
+        super().__init__(name='DirectoryWatcher', daemon=True)
+        self.validator = validator
+        self.sidecars = sidecars
+        self.metadata = metadata
+        self.interval = interval
+        self.lock = threading.Lock()
+        self.owners = {} # dirnam: [Playlist, ...]
+        self.wds = {} # inotify watch descriptor: dirnam
+        self.dirwds = {} # dirnam: inotify watch descriptor
+        self.polled = {} # dirnam: [mtime, {entry name: is directory}]
+        self.stopped = threading.Event()
+        self.libc = None
+        self.fd = -1
+        if mode == 'inotify':
+            self.init_inotify()
+
+    def init_inotify(self):
+        try:
+            fd = libc().inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        except Exception:
+            fd = -1 # no Linux
+        if fd < 0:
+            print_verbose('inotify not available: polling the video '
+                          'directories',
+                          VERBOSE_WARNING)
+        else:
+            self.libc = libc()
+            self.fd = fd
+
+    def watch(self, dirnam, playlist):
+        # Called for every directory read by the PlaylistLoader:
+        with self.lock:
+            owners = self.owners.setdefault(dirnam, [])
+            if playlist in owners:
+                return
+            owners.append(playlist)
+            if len(owners) > 1:
+                return # already watched for another category
+            if self.fd >= 0:
+                wd = self.libc.inotify_add_watch(self.fd,
+                                                 os.fsencode(dirnam),
+                                                 INOTIFY_MASK)
+                if wd >= 0:
+                    self.wds[wd] = dirnam
+                    self.dirwds[dirnam] = wd
+                    return
+                print_verbose('inotify watch of "{}" failed ({}): polling '
+                              'it', VERBOSE_WARNING, dirnam,
+                              os.strerror(ctypes.get_errno()))
+        self.polled[dirnam] = self.dir_state(dirnam)
+
+    def dir_state(self, dirnam):
+        # [mtime, {entry name: is directory}] of a polled directory:
+        entries = {}
+        try:
+            mtime = os.stat(dirnam).st_mtime
+            with os.scandir(dirnam) as it:
+                for entry in it:
+                    if entry.name[0] != '.':
+                        entries[entry.name] = entry.is_dir()
+        except OSError:
+            mtime = None
+        return [mtime, entries]
+
+    def dir_owners(self, dirnam):
+        with self.lock:
+            return list(self.owners.get(dirnam, []))
+
+    def add_video(self, filenam, playlist, changed=True):
+        if playlist.add(filenam):
+            print_verbose('{} video "{}" added', VERBOSE_VIDEOINFO,
+                          playlist.category, filenam)
+        elif not changed:
+            return
+        # A new or rewritten file is checked again:
+        if self.validator is not None:
+            self.validator.submit(filenam, playlist)
+        if self.sidecars is not None:
+            self.sidecars.refresh(filenam)
+        if self.metadata is not None:
+            self.metadata.update([filenam])
+
+    def remove_video(self, filenam, playlist):
+        if playlist.remove(filenam):
+            print_verbose('{} video "{}" removed', VERBOSE_VIDEOINFO,
+                          playlist.category, filenam)
+        if self.validator is not None:
+            self.validator.forget(filenam)
+        if self.sidecars is not None:
+            self.sidecars.refresh(filenam)
+        if self.metadata is not None:
+            self.metadata.update([filenam]) # drops the entry
+
+    def file_added(self, path, dirnam, changed=True):
+        if path.endswith('.conf'):
+            # sidecar file of a video:
+            if self.sidecars is not None:
+                self.sidecars.refresh(path[:-len('.conf')])
+            return
+        if os.path.splitext(path)[1].lower() not in VIDEO_EXTENSIONS:
+            return
+        filenam = os.path.realpath(path)
+        for playlist in self.dir_owners(dirnam):
+            self.add_video(filenam, playlist, changed)
+
+    def file_removed(self, path, dirnam):
+        # The target of a removed symbolic link isn't known anymore. Such a
+        # video is skipped by the validator when it's selected next time.
+        if path.endswith('.conf'):
+            if self.sidecars is not None:
+                self.sidecars.refresh(path[:-len('.conf')])
+            return
+        for playlist in self.dir_owners(dirnam):
+            if path in playlist.index:
+                self.remove_video(path, playlist)
+
+    def dir_added(self, path, dirnam):
+        # Read a new directory (and watch it and its subdirectories):
+        for playlist in self.dir_owners(dirnam):
+            on_directory = lambda d, playlist=playlist: self.watch(d, playlist)
+            for filenam in playlist_files(path, playlist.visited,
+                                          on_directory):
+                self.add_video(filenam, playlist)
+
+    def dir_removed(self, path):
+        prefix = path + os.sep
+        playlists = []
+        with self.lock:
+            dirnams = [d for d in self.owners
+                       if d == path or d.startswith(prefix)]
+            for dirnam in dirnams:
+                for playlist in self.owners.pop(dirnam):
+                    playlist.visited.discard(dirnam)
+                    if playlist not in playlists:
+                        playlists.append(playlist)
+                wd = self.dirwds.pop(dirnam, None)
+                if wd is not None:
+                    self.wds.pop(wd, None)
+                    self.libc.inotify_rm_watch(self.fd, wd)
+                self.polled.pop(dirnam, None)
+        for playlist in playlists:
+            for filenam in [f for f in list(playlist.index)
+                            if f.startswith(prefix)]:
+                self.remove_video(filenam, playlist)
+
+    def read_events(self):
+        try:
+            data = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return
+        pos = 0
+        while pos + INOTIFY_EVENT.size <= len(data):
+            wd, mask, cookie, length = INOTIFY_EVENT.unpack_from(data, pos)
+            pos += INOTIFY_EVENT.size
+            name = os.fsdecode(data[pos:pos + length].rstrip(b'\0'))
+            pos += length
+            if mask & IN_Q_OVERFLOW:
+                self.resync()
+                continue
+            with self.lock:
+                dirnam = self.wds.get(wd)
+                if dirnam is not None and mask & IN_IGNORED:
+                    # The watch has been removed by the kernel:
+                    self.wds.pop(wd)
+                    self.dirwds.pop(dirnam, None)
+                    dirnam = None
+            if dirnam is None:
+                continue
+            if mask & IN_DELETE_SELF:
+                self.dir_removed(dirnam)
+                continue
+            if name == '' or name[0] == '.':
+                continue
+            path = os.path.join(dirnam, name)
+            if mask & IN_ISDIR:
+                if mask & (IN_CREATE | IN_MOVED_TO):
+                    self.dir_added(path, dirnam)
+                elif mask & (IN_DELETE | IN_MOVED_FROM):
+                    self.dir_removed(path)
+            elif mask & (IN_CLOSE_WRITE | IN_MOVED_TO):
+                # A created file is taken when it has been written completely
+                self.file_added(path, dirnam)
+            elif mask & IN_CREATE:
+                if os.path.islink(path): # no IN_CLOSE_WRITE for links
+                    self.file_added(path, dirnam)
+            elif mask & (IN_DELETE | IN_MOVED_FROM):
+                self.file_removed(path, dirnam)
+
+    def resync(self):
+        # inotify events have been lost: check all watched directories
+        print_verbose('inotify queue overflow: checking the video '
+                      'directories', VERBOSE_WARNING)
+        with self.lock:
+            dirnams = list(self.owners)
+        for dirnam in dirnams:
+            for playlist in self.dir_owners(dirnam):
+                for filenam in [f for f in list(playlist.index)
+                                if os.path.dirname(f) == dirnam]:
+                    if not os.path.exists(filenam):
+                        self.remove_video(filenam, playlist)
+            for name, isdir in self.dir_state(dirnam)[1].items():
+                if not isdir:
+                    self.file_added(os.path.join(dirnam, name), dirnam,
+                                    changed=False)
+
+    def poll_dirs(self):
+        for dirnam in list(self.polled):
+            state = self.polled.get(dirnam)
+            if state is None:
+                continue # removed meanwhile
+            try:
+                mtime = os.stat(dirnam).st_mtime
+            except OSError:
+                self.dir_removed(dirnam)
+                continue
+            if mtime == state[0]:
+                continue
+            newstate = self.dir_state(dirnam)
+            self.polled[dirnam] = newstate
+            old = state[1]
+            new = newstate[1]
+            for name, isdir in old.items():
+                if new.get(name) != isdir:
+                    path = os.path.join(dirnam, name)
+                    if isdir:
+                        self.dir_removed(path)
+                    else:
+                        self.file_removed(path, dirnam)
+            for name, isdir in new.items():
+                if old.get(name) != isdir:
+                    path = os.path.join(dirnam, name)
+                    if isdir:
+                        self.dir_added(os.path.realpath(path), dirnam)
+                    else:
+                        self.file_added(path, dirnam)
+
+    def run(self):
+        while not self.stopped.is_set():
+            if self.fd >= 0:
+                ready = select.select([self.fd], [], [], self.interval)[0]
+                if len(ready) > 0:
+                    self.read_events()
+            else:
+                self.stopped.wait(self.interval)
+            self.poll_dirs()
+
+    def stop(self):
+        self.stopped.set()
+
+
+class PageCachePrefetcher(threading.Thread):
+    # Reads the next videos into the page cache in the background, so the
+    # omxplayer init doesn't wait for the SD card resp. USB stick:
+    # - the next idle videos by posix_fadvise(POSIX_FADV_WILLNEED)
+    # - the next countdown video is needed at once when the buzzer is
+    #   pressed. It is mapped and locked into memory by mmap() and mlock()
+    #   as far as the memory budget allows.
+    # The residency of a file in the page cache is reported by mincore().
+    # It is measured on this thread when a file is pinned, the state
+    # machine only looks up the result.
+    def __init__(self):
+        super().__init__(name='PageCachePrefetcher', daemon=True)
+        self.requests = queue.Queue()
+        self.prefetched = {} # filenam: time of the last prefetch
+        self.pinned = {} # filenam: [address, length] of the locked mapping
+        self.resident = {} # filenam: [bytes in the page cache, size]
+        self.mlock_failed = False
+
+    def prefetch(self, filenams):
+        self.requests.put(['prefetch', filenams, None])
+
+    def pin(self, filenams, budget):
+        # Keep only the given files locked in memory (budget in bytes):
+        self.requests.put(['pin', filenams, budget])
+
+    def stop(self):
+        self.requests.put(None)
+        self.join()
+        for filenam in list(self.pinned):
+            self.unpin(filenam)
+
+    def willneed(self, filenam):
+        now = time.monotonic()
+        if now - self.prefetched.get(filenam, -PREFETCH_REPEAT) \
+           < PREFETCH_REPEAT:
+            return # still in the page cache most likely
+        self.prefetched[filenam] = now
+        fd = os.open(filenam, os.O_RDONLY)
+        try:
+            os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_WILLNEED)
+        finally:
+            os.close(fd)
+
+    def map_file(self, filenam, length=None):
+        # Map a file (its first length bytes) read-only. Returns
+        # [address, length] or None:
+        fd = os.open(filenam, os.O_RDONLY)
+        try:
+            size = os.fstat(fd).st_size
+            if length is None or length > size:
+                length = size
+            if length <= 0:
+                return None
+            addr = libc().mmap(None, length, mmap.PROT_READ,
+                               mmap.MAP_SHARED, fd, 0)
+        finally:
+            os.close(fd) # the mapping keeps the file open
+        if addr is None or addr == ctypes.c_void_p(-1).value:
+            return None
+        return [addr, length]
+
+    def pin_file(self, filenam, budget):
+        if filenam in self.pinned:
+            return
+        # Lock the beginning of the video if it's larger than the budget:
+        length = budget - sum(m[1] for m in self.pinned.values())
+        length -= length % mmap.PAGESIZE
+        if length <= 0:
+            return
+        mapping = self.map_file(filenam, length)
+        if mapping is None:
+            return
+        if libc().mlock(mapping[0], mapping[1]) != 0:
+            # e.g. due to "ulimit -l". Prefetching is the best we can do:
+            if not self.mlock_failed:
+                print_verbose('mlock of "{}" failed ({}): prefetching '
+                              'only', VERBOSE_WARNING, filenam,
+                              os.strerror(ctypes.get_errno()))
+                self.mlock_failed = True
+            libc().munmap(mapping[0], mapping[1])
+            self.willneed(filenam)
+            return
+        self.pinned[filenam] = mapping
+        self.resident[filenam] = self.residency(filenam)
+        resident, size = self.resident[filenam]
+        print_verbose('countdown video "{}" locked in memory: {:.1f} of '
+                      '{:.1f} MB resident', VERBOSE_VIDEOINFO, filenam,
+                      resident / 1048576, size / 1048576)
+
+    def unpin(self, filenam):
+        addr, length = self.pinned.pop(filenam)
+        self.resident.pop(filenam, None)
+        libc().munlock(addr, length)
+        libc().munmap(addr, length)
+
+    def residency(self, filenam):
+        # [bytes in the page cache, size] of a file by mincore():
+        size = os.stat(filenam).st_size
+        mapping = self.pinned.get(filenam)
+        temporary = mapping is None
+        if temporary:
+            mapping = self.map_file(filenam)
+            if mapping is None:
+                return [0, size]
+        addr, length = mapping
+        pages = (length + mmap.PAGESIZE - 1) // mmap.PAGESIZE
+        vec = (ctypes.c_ubyte * pages)()
+        try:
+            if libc().mincore(addr, length, vec) != 0:
+                return [0, size]
+        finally:
+            if temporary:
+                libc().munmap(addr, length)
+        resident = sum(v & 1 for v in vec) * mmap.PAGESIZE
+        return [min(resident, size), size]
+
+    def run(self):
+        if libc() is None or not hasattr(os, 'posix_fadvise'):
+            return # no Linux: nothing to do
+        while True:
+            req = self.requests.get()
+            if req is None:
+                break
+            cmd, filenams, budget = req
+            try:
+                if cmd == 'prefetch':
+                    for filenam in filenams:
+                        self.willneed(filenam)
+                elif cmd == 'pin':
+                    for filenam in list(self.pinned):
+                        if filenam not in filenams:
+                            self.unpin(filenam)
+                    for filenam in filenams:
+                        self.pin_file(filenam, budget)
+            except Exception as e:
+                print_verbose('prefetching of {} failed: {}', VERBOSE_WARNING,
+                              filenams, e)
+
+
+class StagingCache(threading.Thread):
+    # Copies of the next videos in a fast directory, e.g. a tmpfs like
+    # /dev/shm, for videos on a NAS or a slow USB stick. The copies are
+    # made in the background into a subdirectory of their own and verified
+    # by size and mtime of the source, again by the PlayerLoader right
+    # before a copy is played. If the size limit is reached, the least
+    # recently used copies are removed except the pinned countdown videos.
+    # The state machine only looks up the staged path of a video.
+    def __init__(self, dirnam, size):
+        super().__init__(name='StagingCache', daemon=True)
+        self.dirnam = os.path.join(dirnam, STAGING_SUBDIR)
+        self.size = size # bytes
+        self.requests = queue.Queue()
+        self.lock = threading.Lock()
+        # filenam: [staged path, size, mtime_ns] in LRU order:
+        self.entries = collections.OrderedDict()
+        self.pinned = set()
+        self.used = 0
+        self.hits = 0
+        self.misses = 0
+        self.copies = 0
+        self.bytes_copied = 0
+        self.evictions = 0
+        self.stale = 0
+        # Remove the copies of a former run. An OSError is raised if the
+        # directory isn't usable:
+        os.makedirs(self.dirnam, exist_ok=True)
+        with os.scandir(self.dirnam) as it:
+            for entry in it:
+                if entry.name.startswith('ravidplay-') and entry.is_file():
+                    try:
+                        os.remove(entry.path)
+                    except OSError:
+                        pass
+
+    def staged_filenam(self, filenam):
+        # The extension is kept for the omxplayer:
+        digest = hashlib.sha1(os.fsencode(filenam)).hexdigest()[:16]
+        return os.path.join(self.dirnam, 'ravidplay-{}{}'.format(
+                                digest, os.path.splitext(filenam)[1]))
+
+    def lookup(self, filenam):
+        # Path to be played instead of filenam: the copy or filenam itself
+        with self.lock:
+            entry = self.entries.get(filenam)
+            if entry is None:
+                self.misses += 1
+                return filenam
+            self.entries.move_to_end(filenam)
+            self.hits += 1
+            return entry[0]
+
+    def verify(self, filenam, path):
+        # Called by the PlayerLoader: the source may have been changed since
+        # it was staged. Returns the path to be played:
+        try:
+            st = os.stat(filenam)
+        except OSError:
+            st = None
+        with self.lock:
+            entry = self.entries.get(filenam)
+        if entry is not None and entry[0] == path and st is not None and \
+           entry[1] == st.st_size and entry[2] == st.st_mtime_ns:
+            return path
+        self.remove(filenam)
+        self.stale += 1
+        print_verbose('staged copy of "{}" is out of date', VERBOSE_VIDEOINFO,
+                      filenam)
+        return filenam
+
+    def stage(self, filenams, pinned):
+        # Copy the next videos. Only the given pinned ones stay pinned:
+        self.requests.put([filenams, pinned])
+
+    def stats(self):
+        total = self.hits + self.misses
+        return 'staging cache: {} hits, {} misses ({:.0f}% hits), ' \
+               '{} copies with {:.1f} MB, {} evictions, {} stale, {:.1f} of ' \
+               '{:.1f} MB used'.format(self.hits, self.misses,
+                                100.0 * self.hits / total if total else 0.0,
+                                self.copies, self.bytes_copied / 1048576,
+                                self.evictions, self.stale,
+                                self.used / 1048576,
+                                self.size / 1048576)
+
+    def stop(self):
+        self.requests.put(None)
+        self.join()
+
+    def remove(self, filenam):
+        # A playing omxplayer keeps a removed copy open until it ends.
+        with self.lock:
+            entry = self.entries.pop(filenam, None)
+            if entry is None:
+                return
+            self.used -= entry[1]
+        try:
+            os.remove(entry[0])
+        except OSError:
+            pass
+
+    def make_room(self, size):
+        while self.used + size > self.size:
+            with self.lock:
+                victim = None
+                for filenam in self.entries:
+                    if filenam not in self.pinned:
+                        victim = filenam
+                        break
+            if victim is None:
+                return False
+            self.remove(victim)
+            self.evictions += 1
+        return True
+
+    def copy(self, filenam):
+        st = os.stat(filenam)
+        with self.lock:
+            entry = self.entries.get(filenam)
+        if entry is not None:
+            try:
+                staged_size = os.stat(entry[0]).st_size
+            except OSError:
+                staged_size = -1
+            if entry[1] == st.st_size and entry[2] == st.st_mtime_ns and \
+               staged_size == st.st_size:
+                with self.lock:
+                    self.entries.move_to_end(filenam)
+                return # copy is up to date
+            self.remove(filenam)
+        if st.st_size > self.size or not self.make_room(st.st_size):
+            return
+        staged = self.staged_filenam(filenam)
+        tmpnam = staged + '.part'
+        try:
+            shutil.copyfile(filenam, tmpnam)
+            os.utime(tmpnam, ns=(st.st_atime_ns, st.st_mtime_ns))
+            if os.stat(tmpnam).st_size != st.st_size:
+                raise OSError('incomplete copy')
+            os.replace(tmpnam, staged)
+        except OSError as e:
+            print_verbose('"{}" not staged: {}', VERBOSE_WARNING, filenam, e)
+            try:
+                os.remove(tmpnam)
+            except OSError:
+                pass
+            return
+        with self.lock:
+            self.entries[filenam] = [staged, st.st_size, st.st_mtime_ns]
+            self.used += st.st_size
+        self.copies += 1
+        self.bytes_copied += st.st_size
+        if gl_verbosity >= VERBOSE_VIDEOINFO:
+            print_verbose('"{}" staged. {}', VERBOSE_VIDEOINFO, filenam,
+                          self.stats())
+
+    def run(self):
+        while True:
+            req = self.requests.get()
+            if req is None:
+                break
+            filenams, pinned = req
+            self.pinned = set(pinned)
+            for filenam in pinned + filenams:
+                try:
+                    self.copy(filenam)
+                except Exception as e:
+                    print_verbose('"{}" not staged: {}', VERBOSE_WARNING,
+                                  filenam, e)
+
+
+class Histogram:
+    # Histogram with fixed buckets. Its memory doesn't grow, so the
+    # recording stays on all the time. The values are observed by the
+    # state machine and by the worker threads.
+    def __init__(self, name, help, buckets=LATENCY_BUCKETS, labels=''):
+        self.name = name
+        self.help = help
+        self.labels = labels # e.g. 'call="status"'
+        self.buckets = buckets
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.counts = [0] * (len(self.buckets) + 1) # last one: +Inf
+            self.sum = 0.0
+            self.count = 0
+            self.max = 0.0
+
+    def observe(self, value):
+        i = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            self.counts[i] += 1
+            self.sum += value
+            self.count += 1
+            if value > self.max:
+                self.max = value
+
+    def quantile(self, q):
+        # Estimated quantile, interpolated linearly inside the bucket
+        # containing it. The maximum limits the last bucket:
+        with self.lock:
+            rank = q * self.count
+            total = 0
+            for i, count in enumerate(self.counts):
+                if count > 0 and total + count >= rank:
+                    lower = self.buckets[i - 1] if i > 0 else 0.0
+                    upper = self.buckets[i] if i < len(self.buckets) \
+                            else self.max
+                    upper = max(lower, min(upper, self.max))
+                    return lower + (upper - lower) * (rank - total) / count
+                total += count
+        return 0.0
+
+    def summary(self):
+        return '{} observations, mean {:.4f}s, p50 {:.4f}s, p99 {:.4f}s, ' \
+               'max {:.4f}s'.format(self.count,
+                                    self.sum / self.count if self.count else 0,
+                                    self.quantile(0.5), self.quantile(0.99),
+                                    self.max)
+
+    def text(self):
+        # The lines of the Prometheus text format:
+        labels = self.labels + ',' if self.labels != '' else ''
+        lines = []
+        with self.lock:
+            total = 0
+            for i, count in enumerate(self.counts):
+                total += count
+                le = '{}'.format(self.buckets[i]) \
+                     if i < len(self.buckets) else '+Inf'
+                lines.append('{}_bucket{{{}le="{}"}} {}'.format(
+                                 self.name, labels, le, total))
+            labels = '{{{}}}'.format(self.labels) if self.labels != '' else ''
+            lines.append('{}_sum{} {}'.format(self.name, labels, self.sum))
+            lines.append('{}_count{} {}'.format(self.name, labels, self.count))
+        return lines
+
+
+class Metrics:
+    # Latencies and timing errors of the video sequence. They are written
+    # into a text file for the textfile collector of the Prometheus node
+    # exporter resp. served on localhost by the MetricsExporter.
+    def __init__(self):
+        self.tick_period = Histogram(
+            'ravidplay_tick_period_seconds',
+            'Time between the starts of two ticks of the state machine')
+        self.tick_overrun = Histogram(
+            'ravidplay_tick_overrun_seconds',
+            'Time by which a tick exceeded its timeslot')
+        self.spawn = Histogram(
+            'ravidplay_spawn_seconds',
+            'Duration of an omxplayer spawn by load_omxplayer',
+            SPAWN_BUCKETS)
+        self.dbus_status = Histogram(
+            'ravidplay_dbus_seconds',
+            'Duration of a D-Bus call to an omxplayer',
+            labels='call="status"')
+        self.dbus_alpha = Histogram(
+            'ravidplay_dbus_seconds',
+            'Duration of a D-Bus call to an omxplayer',
+            labels='call="set_alpha"')
+        self.buzzer = Histogram(
+            'ravidplay_buzzer_latency_seconds',
+            'Time from the buzzer press until the countdown video is visible',
+            SPAWN_BUCKETS)
+        self.black_gap = Histogram(
+            'ravidplay_black_gap_seconds',
+            'Time without any visible video between two video sequences')
+        self.gpio_rising = Histogram(
+            'ravidplay_gpio_trigger_error_seconds',
+            'Delay of a camera trigger edge against gpio_on/gpio_off_cntdn',
+            labels='edge="rising"')
+        self.gpio_falling = Histogram(
+            'ravidplay_gpio_trigger_error_seconds',
+            'Delay of a camera trigger edge against gpio_on/gpio_off_cntdn',
+            labels='edge="falling"')
+        self.input_buzzer = Histogram(
+            'ravidplay_input_latency_seconds',
+            'Time from a push button edge until the state machine reacts',
+            labels='input="buzzer"')
+        self.input_exit = Histogram(
+            'ravidplay_input_latency_seconds',
+            'Time from a push button edge until the state machine reacts',
+            labels='input="exit"')
+        self.histograms = [self.tick_period, self.tick_overrun, self.spawn,
+                           self.dbus_status, self.dbus_alpha, self.buzzer,
+                           self.black_gap, self.gpio_rising,
+                           self.gpio_falling, self.input_buzzer,
+                           self.input_exit]
+        self.recoveries = 0 # hung or failed omxplayer instances recycled
+
+    def text(self):
+        lines = []
+        last_name = None
+        for histogram in self.histograms:
+            if histogram.name != last_name:
+                lines.append('# HELP {} {}'.format(histogram.name,
+                                                   histogram.help))
+                lines.append('# TYPE {} histogram'.format(histogram.name))
+                last_name = histogram.name
+            lines += histogram.text()
+        lines.append('# HELP ravidplay_watchdog_recoveries_total '
+                     'Hung or failed omxplayer instances recycled')
+        lines.append('# TYPE ravidplay_watchdog_recoveries_total counter')
+        lines.append('ravidplay_watchdog_recoveries_total {}'.format(
+                         self.recoveries))
+        return '\n'.join(lines) + '\n'
+
+    def write(self, filenam):
+        # The textfile collector must never read a half written file:
+        tmpnam = '{}.{}.tmp'.format(filenam, os.getpid())
+        with open(tmpnam, 'w') as f:
+            f.write(self.text())
+        os.replace(tmpnam, filenam)
+
+    def reset(self):
+        for histogram in self.histograms:
+            histogram.reset()
+        self.recoveries = 0
+
+    def print_summary(self, verbosity=VERBOSE_DEBUG):
+        if gl_verbosity < verbosity:
+            return
+        for histogram in self.histograms:
+            if histogram.count > 0:
+                print_verbose('{}{}: {}', verbosity, histogram.name,
+                              '{' + histogram.labels + '}'
+                              if histogram.labels != '' else '',
+                              histogram.summary())
+        if self.recoveries > 0:
+            print_verbose('ravidplay_watchdog_recoveries_total: {}',
+                          verbosity, self.recoveries)
+
+
+# The metrics are recorded all the time:
+gl_metrics = Metrics()
+
+
+class MetricsHandler(http.server.BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path != '/metrics':
+            self.send_error(404)
+            return
+        body = gl_metrics.text().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass # no output for every scrape
+
+
+class MetricsExporter(threading.Thread):
+    # Writes the metrics into a text file every interval seconds and
+    # serves them on http://127.0.0.1:<port>/metrics.
+    def __init__(self, filenam='', port=0, interval=DEFAULT_METRICS_INTERVAL):
+        super().__init__(name='MetricsExporter', daemon=True)
+        self.filenam = os.path.expanduser(filenam) if filenam != '' else ''
+        self.interval = interval
+        self.stopped = threading.Event()
+        self.server = None
+        if port > 0:
+            try:
+                self.server = http.server.ThreadingHTTPServer(
+                                        ('127.0.0.1', port), MetricsHandler)
+            except OSError as e:
+                print_verbose('metrics not served on port {}: {}',
+                              VERBOSE_WARNING, port, e)
+            else:
+                self.server.daemon_threads = True
+                threading.Thread(target=self.server.serve_forever,
+                                 name='MetricsServer', daemon=True).start()
+
+    def write(self):
+        try:
+            gl_metrics.write(self.filenam)
+        except OSError as e:
+            print_verbose('metrics not written into "{}": {}', VERBOSE_WARNING,
+                          self.filenam, e)
+
+    def run(self):
+        if self.filenam == '':
+            return
+        while not self.stopped.wait(self.interval):
+            self.write()
+
+    def stop(self):
+        self.stopped.set()
+        if self.is_alive():
+            self.join()
+        if self.filenam != '':
+            self.write()
+        if self.server is not None:
+            self.server.shutdown()
+            self.server.server_close()
+
+
+class ConfigWatcher(threading.Thread):
+    # Polls the mtime of the common config file. A changed file is read
+    # together with the command line parameters into a new Config in the
+    # background, the state machine takes it on its next tick by take().
+    def __init__(self, cfg, sidecars=None):
+        super().__init__(name='ConfigWatcher', daemon=True)
+        self.cfg = cfg
+        self.sidecars = sidecars
+        self.filenam = cfg.config_filenam()
+        self.mtime = self.file_mtime()
+        self.pending = None # new Config not taken yet
+        self.stopped = threading.Event()
+
+    def file_mtime(self):
+        try:
+            return os.stat(self.filenam).st_mtime
+        except OSError:
+            return None
+
+    def run(self):
+        while not self.stopped.wait(self.cfg.config_poll):
+            mtime = self.file_mtime()
+            if mtime == self.mtime:
+                continue
+            self.mtime = mtime
+            cfg = Config()
+            cfg.set_common_config(self.cfg.argv, apply=False)
+            if self.sidecars is not None:
+                self.sidecars.rebase(cfg)
+            self.cfg = cfg
+            self.pending = cfg
+            if cfg.config_poll <= 0:
+                break
+
+    def take(self):
+        cfg = self.pending
+        self.pending = None
+        return cfg
+
+    def stop(self):
+        self.stopped.set()
+
+
+class SystemClock:
+    # Time of the state machine: the monotonic clock of the system.
+    def monotonic(self):
+        return time.monotonic()
+
+    def sleep(self, seconds, wakeup=None):
+        # wakeup: threading.Event ending the sleep before
+        if wakeup is None:
+            time.sleep(seconds)
+        else:
+            wakeup.wait(seconds)
+
+    def watch(self, settled):
+        pass # the system clock doesn't wait for anybody
+
+    def sleeping(self, thread):
+        return False
+
+    def stop(self):
+        pass
+
+
+class VirtualClock:
+    # Simulated time for faster than real time runs. The main thread
+    # drives the time: its sleep() jumps to the end at once, runs the
+    # events scheduled by call_at() and wakes the other threads whose
+    # sleep() has expired in the meantime. Before the time goes on, the
+    # worker threads registered by watch() must have settled, i.e. they
+    # have nothing to do or wait for the time as well. The D-Bus latency
+    # of the simulated omxplayers is added by advance().
+    def __init__(self, start=0.0):
+        self.now = start
+        self.cond = threading.Condition()
+        self.events = [] # heap of [time, sequence number, function]
+        self.sequence = 0
+        self.sleepers = {} # thread: deadline of the sleeping worker threads
+        self.wakeups = {} # thread: wakeup event of a sleeping worker thread
+        self.settled = [] # functions returning True if a worker has settled
+        self.stopped = False
+
+    def monotonic(self):
+        return self.now
+
+    def call_at(self, when, function):
+        # Returns the event for cancel():
+        event = [when, self.sequence, function]
+        with self.cond:
+            heapq.heappush(self.events, event)
+            self.sequence += 1
+        return event
+
+    def cancel(self, event):
+        # The event is dropped when it is due:
+        with self.cond:
+            event[2] = None
+
+    def advance(self, seconds):
+        with self.cond:
+            self.now += seconds
+            self.cond.notify_all()
+
+    def watch(self, settled):
+        self.settled.append(settled)
+
+    def sleeping(self, thread):
+        # A woken thread isn't sleeping anymore although it still has to
+        # remove itself from self.sleepers:
+        wakeup = self.wakeups.get(thread)
+        if wakeup is not None and wakeup.is_set():
+            return False
+        return self.sleepers.get(thread, self.now) > self.now
+
+    def settle(self):
+        # Wait (in real time) until the workers have settled. A hanging
+        # worker doesn't stop the time for longer than a few seconds:
+        timeout = time.monotonic() + 5.0
+        while not all(settled() for settled in self.settled) and \
+              not self.stopped and time.monotonic() < timeout:
+            self.cond.wait(0.001)
+
+    def sleep(self, seconds, wakeup=None):
+        # wakeup: threading.Event ending the sleep before, e.g. set by an
+        # event scheduled by call_at() (followed by wake() for a worker)
+        thread = threading.current_thread()
+        if thread is not threading.main_thread():
+            with self.cond:
+                deadline = self.now + seconds
+                self.sleepers[thread] = deadline
+                if wakeup is not None:
+                    self.wakeups[thread] = wakeup
+                self.cond.notify_all()
+                while self.now < deadline and not self.stopped and \
+                      not (wakeup is not None and wakeup.is_set()):
+                    self.cond.wait()
+                del self.sleepers[thread]
+                self.wakeups.pop(thread, None)
+            return
+        target = self.now + seconds
+        while True:
+            due = []
+            with self.cond:
+                self.settle()
+                if wakeup is not None and wakeup.is_set():
+                    break
+                while len(self.events) > 0 and self.events[0][2] is None:
+                    heapq.heappop(self.events) # cancelled
+                until = min([target] + list(self.sleepers.values()))
+                if len(self.events) > 0:
+                    until = min(until, self.events[0][0])
+                self.now = max(self.now, until)
+                while len(self.events) > 0 and self.events[0][0] <= self.now:
+                    function = heapq.heappop(self.events)[2]
+                    if function is not None:
+                        due.append(function)
+                self.cond.notify_all()
+                # Let the woken threads go on before the time runs further:
+                self.settle()
+            for function in due:
+                function()
+            if self.now >= target:
+                break
+
+    def wake(self):
+        # Let the sleeping worker threads check their wakeup events:
+        with self.cond:
+            self.cond.notify_all()
+
+    def stop(self):
+        # The time stands still: Let the sleeping threads finish.
+        with self.cond:
+            self.stopped = True
+            self.cond.notify_all()
+
+
+# Clock of the state machine, replaced by the VirtualClock of a simulation:
+gl_clock = SystemClock()
+
+
+class PiBackend:
+    # The real hardware: omxplayer instances via D-Bus and gpiozero pins.
+    def __init__(self):
+        self.clock = SystemClock()
+
+    def player(self, filenam, args=None, bus_address_finder=None,
+               Connection=None, dbus_name=None, pause=False):
+        return omxplayer.player.OMXPlayer(filenam, args, bus_address_finder,
+                                          Connection, dbus_name, pause)
+
+    def button(self, pin):
+        return gpiozero.Button(pin)
+
+    def led(self, pin):
+        return gpiozero.LED(pin)
+
+    def kill(self, player):
+        # The omxplayer script and its omxplayer.bin run in their own
+        # process group (python-omxplayer-wrapper starts them by setsid):
+        process = player._process
+        try:
+            os.killpg(process.pid, signal.SIGKILL)
+        except ProcessLookupError:
+            pass
+        process.wait(WATCHDOG_REAP)
+
+    def reap(self, player):
+        # Collect the exit status of a finished omxplayer (no zombie):
+        process = getattr(player, '_process', None)
+        if process is not None:
+            process.poll()
+
+
+class SimulatedDBusError(Exception):
+    pass
+
+
+class SimulatedConnection:
+    # unload_omxplayer() closes the bus of the connection:
+    def __init__(self):
+        self._bus = self
+
+    def close(self):
+        pass
+
+
+class SimulatedPlayer:
+    # Stand-in for omxplayer.player.OMXPlayer providing the methods used
+    # by the VideoPlayer. The spawn takes spawn_delay seconds, each D-Bus
+    # call dbus_latency seconds and may fail with error_rate resp. hang
+    # with hang_rate until the player is killed. The process exits at the
+    # end of the video like the omxplayer does.
+    def __init__(self, backend, filenam, pause=False):
+        self.backend = backend
+        self.clock = backend.clock
+        self._connection = SimulatedConnection()
+        self._properties_interface = self
+        self.exited = False
+        self.killed = threading.Event()
+        self.spawn(filenam, pause)
+
+    def spawn(self, filenam, pause):
+        self.clock.sleep(self.backend.spawn_delay)
+        self.filenam = filenam
+        self.length = self.backend.video_duration(filenam)
+        self.base_position = 0.0
+        self.base_time = None if pause else self.clock.monotonic()
+        self.backend.spawns += 1
+
+    def current_position(self):
+        position = self.base_position
+        if self.base_time is not None:
+            position += self.clock.monotonic() - self.base_time
+        if position >= self.length:
+            self.exited = True
+        return min(position, self.length)
+
+    def dbus_call(self):
+        self.current_position()
+        if self.exited:
+            raise SimulatedDBusError('omxplayer process has exited')
+        self.backend.dbus_call(self)
+
+    def GetAll(self, interface):
+        self.dbus_call()
+        return {'Position': int(self.current_position() * 1000000),
+                'PlaybackStatus': 'Playing' if self.base_time is not None
+                                  else 'Paused'}
+
+    def position(self):
+        self.dbus_call()
+        return self.current_position()
+
+    def playback_status(self):
+        self.dbus_call()
+        return 'Playing' if self.base_time is not None else 'Paused'
+
+    def duration(self):
+        self.dbus_call()
+        return self.length
+
+    def play(self):
+        self.dbus_call()
+        if self.base_time is None:
+            self.base_time = self.clock.monotonic()
+
+    def pause(self):
+        self.dbus_call()
+        self.base_position = self.current_position()
+        self.base_time = None
+
+    def set_position(self, position):
+        self.dbus_call()
+        self.base_position = position
+        if self.base_time is not None:
+            self.base_time = self.clock.monotonic()
+
+    def set_alpha(self, alpha):
+        self.dbus_call()
+
+    def set_volume(self, volume):
+        self.dbus_call()
+
+    def load(self, filenam, pause=False):
+        # The omxplayer wrapper quits the process and spawns a new one:
+        self.exited = False
+        self.killed.clear()
+        self.spawn(filenam, pause)
+
+    def quit(self):
+        self.exited = True
+
+    def stop(self):
+        self.exited = True
+
+
+class SimulatedButton:
+    # Stand-in for gpiozero.Button pressed by press() and release():
+    def __init__(self):
+        self.is_pressed = False
+        self.when_pressed = None
+        self.when_released = None
+
+    def press(self):
+        self.is_pressed = True
+        if self.when_pressed is not None:
+            self.when_pressed()
+
+    def release(self):
+        self.is_pressed = False
+        if self.when_released is not None:
+            self.when_released()
+
+
+class SimulatedLED:
+    # Stand-in for gpiozero.LED recording the times of its edges:
+    def __init__(self, clock):
+        self.clock = clock
+        self.is_lit = False
+        self.edges = [] # [time, is_lit]
+
+    def on(self):
+        self.is_lit = True
+        self.edges.append([self.clock.monotonic(), True])
+
+    def off(self):
+        self.is_lit = False
+        self.edges.append([self.clock.monotonic(), False])
+
+
+class SimulationBackend:
+    # Simulated omxplayer instances and GPIO pins driven by a VirtualClock.
+    # A day of idle/countdown/applause cycles runs in seconds on any Linux
+    # box. The durations of the videos are taken from the given dict,
+    # from their container headers or from the default duration.
+    def __init__(self, spawn_delay=DEFAULT_SIM_SPAWN,
+                 duration=DEFAULT_SIM_DURATION, dbus_latency=DEFAULT_SIM_DBUS,
+                 error_rate=0.0, seed=None, durations=None, hang_rate=0.0):
+        self.clock = VirtualClock()
+        self.spawn_delay = spawn_delay
+        self.duration = duration
+        self.dbus_latency = dbus_latency
+        self.error_rate = error_rate
+        self.hang_rate = hang_rate
+        self.random = random.Random(seed)
+        self.durations = {} if durations is None else durations
+        self.buttons = {} # pin: SimulatedButton
+        self.leds = {} # pin: SimulatedLED
+        self.spawns = 0
+        self.dbus_calls = 0
+        self.dbus_errors = 0
+        self.hangs = 0
+
+    def player(self, filenam, args=None, bus_address_finder=None,
+               Connection=None, dbus_name=None, pause=False):
+        return SimulatedPlayer(self, filenam, pause)
+
+    def button(self, pin):
+        self.buttons[pin] = SimulatedButton()
+        return self.buttons[pin]
+
+    def led(self, pin):
+        self.leds[pin] = SimulatedLED(self.clock)
+        return self.leds[pin]
+
+    def dbus_call(self, player):
+        self.dbus_calls += 1
+        self.clock.advance(self.dbus_latency)
+        # The calls of the main thread and of the PlayerLoader can hang.
+        # The main thread doesn't wait for the status queries of the other
+        # threads in virtual time:
+        thread = threading.current_thread()
+        if self.hang_rate > 0 and \
+           (thread is threading.main_thread() or
+            isinstance(thread, PlayerLoader)) and \
+           self.random.random() < self.hang_rate:
+            self.hangs += 1
+            self.clock.sleep(SIM_HANG_TIME, player.killed)
+            raise SimulatedDBusError('org.freedesktop.DBus.Error.NoReply')
+        if self.error_rate > 0 and self.random.random() < self.error_rate:
+            self.dbus_errors += 1
+            raise SimulatedDBusError('org.freedesktop.DBus.Error.NoReply')
+
+    def video_duration(self, filenam):
+        duration = self.durations.get(filenam)
+        if duration is None:
+            props = probe_video(filenam)
+            if props is not None and props.get('duration', 0) > 0:
+                duration = props['duration']
+            else:
+                duration = self.duration
+            self.durations[filenam] = duration
+        return duration
+
+    def kill(self, player):
+        player.exited = True
+        player.killed.set()
+        self.clock.wake()
+
+    def reap(self, player):
+        pass
+
+    def press(self, pin, when, hold=SIM_PRESS_TIME):
+        # Press the button of the given pin at the given time. It is held
+        # down for hold seconds resp. for ever (None):
+        button = self.buttons[pin]
+        self.clock.call_at(when, button.press)
+        if hold is not None:
+            self.clock.call_at(when + hold, button.release)
+
+
+class ButtonInput:
+    # Edge-triggered input of the push buttons. The gpiozero callbacks put
+    # each edge with its timestamp into a deque (appending and popping are
+    # thread-safe without a lock), the state machine takes the edges on its
+    # next tick. So a short press during a slow tick isn't lost. An edge
+    # within debounce seconds after the last taken edge of the same button
+    # is bouncing.
+    def __init__(self, buttons, debounce=DEFAULT_DEBOUNCE):
+        self.buttons = buttons # name: gpiozero.Button
+        self.debounce = debounce
+        self.edges = collections.deque() # (name, pressed, time)
+        self.notify = None # called after each edge to wake up the loop
+        self.pressed = {} # name: state of the last taken edge
+        self.last_edge = {} # name: time of the last taken edge
+        for name, button in buttons.items():
+            self.pressed[name] = False
+            self.last_edge[name] = None
+            button.when_pressed = self.callback(name, True)
+            button.when_released = self.callback(name, False)
+            if button.is_pressed:
+                # pressed before the start:
+                self.edges.append((name, True, gl_clock.monotonic()))
+
+    def callback(self, name, pressed):
+        def edge(*args):
+            # called from the gpiozero thread:
+            self.edges.append((name, pressed, gl_clock.monotonic()))
+            notify = self.notify
+            if notify is not None:
+                notify()
+        return edge
+
+    def take(self, events, name, pressed, when):
+        last = self.last_edge[name]
+        if pressed == self.pressed[name] or \
+           (last is not None and when - last < self.debounce):
+            return
+        self.pressed[name] = pressed
+        self.last_edge[name] = when
+        events.append((name, pressed, when))
+
+    def events(self):
+        # The debounced edges since the last call: [(name, pressed, time)]
+        events = []
+        while True:
+            try:
+                name, pressed, when = self.edges.popleft()
+            except IndexError:
+                break
+            self.take(events, name, pressed, when)
+        # The last edge of a bouncing button may have been dropped. Its
+        # level is taken after the bouncing:
+        now = gl_clock.monotonic()
+        for name, button in self.buttons.items():
+            pressed = button.is_pressed
+            if pressed != self.pressed[name] and not self.bouncing(name, now):
+                self.take(events, name, pressed, now)
+        return events
 
+    def bouncing(self, name=None, now=None):
+        # True within debounce seconds after the last edge (of any button):
+        if now is None:
+            now = gl_clock.monotonic()
+        names = self.buttons if name is None else [name]
+        for key in names:
+            last = self.last_edge[key]
+            if last is not None and now - last < self.debounce:
+                return True
+        return False
 
-# Global constants set by code, config file, command line parameters.
-# These are the default values by code if no config file nor cmdlin param:
-DEFAULT_VERBOSITY = VERBOSE_DEBUG
-DEFAULT_TIMESLOT = 0.02
-DEFAULT_RANDOMINDEX_IDLE = 0  # -1 random selection 0 continuous selection
-DEFAULT_RANDOMINDEX_CNTDN = 0 # -1 random selection 0 continuous selection
-DEFAULT_RANDOMINDEX_APPL = 0  # -1 random selection 0 continuous selection
+    def stop(self):
+        self.notify = None
+        for button in self.buttons.values():
+            button.when_pressed = None
+            button.when_released = None
 
-DEFAULT_IDLE_FADETIME_START = 0.5 #1.75
-DEFAULT_IDLE_FADETIME_END = 0.5 #1.75
-DEFAULT_IDLE_ALPHA_START = 0
-DEFAULT_IDLE_ALPHA_PLAY = 255
-DEFAULT_IDLE_ALPHA_END = 0
-DEFAULT_CNTDN_FADETIME_START = 0.5 #1.75
-DEFAULT_CNTDN_FADETIME_END = 0.5 #1.75
-DEFAULT_CNTDN_GPIO_ON = 2.0  # time in seconds before video sequence ends
-DEFAULT_CNTDN_GPIO_OFF = 1.0 # time in seconds before video sequence ends
-DEFAULT_CNTDN_ALPHA_START = 0
-DEFAULT_CNTDN_ALPHA_PLAY = 255
-DEFAULT_CNTDN_ALPHA_END = 0
 
+class PlaybackClock:
+    # Extrapolates the playback position of an omxplayer instance from the
+    # monotonic clock. The position is queried via D-Bus only every
+    # resync_interval seconds or after play, pause, seek and load.
+    def __init__(self, resync_interval=DEFAULT_RESYNC_INTERVAL):
+        self.resync_interval = resync_interval
+        self.rate = 1.0 # playback rate of the omxplayer
+        self.running = False
+        self.base_position = 0.0
+        self.base_time = None # None: resync necessary
+        # drift statistics: difference between queried and extrapolated
+        # position at each resync while playing
+        self.resyncs = 0
+        self.drift_last = 0.0
+        self.drift_max = 0.0
+        self.drift_sum = 0.0
 
-gl_verbosity = DEFAULT_VERBOSITY
+    def position(self, now=None):
+        if self.base_time is None or not self.running:
+            return self.base_position
+        if now is None:
+            now = gl_clock.monotonic()
+        return self.base_position + (now - self.base_time) * self.rate
 
+    def needs_resync(self, now=None):
+        if self.base_time is None:
+            return True
+        if now is None:
+            now = gl_clock.monotonic()
+        return now - self.base_time >= self.resync_interval
 
-def print_verbose(txt, verbosity, newline=True):
-    if gl_verbosity >= verbosity:
-        if newline: print()
-        
-        if verbosity == VERBOSE_ERROR:
-            prefix = 'ERROR:     '
-        elif verbosity == VERBOSE_WARNING:
-            prefix = 'Warning:   '
-        elif verbosity == VERBOSE_SHOW_INSTANCES:
-            prefix = 'SHOW_INSTANCES: '
-        elif verbosity == VERBOSE_DEBUG:
-            prefix = 'DEBUG:     '
-        else:
-            prefix = ''
-        print('{}{}'.format(prefix, txt), end='', flush=True)	
+    def sync(self, position, running, now):
+        if self.base_time is not None and self.running and running:
+            self.drift_last = position - self.position(now)
+            self.drift_sum += abs(self.drift_last)
+            self.drift_max = max(self.drift_max, abs(self.drift_last))
+            self.resyncs += 1
+        self.base_position = position
+        self.base_time = now
+        self.running = running
 
-class Config():
-    def print_properties(self, caption=None, verbosity=VERBOSE_DEBUG):
-        if caption is not None:
-            print_verbose('==== {} ===='.format(caption), verbosity)
-        print_verbose('gl_verbosity: {}'.format(gl_verbosity), verbosity)
-        print_verbose('', VERBOSE_DEBUG)
-        print_verbose('timeslot=={}'.format(self.timeslot), verbosity)
-        print_verbose('randomindex_idle=={}'.format(self.randomindex_idle), verbosity)
-        print_verbose('randomindex_cntdn=={}'.format(self.randomindex_cntdn), verbosity)
-        print_verbose('randomindex_appl=={}'.format(self.randomindex_appl), verbosity)
-        print_verbose('', VERBOSE_DEBUG)
-        print_verbose('fadetime_start_idle=={}'.format(self.fadetime_start_idle), verbosity)
-        print_verbose('fadetime_end_idle=={}'.format(self.fadetime_end_idle), verbosity)
-        print_verbose('fadetime_start_cntdn=={}'.format(self.fadetime_start_cntdn), verbosity)
-        print_verbose('fadetime_end_cntdn=={}'.format(self.fadetime_end_cntdn), verbosity)
-        print_verbose('gpio_on_cntdn=={}'.format(self.gpio_on_cntdn), verbosity)
-        print_verbose('gpio_off_cntdn=={}'.format(self.gpio_off_cntdn), verbosity)
-        print_verbose('', VERBOSE_DEBUG)
-        print_verbose('alpha_start_idle=={}'.format(self.alpha_start_idle), verbosity)
-        print_verbose('alpha_play_idle=={}'.format(self.alpha_play_idle), verbosity)
-        print_verbose('alpha_end_idle=={}'.format(self.alpha_end_idle), verbosity)
-        print_verbose('alpha_start_cntdn=={}'.format(self.alpha_start_cntdn), verbosity)
-        print_verbose('alpha_play_cntdn=={}'.format(self.alpha_play_cntdn), verbosity)
-        print_verbose('alpha_end_cntdn=={}'.format(self.alpha_end_cntdn), verbosity)
-        print_verbose('\n', VERBOSE_DEBUG)
+    def time_at(self, position):
+        # Monotonic time when the position will be reached, None: unknown
+        if self.base_time is None or not self.running or self.rate <= 0:
+            return None
+        return self.base_time + (position - self.base_position) / self.rate
 
-    def set_code_defaults(self):
-        global gl_verbosity
-        gl_verbosity = DEFAULT_VERBOSITY
-        
-        # Set the config parameters from code defaults
-        # given in global constants DEFAULT_...
-        self.timeslot = DEFAULT_TIMESLOT
-        self.randomindex_idle = DEFAULT_RANDOMINDEX_IDLE
-        self.randomindex_cntdn = DEFAULT_RANDOMINDEX_CNTDN
-        self.randomindex_appl = DEFAULT_RANDOMINDEX_APPL
+    def invalidate(self):
+        # Force a D-Bus query at the next status update:
+        self.base_time = None
 
-        self.fadetime_start_idle = DEFAULT_IDLE_FADETIME_START
-        self.fadetime_end_idle = DEFAULT_IDLE_FADETIME_END
-        self.alpha_start_idle = DEFAULT_IDLE_ALPHA_START
-        self.alpha_play_idle = DEFAULT_IDLE_ALPHA_PLAY
-        self.alpha_end_idle = DEFAULT_IDLE_ALPHA_END
-        self.fadetime_start_cntdn = DEFAULT_CNTDN_FADETIME_START
-        self.fadetime_end_cntdn = DEFAULT_CNTDN_FADETIME_END
-        self.gpio_on_cntdn = DEFAULT_CNTDN_GPIO_ON
-        self.gpio_off_cntdn = DEFAULT_CNTDN_GPIO_OFF
-        self.alpha_start_cntdn = DEFAULT_CNTDN_ALPHA_START
-        self.alpha_play_cntdn = DEFAULT_CNTDN_ALPHA_PLAY
-        self.alpha_end_cntdn = DEFAULT_CNTDN_ALPHA_END
-        
-    def read_from_cfg(self, filenam=None):
-        global gl_verbosity
-        
-        randomidx = None
-        randomidx_idle = None
-        randomidx_cntdn = None
-        randomidx_appl = None
-        
-        fadetime = None
-        fadetime_start = None
-        fadetime_end = None
-        fadetime_start_idle = None
-        fadetime_end_idle = None
-        fadetime_start_cntdn = None
-        fadetime_end_cntdn = None
-        gpio_on_cntdn = None
-        gpio_off_cntdn = None
-        
-        alpha = None
-        alpha_start = None
-        alpha_play = None
-        alpha_end = None
-        alpha_start_idle = None
-        alpha_play_idle = None
-        alpha_end_idle = None
-        alpha_start_cntdn = None
-        alpha_play_cntdn = None
-        alpha_end_cntdn = None
-        
-        if filenam is None:
-            # Check the command line parameters for config stuff:
-            f = [w[1:] for w in sys.argv[1:] if w[0] == '-']
-        else:
-            if filenam == '':
-                # Look for common config file at ~/.config:
-                filenam = os.path.realpath(sys.argv[0])
-                confnam = os.path.basename(filenam)  + '.conf'
-                confdir = os.path.join(os.path.expanduser('~'), '.config')
-                filenam = os.path.join(confdir, confnam)
-            try:
-                f = open(filenam, 'r')
-            except Exception:
-                f = []
-        for lin in f:
-            lin = lin.split('#')[0] # Remove comments marked with #
-            lin = [w.strip() for w in lin.split('=')]
-            if len(lin) >= 2:
-                # Integer parameters:
-                try:
-                    value = int(lin[1])
-                except Exception:
-                    value = None
-                else:
-                    if lin[0] == 'verbosity':
-                        gl_verbosity = value
-                    elif lin[0] == 'randomindex':
-                        randomidx = value
-                    elif lin[0] == 'randomindex_idle':
-                        randomidx_idle = value
-                    elif lin[0] == 'randomindex_cntdn':
-                        randomidx_cntdn = value
-                    elif lin[0] == 'randomindex_appl':
-                        randomidx_appl = value
-                    elif lin[0] == 'alpha':
-                        alpha = value
-                    elif lin[0] == 'alpha_start':
-                        alpha_start = value
-                    elif lin[0] == 'alpha_play':
-                        alpha_play = value
-                    elif lin[0] == 'alpha_end':
-                        alpha_end = value
-                    elif lin[0] == 'alpha_start_idle':
-                        alpha_start_idle = value
-                    elif lin[0] == 'alpha_play_idle':
-                        alpha_play_idle = value
-                    elif lin[0] == 'alpha_end_idle':
-                        alpha_end_idle = value
-                    elif lin[0] == 'alpha_start_cntdn':
-                        alpha_start_cntdn = value
-                    elif lin[0] == 'alpha_play_cntdn':
-                        alpha_play_cntdn = value
-                    elif lin[0] == 'alpha_end_cntdn':
-                        alpha_end_cntdn = value
-                # Floating-point parameters:
-                try:
-                    value = float(lin[1])
-                except Exception:
-                    value = None
-                else:
-                    if lin[0] == 'timeslot':
-                        self.timeslot = value
-                    elif lin[0] == 'fadetime':
-                        fadetime = value
-                    elif lin[0] == 'fadetime_start':
-                        fadetime_start = value
-                    elif lin[0] == 'fadetime_end':
-                        fadetime_end = value
-                    elif lin[0] == 'fadetime_start_idle':
-                        fadetime_start_idle = value
-                    elif lin[0] == 'fadetime_end_idle':
-                        fadetime_end_idle = value
-                    elif lin[0] == 'fadetime_start_cntdn':
-                        fadetime_start_cntdn = value
-                    elif lin[0] == 'fadetime_end_cntdn':
-                        fadetime_end_cntdn = value
-                    elif lin[0] == 'gpio_on_cntdn':
-                        gpio_on_cntdn = value
-                    elif lin[0] == 'gpio_off_cntdn':
-                        gpio_off_cntdn = value
-        # Close f only if it is really a file handle:
-        if type(f) is io.TextIOWrapper:
-            f.close()
-
-        # randomindex: # -1 random selection 0 continuous selection
-        if randomidx is not None:
-            self.randomindex_idle = randomidx
-            self.randomindex_cntdn = randomidx
-            self.randomindex_appl = randomidx
-        if randomidx_idle is not None:
-            self.randomindex_idle = randomidx_idle
-        if randomidx_cntdn is not None:
-            self.randomindex_cntdn = randomidx_cntdn
-        if randomidx_appl is not None:
-            self.randomindex_appl = randomidx_appl
-        
-        # fadetime in seconds:
-        if fadetime is not None:
-            self.fadetime_start_idle = fadetime
-            self.fadetime_end_idle = fadetime
-            self.fadetime_start_cntdn = fadetime
-            self.fadetime_end_cntdn = fadetime
-        if fadetime_start is not None:
-            self.fadetime_start_idle = fadetime_start
-            self.fadetime_start_cntdn = fadetime_start
-        if fadetime_end is not None:
-            self.fadetime_end_idle = fadetime_end
-            self.fadetime_end_cntdn = fadetime_end
-        if fadetime_start_idle is not None:
-            self.fadetime_start_idle = fadetime_start_idle
-        if fadetime_start_cntdn is not None:
-            self.fadetime_start_cntdn = fadetime_start_cntdn
-        if fadetime_end_idle is not None:
-            self.fadetime_end_idle = fadetime_end_idle
-        if fadetime_end_cntdn is not None:
-            self.fadetime_end_cntdn = fadetime_end_cntdn
-        # GPIO time in seconds:
-        if gpio_on_cntdn is not None:
-            self.gpio_on_cntdn = gpio_on_cntdn
-        if gpio_off_cntdn is not None:
-            self.gpio_off_cntdn = gpio_off_cntdn
-            
-        # alpha (video transparency):
-        if alpha is not None:
-            self.alpha_start_idle = alpha
-            self.alpha_play_idle = alpha
-            self.alpha_end_idle = alpha
-            self.alpha_start_cntdn = alpha
-            self.alpha_play_cntdn = alpha
-            self.alpha_end_cntdn = alpha
-        if alpha_start is not None:
-            self.alpha_start_idle = alpha_start
-            self.alpha_start_cntdn = alpha_start
-        if alpha_play is not None:
-            self.alpha_play_idle = alpha_play
-            self.alpha_play_cntdn = alpha_play
-        if alpha_end is not None:
-            self.alpha_end_idle = alpha_end
-            self.alpha_end_cntdn = alpha_end
-        if alpha_start_idle is not None:
-            self.alpha_start_idle = alpha_start_idle
-        if alpha_start_cntdn is not None:
-            self.alpha_start_cntdn = alpha_start_cntdn
-        if alpha_play_idle is not None:
-            self.alpha_play_idle = alpha_play_idle
-        if alpha_play_cntdn is not None:
-            self.alpha_play_cntdn = alpha_play_cntdn
-        if alpha_end_idle is not None:
-            self.alpha_end_idle = alpha_end_idle
-        if alpha_end_cntdn is not None:
-            self.alpha_end_cntdn = alpha_end_cntdn
-
-    def set_common_config(self):
-        self.set_code_defaults() # Take hard-coded default parameters
-        self.read_from_cfg('')   # Overwrite parameters with common config file
-        self.read_from_cfg(None) # Overwrite parameters with command line
-        pass
+    def reset(self):
+        self.invalidate()
+        self.running = False
+        self.base_position = 0.0
+        self.resyncs = 0
+        self.drift_last = 0.0
+        self.drift_max = 0.0
+        self.drift_sum = 0.0
 
-    def videos(self, category):
-        # Take video list from filenames given by command line parameters,
-        # introduced by a category parameter like "-idle:", "-cntdn:", "-appl:"
-        found = False
-        files = []
-        for w in sys.argv[1:]:
-            if w == category: 
-                found = True
-            elif w[0] == '-':
-                found = False
-            else:
-                if found:
-                    # TODO: parse m3u files
-                    files.append(os.path.realpath(w)) # Follow symbolic links!
-        return files
+    def drift_info(self):
+        return '{} resyncs, drift mean=={:.4f}s max=={:.4f}s'.format(
+                    self.resyncs,
+                    self.drift_sum / self.resyncs if self.resyncs else 0.0,
+                    self.drift_max)
 
 
 class VideoPlayer:
-    def __init__(self, layer):
+    def __init__(self, layer, backend=None):
         self.layer = layer # omxplayer video render layer 
                            # (higher numbers are on top)
+        # spawns the omxplayer instances, PiBackend or SimulationBackend:
+        self.backend = PiBackend() if backend is None else backend
         self.videosize = '0,0,1919,1079' # TODO: read resolution from system
         self.fadetime_start = 0
         self.fadetime_end = 0
         self.alpha_start = 0
         self.alpha_play = 0
         self.alpha_end = 0
+        self.fadecurve = DEFAULT_IDLE_FADECURVE
+        self.alpha_step = DEFAULT_ALPHA_STEP
+        self.volume_step = DEFAULT_VOLUME_STEP
+        self.envelope_start = None # FadeEnvelope of the fading-in
+        self.envelope_end = None # FadeEnvelope of the fading-out
         self.gpio_pin = None
         self.gpio_on = 0
         self.gpio_off = 0
         
         self.last_alpha = 0
+        self.last_volume = 0.0
+        self.alpha_updates = 0 # D-Bus calls for alpha and volume
+        self.volume_updates = 0
         
         self.omxplayer = None
+        self.filenam = None
+        self.category = None # CATEGORY_... of the loaded video
+        self.video_index = -1 # index of the video in its playlist
         self.duration = 0 # < 0: An error occurred when examining the duration
         self.position = 0
         self.playback_status = 'None'
+        self.status_tick = -1 # tick of the last status snapshot
+        self.probed_duration = None # duration found by self.precheck()
+        self.precheck_error = ''
+        self.clock = PlaybackClock()
         self.is_fading = False
+        self.watchdog = None # Watchdog putting deadlines on the D-Bus calls
+        self.killed = False # the omxplayer has been killed by the watchdog
+
+    def supervised(self, function, *args, timeout=None):
+        # Call a method of the omxplayer under the deadline of the watchdog.
+        # A hung omxplayer is killed, so the call returns with an exception:
+        if self.watchdog is None:
+            return function(*args)
+        call = self.watchdog.enter(self, function.__name__, timeout)
+        try:
+            return function(*args)
+        finally:
+            self.watchdog.leave(call)
+
+    def fail(self, e):
+        # The omxplayer didn't answer: It will be unloaded by the state
+        # machine.
+        self.clock.invalidate()
+        self.playback_status = 'Exception {}: {}'.format(
+                               str(type(e)),
+                               str(e.args[0] if e.args else e))
+
+    def command(self, function, *args, timeout=None):
+        # Supervised call whose exception only marks the omxplayer as
+        # failed. Returns None in this case:
+        try:
+            return self.supervised(function, *args, timeout=timeout)
+        except Exception as e:
+            self.fail(e)
+            return None
 
     def unload_omxplayer(self):
         if self.omxplayer is not None:
             # Remove current instance of omxplayer even if it is running:
             ###self.omxplayer.stop() # Debug!
-            self.omxplayer.quit()
+            self.command(self.omxplayer.quit)
             
             # The following two commands were found at
             # https://github.com/willprice/python-omxplayer-wrapper/issues/176#issuecomment-586520583
@@ -409,6 +3333,8 @@ class VideoPlayer:
             self.omxplayer._connection = None
             
             self.omxplayer = None
+            self.filenam = None
+            self.category = None
             self.playback_status = 'None'
             ret = 0
         else:
@@ -422,37 +3348,48 @@ class VideoPlayer:
                        bus_address_finder=None,
                        Connection=None,
                        dbus_name=None,
-                       pause=True):
-        if filenam is None:
-            # No video filename was given, e.g. due to empty video list:
-            ret = 10
-        elif not os.path.exists(filenam):
-            # Given filename doesn't exist:
-            ret = 11
-        elif os.path.isdir(filenam):
-        #elif os.path.ismount(filenam) or os.path.isdir(filenam):
-            # Given filename is a (mount point) directory:
-            ret = 12
-        elif not os.access(filenam, os.R_OK):
-            # Read permission denied to filenam:
-            ret = 13
+                       pause=True,
+                       duration=None):
+        ret = video_file_error(filenam)
+        if ret != 0:
+            # No, missing or unreadable video file (ret 10...13):
+            pass
+        elif self.omxplayer is None and self.precheck(filenam) != 0:
+            # Empty or undecodable video file:
+            ret = 14
         elif self.omxplayer is None:
             # Create a new omxplayer instance:
+            self.killed = False
             try:
-                self.omxplayer = omxplayer.player.OMXPlayer(filenam, args,
-                                                            bus_address_finder,
-                                                            Connection,
-                                                            dbus_name,
-                                                            pause)
+                self.omxplayer = self.backend.player(filenam, args,
+                                                     bus_address_finder,
+                                                     Connection,
+                                                     dbus_name,
+                                                     pause)
             except Exception:
                 ret = 1
             else:
                 ret = 0
+                self.filenam = filenam
                 self.last_alpha = 0
+                self.last_volume = 0.0 # --vol -10000
+                self.alpha_updates = 0
+                self.volume_updates = 0
+                self.clock.reset()
+                # Don't wait for the next status update of the state machine:
+                self.playback_status = 'Paused' if pause else 'Playing'
                 try:
                     # store video sequence duration in the class property
-                    # self.duration to get faster access on repeated calls:
-                    self.duration = self.omxplayer.duration()
+                    # self.duration to get faster access on repeated calls.
+                    # A duration known from the metadata index saves the
+                    # D-Bus call:
+                    if duration is None:
+                        duration = self.probed_duration
+                    if duration is not None and duration > 0:
+                        self.duration = duration
+                    else:
+                        self.duration = self.supervised(
+                                            self.omxplayer.duration)
                     self.position = 0
                 except Exception:
                     # An error occurred when examining the video duration:
@@ -463,46 +3400,186 @@ class VideoPlayer:
             ret = 3
         return ret
 
-    def updt_playback_status(self):
+    def query_status(self):
+        # Returns [position, playback_status] of the omxplayer.
+        # Both properties are fetched by one D-Bus round trip if the
+        # omxplayer supports org.freedesktop.DBus.Properties.GetAll.
+        # Otherwise two single calls are necessary:
+        global gl_getall_supported
+        if gl_getall_supported != False:
+            try:
+                props = self.supervised(
+                            self.omxplayer._properties_interface.GetAll,
+                            MPRIS_PLAYER_INTERFACE)
+                position = props['Position'] / (1000.0 * 1000.0)
+                playback_status = str(props['PlaybackStatus'])
+            except Exception:
+                if gl_getall_supported:
+                    raise
+            else:
+                gl_getall_supported = True
+                return [position, playback_status]
+        position = self.supervised(self.omxplayer.position)
+        # The omxplayer returns 'Playing', 'Paused', 'Stopped':
+        playback_status = self.supervised(self.omxplayer.playback_status)
+        if gl_getall_supported is None:
+            # The single calls work but GetAll failed:
+            gl_getall_supported = False
+            print_verbose('omxplayer doesn\'t support GetAll: '
+                          'querying the status by single calls',
+                          VERBOSE_DEBUG)
+        return [position, playback_status]
+
+    def precheck(self, filenam):
+        # Examine the container headers before the expensive omxplayer
+        # spawn. Returns 0 if the file seems to be playable:
+        props = probe_video(filenam)
+        self.probed_duration = None
+        if props is None:
+            # unknown container format: leave it to the omxplayer
+            ret = 0
+        elif 'error' in props:
+            self.precheck_error = props['error']
+            ret = 1
+        else:
+            self.probed_duration = props.get('duration')
+            ret = 0
+        return ret
+
+    def updt_playback_status(self, tick=None):
         # Returns from omxplayer 'Playing', 'Paused', 'Stopped'
         # and further            'None', 'Exception <text>'
+        # The status is taken as snapshot for the given tick of the state
+        # machine. Further calls during the same tick use the snapshot:
+        if tick is not None and tick == self.status_tick:
+            return self.playback_status
+        self.status_tick = tick
+        now = gl_clock.monotonic()
         if self.omxplayer is None:
             self.playback_status = 'None'
+        elif self.playback_status[0:9] == 'Exception':
+            # A failed command (see self.fail()) isn't undone by a later
+            # answer. The instance is unloaded by the state machine:
+            pass
+        elif not self.needs_query(now):
+            # Extrapolate the position without any D-Bus call:
+            self.position = self.clock.position(now)
         else:
             try:
-                self.position = self.omxplayer.position()
+                self.position, self.playback_status = self.query_status()
+                gl_metrics.dbus_status.observe(gl_clock.monotonic() - now)
+                self.clock.sync(self.position,
+                                self.playback_status == 'Playing',
+                                (now + gl_clock.monotonic()) / 2)
             except Exception as e:
                 self.position = -1
-                self.playback_status = 'Exception {}: {}'.format(
-                                       str(type(e)),
-                                       str(e.args[0]))
-            else:
-                try:
-                    # The omxplayer returns 'Playing', 'Paused', 'Stopped':
-                    self.playback_status = self.omxplayer.playback_status()
-                except Exception as e:
-                    self.playback_status = 'Exception {}: {}'.format(
-                                           str(type(e)),
-                                           str(e.args[0]))
+                self.fail(e)
         return self.playback_status
 
-    def set_alpha(self, alpha):
+    def needs_query(self, now):
+        # True if the status takes a D-Bus call. The end of the video
+        # sequence is always checked by a real query:
+        if self.omxplayer is None or \
+           self.playback_status[0:9] == 'Exception':
+            return False
+        return not ((self.playback_status == 'Playing' or
+                     self.playback_status == 'Paused') and
+                    not self.clock.needs_resync(now) and
+                    self.clock.position(now) < self.duration)
+
+    def current_position(self):
+        # Extrapolated position at this moment without any D-Bus call:
+        if self.clock.base_time is None:
+            return self.position
+        return self.clock.position()
+
+    def play(self):
+        self.command(self.omxplayer.play)
+        self.clock.invalidate()
+
+    def set_position(self, position):
+        self.command(self.omxplayer.set_position, position)
+        self.clock.invalidate()
+
+    def load(self, filenam, pause=False, path=None, duration=None):
+        # Replace the video of the spawned omxplayer. Returns 0 if OK,
+        # the return codes of self.load_omxplayer() otherwise.
+        # path: file to be played instead of filenam, e.g. a staged copy
+        # duration: known duration of the video, saves the D-Bus call
+        if path is None:
+            path = filenam
+        ret = video_file_error(path)
+        if ret != 0:
+            return ret
+        if self.precheck(path) != 0:
+            return 14
+        self.filenam = filenam
+        self.clock.reset()
+        if duration is None or duration <= 0:
+            duration = self.probed_duration
+        try:
+            # The omxplayer wrapper spawns a new omxplayer process:
+            self.supervised(self.omxplayer.load, path, pause,
+                            timeout=SPAWN_TIMEOUT)
+        except Exception as e:
+            self.fail(e)
+            return 1
+        self.playback_status = 'Paused' if pause else 'Playing'
+        self.position = 0
+        try:
+            if duration is None or duration <= 0:
+                duration = self.supervised(self.omxplayer.duration)
+        except Exception as e:
+            self.fail(e)
+            self.duration = -1
+            return 2
+        self.duration = duration
+        return 0
+
+    def prepare_envelopes(self):
+        # Precompute the fadings from the current alpha values and curve:
+        self.envelope_start = FadeEnvelope(self.alpha_start, self.alpha_play,
+                                           self.fadecurve)
+        self.envelope_end = FadeEnvelope(self.alpha_end, self.alpha_play,
+                                         self.fadecurve)
+
+    def set_alpha(self, alpha, volume=None):
         # Check if change of alpha value is really necessary:
+        alpha = int(round(alpha))
         if alpha < 0: alpha = 0
         if alpha > 255: alpha = 255
-        if alpha != self.last_alpha:
+        if volume is None:
+            volume = alpha / 255
+        # Coalesce small changes: A new value is only sent if it differs
+        # by at least one step from the last one sent or if it reaches
+        # one of the end points of the fadings:
+        targets = (self.alpha_start, self.alpha_play, self.alpha_end)
+        if alpha != self.last_alpha and \
+           (abs(alpha - self.last_alpha) >= self.alpha_step or
+            alpha in targets):
             if self.omxplayer is not None:
+                start = gl_clock.monotonic()
                 try:
-                    self.omxplayer.set_alpha(alpha)
+                    self.supervised(self.omxplayer.set_alpha, alpha)
                 except Exception:
                     pass
+                gl_metrics.dbus_alpha.observe(gl_clock.monotonic() - start)
+                self.alpha_updates += 1
+            self.last_alpha = alpha
+        if volume != self.last_volume and \
+           (abs(volume - self.last_volume) >= self.volume_step or
+            volume in [a / 255 for a in targets]):
+            if self.omxplayer is not None:
                 try:
-                    self.omxplayer.set_volume(alpha / 255)
+                    self.supervised(self.omxplayer.set_volume, volume)
                 except Exception:
                     pass
-            self.last_alpha = alpha
+                self.volume_updates += 1
+            self.last_volume = volume
 
     def fade(self):
+        if self.envelope_start is None:
+            self.prepare_envelopes()
         if self.omxplayer is None:
             # do nothing!
             self.is_fading = False
@@ -515,11 +3592,9 @@ class VideoPlayer:
         elif self.playback_status == 'Playing':
             if self.position > (self.duration - self.fadetime_end):
                 # Smooth fading-out at the end of the video sequence:
-                tim = 1 - ((self.duration - self.position)
-                           / self.fadetime_end)
-                alpha = (self.alpha_play
-                         - tim * (self.alpha_play - self.alpha_end)
-                        )
+                alpha, volume = self.envelope_end.at(
+                                (self.duration - self.position)
+                                / self.fadetime_end)
                 self.is_fading = True
             elif self.position < self.fadetime_start:
                 # Smooth fading-in at start of the video sequence:
@@ -528,76 +3603,478 @@ class VideoPlayer:
                 # avoid division by zero:
                 tim = 1 if self.fadetime_start == 0 \
                         else self.position / self.fadetime_start
-                alpha = (self.alpha_start 
-                         + tim * (self.alpha_play - self.alpha_start)
-                        )
+                alpha, volume = self.envelope_start.at(tim)
                 self.is_fading = True
             else:
                 # current video position somewhere in the middle:
                 alpha = self.alpha_play
+                volume = alpha / 255
                 self.is_fading = False
-            self.set_alpha(alpha)
+            self.set_alpha(alpha, volume)
             
-            # Check GPIO signaling:
-            if type(self.gpio_pin) == gpiozero.output_devices.LED:
-                remaining = self.duration - self.position
-                if remaining - self.gpio_off <= 0:
-                    # switch off trigger pin (falling slope)
-                    if self.gpio_pin.is_lit == True:
-                        self.gpio_pin.off()
-                        print_verbose(
-                             '-> camera trigger signal via GPIO stopped. ',
-                             VERBOSE_GPIO)
-                elif remaining - self.gpio_on <= 0:
-                    # switch on trigger pin (rising slope):
-                    if self.gpio_pin.is_lit == False:
-                        self.gpio_pin.on()
-                        print_verbose(
-                             '-> camera trigger signal via GPIO started. ',
-                             VERBOSE_GPIO)
+            # GPIO signaling: The TriggerScheduler sets the edges at the
+            # times of their positions. The times follow the resyncs:
+            if self.gpio_pin is not None:
+                self.gpio_pin.schedule(
+                    self.clock.time_at(self.duration - self.gpio_on),
+                    self.clock.time_at(self.duration - self.gpio_off))
         
 
+class TriggerScheduler(threading.Thread):
+    # Sets the edges of the camera trigger signal at absolute monotonic
+    # times independent of the ticks of the state machine. The countdown
+    # VideoPlayer computes the times from its PlaybackClock on each tick.
+    # This thread runs with realtime priority (if permitted), sleeps until
+    # shortly before the next edge and spins the rest. In a simulation the
+    # edges are events of the VirtualClock instead.
+    def __init__(self, pin):
+        super().__init__(name='TriggerScheduler', daemon=True)
+        self.pin = pin # gpiozero.LED
+        self.cond = threading.Condition()
+        self.virtual = isinstance(gl_clock, VirtualClock)
+        self.events = [] # VirtualClock events of the edges
+        self.stopped = False
+        self.reset()
+
+    def reset(self):
+        self.rising = None # target times of the edges
+        self.falling = None
+        self.rising_error = None # actual minus target time of a set edge
+        self.falling_error = None
+
+    def schedule(self, rising, falling):
+        # New target times of the edges, None: the position is unknown
+        if rising is None or falling is None:
+            return
+        with self.cond:
+            if rising == self.rising and falling == self.falling:
+                return
+            self.rising = rising
+            self.falling = falling
+            if self.virtual:
+                self.cancel_events()
+                self.events = [gl_clock.call_at(rising, self.fire),
+                               gl_clock.call_at(falling, self.fire)]
+            self.cond.notify()
+
+    def cancel_events(self):
+        for event in self.events:
+            gl_clock.cancel(event)
+        self.events = []
+
+    def next_deadline(self):
+        if self.rising is None:
+            return None
+        if self.rising_error is None:
+            return self.rising
+        if self.falling_error is None:
+            return self.falling
+        return None
+
+    def fire(self):
+        # Set the edges which are due:
+        with self.cond:
+            now = gl_clock.monotonic()
+            if self.rising is not None and self.rising_error is None and \
+               now >= self.rising:
+                # switch on trigger pin (rising slope):
+                self.pin.on()
+                self.rising_error = gl_clock.monotonic() - self.rising
+                gl_metrics.gpio_rising.observe(self.rising_error)
+                print_verbose('-> camera trigger signal via GPIO started. ',
+                              VERBOSE_GPIO)
+            if self.rising_error is not None and \
+               self.falling_error is None and now >= self.falling:
+                # switch off trigger pin (falling slope)
+                self.pin.off()
+                self.falling_error = gl_clock.monotonic() - self.falling
+                gl_metrics.gpio_falling.observe(self.falling_error)
+                print_verbose('-> camera trigger signal via GPIO stopped. ',
+                              VERBOSE_GPIO)
+
+    def finish(self):
+        # End of the countdown video: The pin is switched off in any case
+        # and the timing errors of the session are logged:
+        with self.cond:
+            if self.pin.is_lit:
+                self.pin.off()
+            if self.rising is not None and gl_verbosity >= VERBOSE_GPIO:
+                print_verbose('   camera trigger edges against their target '
+                              'times: rising {}, falling {}', VERBOSE_GPIO,
+                              'missed' if self.rising_error is None
+                              else '{:+.4f}s'.format(self.rising_error),
+                              'missed' if self.falling_error is None
+                              else '{:+.4f}s'.format(self.falling_error))
+            self.reset()
+            if self.virtual:
+                self.cancel_events()
+            self.cond.notify()
+
+    def stop(self):
+        with self.cond:
+            self.stopped = True
+            self.cond.notify()
+        if self.is_alive():
+            self.join()
+        if self.pin.is_lit:
+            self.pin.off()
+
+    def run(self):
+        try:
+            os.sched_setscheduler(0, os.SCHED_FIFO,
+                                  os.sched_param(TRIGGER_PRIORITY))
+        except (AttributeError, OSError) as e:
+            print_verbose('camera trigger thread without realtime priority: '
+                          '{}', VERBOSE_DEBUG, e)
+        with self.cond:
+            while not self.stopped:
+                self.fire()
+                deadline = self.next_deadline()
+                if deadline is None:
+                    self.cond.wait()
+                    continue
+                delay = deadline - gl_clock.monotonic()
+                if delay > TRIGGER_SPIN:
+                    self.cond.wait(delay - TRIGGER_SPIN)
+                else:
+                    # Waking up from a sleep takes longer than the spin.
+                    # schedule() and finish() aren't blocked meanwhile, the
+                    # spin ends as soon as the deadline has been changed
+                    # and fire() checks the edges again:
+                    self.cond.release()
+                    try:
+                        while gl_clock.monotonic() < deadline and \
+                              self.next_deadline() == deadline:
+                            pass
+                    finally:
+                        self.cond.acquire()
+
+
+class PlayerLoader(threading.Thread):
+    # Worker thread which spawns the omxplayer instances in the background.
+    # The state machine puts load requests into self.requests and picks up
+    # the finished instances from self.completions on a later tick.
+    def __init__(self, sidecars=None, name='PlayerLoader', staging=None):
+        super().__init__(name=name, daemon=True)
+        self.requests = queue.Queue()
+        self.completions = queue.Queue()
+        self.notify = None # called from the worker thread when a load is done
+        self.sidecars = sidecars # SidecarCache checked before each load
+        self.staging = staging # StagingCache verifying the staged copies
+
+    def request(self, inst, pl, filenam, args, dbus_name, duration=None,
+                path=None, swap=False):
+        # path: file to be played instead of filenam, e.g. a staged copy
+        # swap: replace the video of the spawned omxplayer by pl.load()
+        pl.playback_status = 'Loading'
+        self.requests.put((inst, pl, filenam, args, dbus_name, duration,
+                           path, swap))
+
+    def completed(self):
+        # Returns the finished load requests as list of [inst, ret]:
+        done = []
+        while True:
+            try:
+                done.append(self.completions.get_nowait())
+            except queue.Empty:
+                break
+        return done
+
+    def stop(self):
+        # Let the worker finish its current request and exit:
+        self.requests.put(None)
+        self.join()
+
+    def settled(self):
+        # Nothing to do or waiting for the time of a VirtualClock:
+        return self.requests.unfinished_tasks == 0 or \
+               gl_clock.sleeping(self)
+
+    def load(self, pl, filenam, path, args, dbus_name, duration, swap):
+        if swap:
+            return pl.load(filenam, True, path, duration)
+        return pl.load_omxplayer(path, args,
+                                 dbus_name=dbus_name,
+                                 pause=True,
+                                 duration=duration)
+
+    def run(self):
+        while True:
+            req = self.requests.get()
+            if req is None:
+                break
+            inst, pl, filenam, args, dbus_name, duration, path, swap = req
+            if self.sidecars is not None and filenam is not None:
+                # Check the video parameters off the main loop:
+                self.sidecars.refresh(filenam)
+            if path is None:
+                path = filenam
+            elif self.staging is not None:
+                path = self.staging.verify(filenam, path)
+            # On an RPi1 or RPi0 this omxplayer init takes about 2.5s - 3.0s!
+            start = gl_clock.monotonic()
+            ret = self.load(pl, filenam, path, args, dbus_name, duration,
+                            swap)
+            if ret == 11 and path != filenam:
+                # The staged copy has been removed meanwhile:
+                path = filenam
+                ret = self.load(pl, filenam, path, args, dbus_name,
+                                duration, swap)
+            if ret == 0:
+                gl_metrics.spawn.observe(gl_clock.monotonic() - start)
+                pl.filenam = filenam # the original one, not the copy
+            if ret != 0 and pl.playback_status == 'Loading':
+                pl.playback_status = 'None'
+            self.completions.put([inst, ret])
+            self.requests.task_done()
+            if self.notify is not None:
+                self.notify()
+
+
+class Watchdog(threading.Thread):
+    # Puts a deadline on each D-Bus call of the VideoPlayers. The omxplayer
+    # of a call which hasn't returned in time is considered hung: It is
+    # killed and reaped out of band, so the blocked call returns with an
+    # exception and the state machine unloads the instance and hands its
+    # slot back to the pool. The exited omxplayer processes are reaped
+    # as well, so no zombies are left. With a VirtualClock the deadlines
+    # are checked by events of the clock instead of the thread.
+    def __init__(self, players, timeout=DEFAULT_DBUS_TIMEOUT):
+        super().__init__(name='Watchdog', daemon=True)
+        self.players = players # VideoPlayers with omxplayer instances
+        self.timeout = timeout # seconds, 0: off
+        self.calls = {} # (VideoPlayer, thread id): [deadline, method]
+        self.lock = threading.Lock()
+        self.recoveries = 0
+        self.virtual = isinstance(gl_clock, VirtualClock)
+        self.stopped = threading.Event()
+
+    def enter(self, pl, name, timeout=None):
+        # Returns the key of the call for leave():
+        if timeout is None:
+            timeout = self.timeout
+        call = (pl, threading.get_ident())
+        if timeout <= 0:
+            return call
+        deadline = gl_clock.monotonic() + timeout
+        with self.lock:
+            self.calls[call] = [deadline, name]
+        if self.virtual:
+            gl_clock.call_at(deadline, self.check)
+        return call
+
+    def leave(self, call):
+        with self.lock:
+            self.calls.pop(call, None)
+
+    def check(self):
+        now = gl_clock.monotonic()
+        with self.lock:
+            overdue = [(call, name)
+                       for call, (deadline, name) in self.calls.items()
+                       if deadline <= now]
+        for call, name in overdue:
+            self.recover(call, name)
+        for pl in self.players:
+            player = pl.omxplayer
+            if player is not None:
+                pl.backend.reap(player)
+
+    def recover(self, call, name):
+        with self.lock:
+            if self.calls.pop(call, None) is None:
+                return # the call has returned meanwhile
+        pl = call[0]
+        player = pl.omxplayer
+        if player is None:
+            return
+        pl.killed = True
+        self.count()
+        print_verbose('omxplayer on layer {} didn\'t answer {}() in time: '
+                      'killing it', VERBOSE_WARNING, pl.layer, name)
+        try:
+            pl.backend.kill(player)
+        except Exception as e:
+            print_verbose('killing the omxplayer on layer {} failed: {}',
+                          VERBOSE_WARNING, pl.layer, e)
+
+    def count(self):
+        # An omxplayer instance has been recycled:
+        self.recoveries += 1
+        gl_metrics.recoveries += 1
+
+    def run(self):
+        while not self.stopped.wait(WATCHDOG_INTERVAL):
+            self.check()
+
+    def stop(self):
+        self.stopped.set()
+
+
 class StateMachine:
-    def __init__(self):
+    def __init__(self, argv=None, backend=None):
+        # backend: PiBackend (default) or SimulationBackend
+        global gl_clock
+        self.backend = PiBackend() if backend is None else backend
+        gl_clock = self.backend.clock
         self.progname = os.path.realpath(sys.argv[0])
         self.exitcode = 0
         self.omxplayer_cmdlin_params = []
 
         self.cfg = Config()
-        self.cfg.set_common_config()
-        print_verbose('Welcome to {} v{}'.format(
-                os.path.basename(self.progname),
-                VERSION),
-                VERBOSE_VERSION)
+        self.cfg.set_common_config(argv)
+        gl_log.open_json(self.cfg.log_json)
+        print_verbose('Welcome to {} v{}', VERBOSE_VERSION,
+                      os.path.basename(self.progname), VERSION)
         self.cfg.print_properties(caption='COMMON CONFIGURATION')
         
         # Non-video properties:
         self.timeslot = self.cfg.timeslot
         
-        self.randomindex_idle = self.cfg.randomindex_idle
-        self.randomindex_cntdn = self.cfg.randomindex_cntdn
-        self.randomindex_appl = self.cfg.randomindex_appl
-        
-        # Lists of video files:
-        self.videos_idle = self.cfg.videos('-idle:')
-        self.videos_cntdn = self.cfg.videos('-cntdn:')
-        self.videos_appl = self.cfg.videos('-appl:')
-        if len(self.videos_appl) == 0:
-            # Create another instance of list with identical contents!
-            self.videos_appl = self.videos_idle.copy()
-
-        # Create two instances of omxplayer management:
-        self.manage_instance = 0
-        self.pl = [None, None]
-        self.pl[OMXINSTANCE_VIDEO1] = VideoPlayer(OMXLAYER[OMXINSTANCE_VIDEO1])
-        self.pl[OMXINSTANCE_VIDEO2] = VideoPlayer(OMXLAYER[OMXINSTANCE_VIDEO2])
+        # Parameters of single videos given by sidecar files. They are
+        # checked once in the background and before each load:
+        self.sidecars = SidecarCache(self.cfg)
+
+        # Changes of the common config file are taken while running:
+        self.config_watcher = ConfigWatcher(self.cfg, self.sidecars)
+        if self.cfg.config_poll > 0:
+            self.config_watcher.start()
+
+        # Persistent metadata of the video files. Outdated entries are
+        # updated in the background:
+        metadata_filenam = self.cfg.metadata_filenam()
+        if metadata_filenam is None:
+            self.metadata = None
+        else:
+            self.metadata = MetadataIndex(metadata_filenam)
+            self.metadata.start()
+            print_verbose('metadata index "{}": {} videos known',
+                          VERBOSE_VIDEOINFO, metadata_filenam,
+                          len(self.metadata.entries))
+
+        # Lists of video files. Directories and playlists are expanded in
+        # the background, the playback starts with the first videos found:
+        sources = self.cfg.playlist_sources()
+        self.videos_idle = Playlist(CATEGORY_IDLE)
+        self.videos_cntdn = Playlist(CATEGORY_CNTDN)
+        self.videos_appl = Playlist(CATEGORY_APPL)
+        playlists = [self.videos_idle, self.videos_cntdn]
+        if len(sources[CATEGORY_APPL]) > 0:
+            playlists.append(self.videos_appl)
+        # The videos are checked in parallel before they are selected:
+        self.validator = VideoValidator(self.metadata,
+                                        self.cfg.validate_workers,
+                                        self.cfg.validate_retry)
+        # Changes of the video directories are taken while running:
+        if self.cfg.watch == 'off':
+            self.watcher = None
+        else:
+            self.watcher = DirectoryWatcher(self.validator, self.sidecars,
+                                            self.metadata, self.cfg.watch,
+                                            self.cfg.watch_poll)
+            self.watcher.start()
+        self.playlist_loader = PlaylistLoader(playlists, sources,
+                                              self.sidecars, self.metadata,
+                                              self.validator, self.watcher)
+        self.playlist_loader.start()
+        for playlist in playlists:
+            # Wait for the first playable video of each category:
+            while not playlist.playable.wait(0.1):
+                if playlist.complete and not self.validator.busy():
+                    break
+        if not self.videos_appl.playable.is_set():
+            # Take the idle videos. The selection of the applause videos
+            # is kept separately by its own VideoSelector:
+            self.videos_appl = self.videos_idle
+        self.selectors = {
+            CATEGORY_IDLE: VideoSelector(self.videos_idle,
+                                         self.cfg.randomindex_idle,
+                                         self.cfg.no_repeat, self.sidecars,
+                                         self.validator.is_good),
+            CATEGORY_CNTDN: VideoSelector(self.videos_cntdn,
+                                          self.cfg.randomindex_cntdn,
+                                          self.cfg.no_repeat, self.sidecars,
+                                          self.validator.is_good),
+            CATEGORY_APPL: VideoSelector(self.videos_appl,
+                                         self.cfg.randomindex_appl,
+                                         self.cfg.no_repeat, self.sidecars,
+                                         self.validator.is_good)}
+        # The next videos are read into the page cache in advance resp.
+        # copied into the staging directory:
+        self.prefetcher = PageCachePrefetcher()
+        self.prefetcher.start()
+        if self.cfg.staging_dir == '':
+            self.staging = None
+        else:
+            try:
+                self.staging = StagingCache(
+                                os.path.expanduser(self.cfg.staging_dir),
+                                self.cfg.staging_size * 1024 * 1024)
+            except OSError as e:
+                print_verbose('staging directory "{}" not usable, staging '
+                              'is off: {}', VERBOSE_WARNING,
+                              self.cfg.staging_dir, e)
+                self.staging = None
+            else:
+                self.staging.start()
+        self.prefetch_videos()
+
+        # Create a pool of omxplayer instances. Instances which are not
+        # playing are kept spawned and paused with the next videos to avoid
+        # the long-lasting omxplayer init at the transition of two videos:
+        pool_size = self.cfg.pool_size
+        if self.cfg.cntdn_mode == 'armed':
+            # The instance on the layer OMXLAYER[OMXINSTANCE_CNTDN] is kept
+            # paused at the start of the next countdown video. It isn't
+            # used for the idle and applause videos:
+            self.inst_armed = OMXINSTANCE_CNTDN
+            pool_size = max(pool_size, OMXINSTANCE_CNTDN + 1)
+        else:
+            self.inst_armed = OMXINSTANCE_NONE
+        self.armed = False # self.inst_armed is ready to play
+        self.inst_swapping = OMXINSTANCE_NONE # paused instance getting the
+                                              # countdown video (swap mode)
+        self.swap_warm = False # self.inst_swapping was taken from the pool
+        self.pl = [VideoPlayer(omxlayer(inst), self.backend)
+                   for inst in range(pool_size)]
+        # Hung omxplayer instances are killed by the watchdog:
+        self.watchdog = Watchdog(self.pl, self.cfg.dbus_timeout)
+        for pl in self.pl:
+            pl.clock.resync_interval = self.cfg.resync_interval
+            pl.watchdog = self.watchdog
+        if not self.watchdog.virtual:
+            self.watchdog.start()
 #        self.pl[OMXINSTANCE_VIDEO1].videosize = '260,50,1220,590' # DEBUG!
 #        self.pl[OMXINSTANCE_VIDEO2].videosize = '870,150,1830,690' # DEBUG!
+        self.warm = [] # paused instances with preloaded videos (FIFO order)
+        self.inst_waiting = OMXINSTANCE_NONE # instance to be started next
+        self.inst_running = OMXINSTANCE_NONE # instance started recently
+        self.loading = {} # instances being spawned by self.loader resp.
+                          # loaded by self.swapper: filenam
+        self.loader = PlayerLoader(self.sidecars, staging=self.staging)
+        self.loader.start()
+        gl_clock.watch(self.loader.settled)
+        # The countdown video of the swap mode doesn't wait for a spawn of
+        # the pool:
+        self.swapper = PlayerLoader(self.sidecars, 'PlayerSwapper',
+                                    self.staging)
+        self.swapper.start()
+        gl_clock.watch(self.swapper.settled)
+        # The status snapshots of all instances are queried in parallel:
+        self.tick = 0
+        self.status_executor = concurrent.futures.ThreadPoolExecutor(
+                                        max_workers=len(self.pl))
         
         # GPIO access:
-        self.gpio_buzzer = gpiozero.Button(17) # J8 pin 11
-        self.gpio_triggerpin = gpiozero.LED(7) # J8 pin 26
-        self.gpio_exitbtn = gpiozero.Button(23) # J8 pin 16
+        self.gpio_buzzer = self.backend.button(GPIO_BUZZER)
+        self.gpio_triggerpin = self.backend.led(GPIO_TRIGGERPIN)
+        self.gpio_exitbtn = self.backend.button(GPIO_EXITBTN)
+        self.trigger = TriggerScheduler(self.gpio_triggerpin)
+        if not self.trigger.virtual:
+            self.trigger.start()
+        self.inputs = ButtonInput({'buzzer': self.gpio_buzzer,
+                                   'exit': self.gpio_exitbtn},
+                                  self.cfg.debounce)
         
         
         # Initialisation of the state machine:
@@ -605,16 +4082,41 @@ class StateMachine:
         self.errmsg = ''
         self.state = STATE_SELECT_IDLE_VIDEO
         self.buzzer_enabled = 0 # True
+        self.last_state = STATE_EXIT
+        self.last_warnmsg = ''
+        self.last_errmsg = ''
+        self.buzzer_time = None # time of the buzzer press for the metrics
+        self.dark_since = None # no video visible since this time
+        self.visible = False # any video visible at the last tick
+        self.last_tick = None # start time of the last tick
+        self.overruns = 0 # ticks exceeding their deadline
+
+        # Export of the metrics:
+        self.exporter = MetricsExporter(self.cfg.metrics_file,
+                                        self.cfg.metrics_port,
+                                        self.cfg.metrics_interval)
+        self.exporter.start()
 
     def show_omxinstances(self, inst=OMXINSTANCE_NONE, press_enter=False):
         start = OMXINSTANCE_VIDEO1 if inst == OMXINSTANCE_NONE else inst
-        stop = (OMXINSTANCE_VIDEO2 if inst == OMXINSTANCE_NONE else inst) + 1
+        stop = len(self.pl) if inst == OMXINSTANCE_NONE else inst + 1
         for i in range(start, stop):
-            print_verbose('    omxplayer instance[{}]: "{}"'.format(
-                          i, self.pl[i].playback_status),
-                          VERBOSE_SHOW_INSTANCES)
+            if i == self.inst_running:
+                role = ' (running)'
+            elif i == self.inst_waiting:
+                role = ' (waiting)'
+            elif i in self.warm:
+                role = ' (warm {})'.format(self.pl[i].category)
+            elif i in self.loading:
+                role = ' ({})'.format(self.pl[i].category)
+            else:
+                role = ''
+            print_verbose('    omxplayer instance[{}]: "{}"{}',
+                          VERBOSE_SHOW_INSTANCES, i,
+                          self.pl[i].playback_status, role)
         if press_enter == True and gl_verbosity >= VERBOSE_SHOW_INSTANCES:
             print_verbose('--> press <ENTER>...', VERBOSE_SHOW_INSTANCES)
+            gl_log.flush()
             input()
         
     def state_name(self, state=-1):
@@ -634,191 +4136,340 @@ class StateMachine:
             name = 'STATE_SELECT_APPL_VIDEO'
         elif state == STATE_SELECT_IDLE_VIDEO:
             name = 'STATE_SELECT_IDLE_VIDEO'
-        elif state == STATE_START_IDLE1_VIDEO:
-            name = 'STATE_START_IDLE1_VIDEO'
-        elif state == STATE_PLAY_IDLE1_VIDEO:
-            name = 'STATE_PLAY_IDLE1_VIDEO'
-        elif state == STATE_START_IDLE2_VIDEO:
-            name = 'STATE_START_IDLE2_VIDEO'
-        elif state == STATE_PLAY_IDLE2_VIDEO:
-            name = 'STATE_PLAY_IDLE2_VIDEO'
+        elif state == STATE_START_IDLE_VIDEO:
+            name = 'STATE_START_IDLE_VIDEO'
+        elif state == STATE_PLAY_IDLE_VIDEO:
+            name = 'STATE_PLAY_IDLE_VIDEO'
         else:
             name = '<unknown state {}>'.format(state)
         return name
 
-    def random_video(self, order, state=STATE_EXIT):
-        if state == STATE_EXIT: # If so, take current state of state machine
+    def state_category(self, state=-1):
+        # Video category which is requested by a state of the state machine:
+        if state == -1:
             state = self.state
-        if state == STATE_SELECT_IDLE_VIDEO:
-            length = len(self.videos_idle)
-            if length <= 0:
-                index = -1
-                filenam = None
-            elif self.randomindex_idle < 0:
-                # random selection:
-                index = random.randint(0, length - 1)
-            else:
-                # continuous selection:
-                index = self.randomindex_idle
-                filenam = self.videos_idle[index]
-                self.randomindex_idle += order
-                if self.randomindex_idle >= length:
-                    self.randomindex_idle = 0
-                if self.randomindex_idle < 0:
-                    self.randomindex_idle = length - 1
-        elif state == STATE_SELECT_APPL_VIDEO:
-            length = len(self.videos_appl)
-            if length <= 0:
-                index = -1
-                filenam = None
-            elif self.randomindex_appl < 0:
-                # random selection:
-                index = random.randint(0, length - 1)
-            else:
-                # continuous selection:
-                index = self.randomindex_appl
-                filenam = self.videos_appl[index]
-                self.randomindex_appl += 1
-                if self.randomindex_appl >= length:
-                    self.randomindex_appl = 0
-                if self.randomindex_appl < 0:
-                    self.randomindex_appl = length - 1
+        if state == STATE_SELECT_APPL_VIDEO:
+            category = CATEGORY_APPL
         elif state == STATE_SELECT_CNTDN_VIDEO or \
              state == STATE_PREPARE_CNTDN_VIDEO:
-            length = len(self.videos_cntdn)
-            if length <= 0:
-                index = -1
-                filenam = None
-            elif self.randomindex_cntdn < 0:
-                # random selection:
-                index = random.randint(0, length - 1)
-            else:
-                # continuous selection:
-                index = self.randomindex_cntdn
-                filenam = self.videos_cntdn[index]
-                self.randomindex_cntdn += 1
-                if self.randomindex_cntdn >= length:
-                    self.randomindex_cntdn = 0
-                if self.randomindex_cntdn < 0:
-                    self.randomindex_cntdn = length - 1
-        else: # invalid state of state machine
-            index = -2
-            filenam = None
-        return [index, filenam]
+            category = CATEGORY_CNTDN
+        else:
+            category = CATEGORY_IDLE
+        return category
+
+    def random_video(self, category):
+        # Take the next video of the category. The selector only draws the
+        # videos validated as playable:
+        self.validator.retry_due()
+        selector = self.selectors[category]
+        video = selector.next()
+        if video[VID_INDEX] >= 0:
+            return video
+        # Rather try a file again the omxplayer failed on than stopping:
+        for index in range(len(selector.playlist)):
+            if self.validator.load_failed(selector.playlist[index]):
+                return selector.video(index)
+        return [-1, None]
+
+    def is_fading(self):
+        for pl in self.pl:
+            if pl.is_fading:
+                return True
+        return False
 
     def get_free_idle_instance(self):
-        if self.pl[OMXINSTANCE_VIDEO1].playback_status == 'None' or \
-           self.pl[OMXINSTANCE_VIDEO1].playback_status == 'Stopped' or \
-           self.pl[OMXINSTANCE_VIDEO1].playback_status[0:9] == 'Exception':
-               inst = OMXINSTANCE_VIDEO1
-        elif self.pl[OMXINSTANCE_VIDEO2].playback_status == 'None' or \
-             self.pl[OMXINSTANCE_VIDEO2].playback_status == 'Stopped' or \
-             self.pl[OMXINSTANCE_VIDEO2].playback_status[0:9] == 'Exception':
-               inst = OMXINSTANCE_VIDEO2
-        else:
-               # There is no free idle-instance to init with a new video file:
-               inst = OMXINSTANCE_NONE
+        # A free slot of the pool is neither spawned nor part of the
+        # video sequence:
+        for inst in range(len(self.pl)):
+            if self.pl[inst].omxplayer is None and \
+               inst != self.inst_armed and \
+               inst != self.inst_running and \
+               inst != self.inst_waiting and \
+               inst not in self.warm and \
+               inst not in self.loading:
+                return inst
+        # There is no free idle-instance to init with a new video file:
+        return OMXINSTANCE_NONE
+
+    def take_warm_instance(self, category):
+        # Take the oldest warm instance of the pool with the requested
+        # video category:
+        for inst in self.warm:
+            if self.pl[inst].category == category:
+                self.warm.remove(inst)
+                return inst
+        return OMXINSTANCE_NONE
+
+    def evict_warm_instance(self):
+        # Unload the most recently preloaded instance of the pool to get a
+        # free slot for a video of another category:
+        if len(self.warm) == 0:
+            return OMXINSTANCE_NONE
+        inst = self.warm.pop()
+        print_verbose('evicting warm omxplayer instance[{}] ({} video "{}")',
+                      VERBOSE_STATE, inst, self.pl[inst].category,
+                      self.pl[inst].filenam)
+        # Put the video back to keep the given order:
+        self.selectors[self.pl[inst].category].undo(self.pl[inst].video_index)
+        self.pl[inst].unload_omxplayer()
         return inst
 
-    def select_video(self, filenam):
-        inst = self.get_free_idle_instance()
+    def video_cfg(self, filenam):
+        # Parameters of a single video: sidecar file or common config
+        cfg = self.sidecars.get(filenam)
+        return self.cfg if cfg is None else cfg
+
+    def assign_video_params(self, inst):
+        # Copy the parameters of the video category onto the instance:
+        cfg = self.video_cfg(self.pl[inst].filenam)
+        if self.pl[inst].category == CATEGORY_CNTDN:
+            self.pl[inst].fadetime_start = cfg.fadetime_start_cntdn
+            self.pl[inst].fadetime_end = cfg.fadetime_end_cntdn
+            self.pl[inst].alpha_start = cfg.alpha_start_cntdn
+            self.pl[inst].alpha_play = cfg.alpha_play_cntdn
+            self.pl[inst].alpha_end = cfg.alpha_end_cntdn
+            self.pl[inst].fadecurve = cfg.fadecurve_cntdn
+            
+            # The GPIO trigger pin marks the CNTDN video sequence:
+            self.pl[inst].gpio_pin = self.trigger
+            self.pl[inst].gpio_on = cfg.gpio_on_cntdn
+            self.pl[inst].gpio_off = cfg.gpio_off_cntdn
+        else:
+            self.pl[inst].fadetime_start = cfg.fadetime_start_idle
+            self.pl[inst].fadetime_end = cfg.fadetime_end_idle
+            self.pl[inst].alpha_start = cfg.alpha_start_idle
+            self.pl[inst].alpha_play = cfg.alpha_play_idle
+            self.pl[inst].alpha_end = cfg.alpha_end_idle
+            self.pl[inst].fadecurve = cfg.fadecurve_idle
+        self.pl[inst].alpha_step = cfg.alpha_step
+        self.pl[inst].volume_step = cfg.volume_step
+        self.pl[inst].prepare_envelopes()
+        self.pl[inst].last_alpha = 0
+
+    def select_video(self, filenam, inst=OMXINSTANCE_NONE):
+        if inst == OMXINSTANCE_NONE:
+            inst = self.get_free_idle_instance()
         if inst <= OMXINSTANCE_NONE:
             self.warnmsg = 'No free omxplayer instance available for ' \
                            'file "{}".'.format(filenam)
-        else: # A free omxplayer instance is available:
-            if self.state == STATE_SELECT_IDLE_VIDEO or \
-               self.state == STATE_SELECT_APPL_VIDEO:
-                self.pl[inst].fadetime_start = self.cfg.fadetime_start_idle
-                self.pl[inst].fadetime_end = self.cfg.fadetime_end_idle
-                self.pl[inst].alpha_start = self.cfg.alpha_start_idle
-                self.pl[inst].alpha_play = self.cfg.alpha_play_idle
-                self.pl[inst].alpha_end = self.cfg.alpha_end_idle
-                self.pl[inst].last_alpha = 0
-            elif self.state == STATE_SELECT_CNTDN_VIDEO:
-                self.pl[inst].fadetime_start = self.cfg.fadetime_start_cntdn
-                self.pl[inst].fadetime_end = self.cfg.fadetime_end_cntdn
-                self.pl[inst].alpha_start = self.cfg.alpha_start_cntdn
-                self.pl[inst].alpha_play = self.cfg.alpha_play_cntdn
-                self.pl[inst].alpha_end = self.cfg.alpha_end_cntdn
-                self.pl[inst].last_alpha = 0
-                
-                # This is necessary if self.state_prepare_cntdn_video()
-                # gave the responsibility to load a CNTDN video sequence
-                # to self.state_select_idle_video(). This usually happens
-                # when the buzzer is pressed during active fading between
-                # two video sequences.
-                # TODO: update default parameters for CNTDN
-                self.pl[inst].gpio_pin = self.gpio_triggerpin
-                self.pl[inst].gpio_on = self.cfg.gpio_on_cntdn
-                self.pl[inst].gpio_off = self.cfg.gpio_off_cntdn
-            else:    
-                inst = OMXINSTANCE_ERR_WRONG_STATE
 
         if inst > OMXINSTANCE_NONE:
-            print_verbose('+++ initiate new omxplayer instance[{}] +++'.format(
-                              inst),
-                          VERBOSE_SHOW_INSTANCES) # Debug!
+            print_verbose('+++ initiate new omxplayer instance[{}] +++',
+                          VERBOSE_SHOW_INSTANCES, inst) # Debug!
             self.show_omxinstances() # Debug!
             
             # Initialise a new omxplayer instance with given video file:
             dbus_path = 'org.mpris.MediaPlayer2.omxplayer{}_{}' \
                         .format(os.getpid(), inst)
             
-            # On an RPi1 or RPi0 this omxplayer init takes about 2.5s - 3.0s!
-            ret = self.pl[inst].load_omxplayer(
+            # The omxplayer init is done by the loader thread. The instance
+            # is picked up by self.collect_loaded_instances() when ready:
+            self.loading[inst] = filenam
+            self.loader.request(
+                    inst, self.pl[inst],
                     filenam,
                     ['--win', self.pl[inst].videosize,
                      '--aspect-mode', 'letterbox',
-                     '--layer', OMXLAYER[inst],
-                     '--alpha', self.pl[inst].last_alpha,
+                     '--layer', self.pl[inst].layer,
+                     '--alpha', 0,
                      '--vol', '-10000'
                     ] + self.omxplayer_cmdlin_params,
-                    dbus_name=dbus_path,
-                    pause=True)
-            
+                    dbus_path,
+                    self.video_duration(filenam),
+                    self.staged_path(filenam))
+        return inst
+
+    def staged_path(self, filenam):
+        # The copy of the video in the staging cache or None:
+        if self.staging is None or filenam is None:
+            return None
+        path = self.staging.lookup(filenam)
+        if gl_verbosity >= VERBOSE_VIDEOINFO and \
+           (self.staging.hits + self.staging.misses) % \
+           STAGING_STATS_LOOKUPS == 0:
+            print_verbose('{}', VERBOSE_VIDEOINFO, self.staging.stats())
+        return path if path != filenam else None
+
+    def video_duration(self, filenam):
+        # Duration from the metadata index or None if unknown:
+        if self.metadata is None or filenam is None:
+            return None
+        return self.metadata.duration(filenam)
+
+    def load_errmsg(self, ret, inst, filenam):
+        # omxplayer errors:
+        if ret == 1:
+            errmsg = 'ret=={}: ' \
+                'omxplayer initialisation of instance[{}] ' \
+                'with video "{}" failed.'.format(ret, inst, filenam)
+        elif ret == 2:
+            errmsg = 'ret=={}: ' \
+                'The video duration of instance[{}] ' \
+                'with video "{}" couln\'t be ' \
+                'evaluated.'.format(ret, inst, filenam)
+        elif ret == 3:
+            errmsg = 'ret=={}: ' \
+                'Another omxplayer instance[{}] is already ' \
+                'running.'.format(ret, inst)
+        # file access errors:
+        elif ret == 10:
+            errmsg = 'ret=={}: ' \
+                'No playable video was found, ' \
+                'e.g. due to empty video list.'.format(ret)
+        elif ret == 11:
+            errmsg = 'ret=={}: ' \
+                'File "{}" not found.'.format(ret, filenam)
+        elif ret == 12:
+            errmsg = 'ret=={}: ' \
+                'File "{}" is a directory.'.format(ret, filenam)
+        elif ret == 13:
+            errmsg = 'ret=={}: ' \
+                'Read permission denied to file ' \
+                '"{}".'.format(ret, filenam)
+        elif ret == 14:
+            errmsg = 'ret=={}: ' \
+                'File "{}" is not a playable video ({}).'.format(
+                    ret, filenam, self.pl[inst].precheck_error)
+        else:
+            errmsg = 'ret=={}: ' \
+                'Unknown error at initialisation of instance[{}] ' \
+                'with video "{}".'.format(ret, inst, filenam)
+        return errmsg
+
+    def collect_loaded_instances(self):
+        # Pick up the instances spawned by the loader thread:
+        for inst, ret in self.loader.completed() + \
+                         self.swapper.completed():
+            filenam = self.loading.pop(inst, None)
             if ret == 0:
-                print_verbose(
-                    'instance[{}] initialised with video "{}" '.format(
-                        inst,
-                        filenam),
-                    VERBOSE_VIDEOINFO)
+                print_verbose('instance[{}] initialised with video "{}" ',
+                              VERBOSE_VIDEOINFO, inst, filenam)
+                if self.metadata is not None and \
+                   self.video_duration(filenam) is None:
+                    self.metadata.learn(filenam,
+                                        duration=self.pl[inst].duration)
+                if inst == self.inst_armed:
+                    self.armed = True
+                elif inst != self.inst_swapping:
+                    self.warm.append(inst)
+            elif ret in LOAD_ERRORS or (ret >= 11 and ret <= 14):
+                # A bad video file is skipped. The free slot is filled with
+                # another video on the next tick:
+                if ret in LOAD_ERRORS and not self.pl[inst].killed:
+                    # Not counted by the watchdog yet:
+                    self.watchdog.count()
+                if self.pl[inst].omxplayer is not None:
+                    # spawned but without duration (ret 2):
+                    self.pl[inst].unload_omxplayer()
+                self.validator.failed(filenam, ret)
             else:
-                inst = OMXINSTANCE_ERR_NO_VIDEO
-                # omxplayer errors:
-                if ret == 1:
-                    self.errmsg = 'ret=={}: ' \
-                        'omxplayer initialisation of instance[{}] ' \
-                        'with video "{}" failed.'.format(ret, inst, filenam)
-                elif ret == 2:
-                    self.errmsg = 'ret=={}: ' \
-                        'The video duration of instance[{}] ' \
-                        'with video "{}" couln\'t be ' \
-                        'evaluated.'.format(ret, inst, filenam)
-                elif ret == 3:
-                    self.errmsg = 'ret=={}: ' \
-                        'Another omxplayer instance[{}] is already ' \
-                        'running.'.format(ret, inst)
-                # file access errors:
-                elif ret == 10:
-                    self.errmsg = 'ret=={}: ' \
-                        'No video filename was given, ' \
-                        'e.g. due to empty video list.'.format(ret)
-                elif ret == 11:
-                    self.errmsg = 'ret=={}: ' \
-                        'File "{}" not found.'.format(ret, filenam)
-                elif ret == 12:
-                    self.errmsg = 'ret=={}: ' \
-                        'File "{}" is a directory.'.format(ret, filenam)
-                elif ret == 13:
-                    self.errmsg = 'ret=={}: ' \
-                        'Read permission denied to file ' \
-                        '"{}".'.format(ret, filenam)
-                else:
-                    self.errmsg = 'ret=={}: ' \
-                        'Unknown error at initialisation of instance[{}] ' \
-                        'with video "{}".'.format(ret, inst, filenam)
+                self.errmsg = self.load_errmsg(ret, inst, filenam)
+                self.exitcode = 1
+                self.state = STATE_ERROR
+
+    def is_loading(self, category):
+        for inst in self.loading:
+            if self.pl[inst].category == category:
+                return True
+        return False
+
+    def prefetch_videos(self):
+        # Follow the selection: read the next idle videos into the page
+        # cache and keep the next countdown video locked in memory. With a
+        # staging directory they are copied there instead:
+        if self.staging is not None:
+            idle = self.selectors[CATEGORY_IDLE].peek(
+                                                max(1, self.cfg.prefetch))
+            cntdn = self.selectors[CATEGORY_CNTDN].peek(1)
+            self.staging.stage([v[VID_FILENAM] for v in idle
+                                if v[VID_FILENAM] is not None],
+                               [v[VID_FILENAM] for v in cntdn
+                                if v[VID_FILENAM] is not None])
+            return
+        if self.cfg.prefetch > 0:
+            videos = self.selectors[CATEGORY_IDLE].peek(self.cfg.prefetch)
+            self.prefetcher.prefetch([v[VID_FILENAM] for v in videos
+                                      if v[VID_FILENAM] is not None])
+        videos = []
+        if self.cfg.pin_budget > 0:
+            videos = self.selectors[CATEGORY_CNTDN].peek(1)
+        self.prefetcher.pin([v[VID_FILENAM] for v in videos
+                             if v[VID_FILENAM] is not None],
+                            self.cfg.pin_budget * 1024 * 1024)
+
+    def load_pool_instance(self, category):
+        # Request a paused omxplayer instance with the next video of the
+        # given category for a free slot. It becomes a warm instance when
+        # the loader thread has finished:
+        inst = self.get_free_idle_instance()
+        if inst > OMXINSTANCE_NONE:
+            video = self.random_video(category)
+            if video[VID_FILENAM] is None and self.validator.busy():
+                # No playable video known yet. Try again on the next tick:
+                return OMXINSTANCE_NONE
+            self.pl[inst].category = category
+            self.pl[inst].video_index = video[VID_INDEX]
+            inst = self.select_video(video[VID_FILENAM], inst)
+            self.prefetch_videos()
         return inst
 
+    def arm_cntdn_instance(self):
+        # Keep the countdown instance loaded with the next countdown video
+        # and paused at its start. It is re-armed after each countdown:
+        if self.inst_armed == OMXINSTANCE_NONE or self.is_fading() or \
+           self.pl[self.inst_armed].omxplayer is not None or \
+           self.inst_armed in self.loading or \
+           self.inst_armed == self.inst_running or \
+           self.inst_armed == self.inst_waiting:
+            return
+        inst = self.inst_armed
+        video = self.random_video(CATEGORY_CNTDN)
+        if video[VID_FILENAM] is None:
+            # No playable countdown video known (yet):
+            return
+        print_verbose('arming countdown omxplayer instance[{}]', VERBOSE_STATE,
+                      inst)
+        self.pl[inst].category = CATEGORY_CNTDN
+        self.pl[inst].video_index = video[VID_INDEX]
+        self.select_video(video[VID_FILENAM], inst)
+        self.prefetch_videos()
+
+    def start_armed_cntdn_video(self):
+        # Start the pre-armed countdown instance: Only play() and the
+        # fading are left to do.
+        inst = self.inst_armed
+        self.armed = False
+        print_verbose('starting armed countdown omxplayer instance[{}] '
+                      'with video "{}"', VERBOSE_STATE, inst,
+                      self.pl[inst].filenam)
+        self.assign_video_params(inst)
+        if self.inst_waiting != OMXINSTANCE_NONE:
+            # The waiting idle instance goes back to the pool and will be
+            # played after the countdown:
+            self.warm.insert(0, self.inst_waiting)
+        self.inst_waiting = inst
+        if self.inst_running != OMXINSTANCE_NONE and \
+           self.pl[self.inst_running].playback_status == 'Playing':
+            # Fade out the running idle video sequence at once with the
+            # fade-out time of the countdown video:
+            self.pl[self.inst_running].fadetime_start = 0
+            self.pl[self.inst_running].fadetime_end = \
+                self.pl[inst].fadetime_end
+            self.shorten_duration(self.inst_running)
+        self.state = STATE_START_IDLE_VIDEO
+
+    def prefill_pool(self):
+        # Keep the next idle videos spawned in the free slots of the pool.
+        # Spawning an omxplayer costs a lot of CPU time on an RPi0/RPi1.
+        # So the pool isn't filled up while a video is fading:
+        if self.is_fading() or len(self.loading) > 0 or \
+           self.get_free_idle_instance() == OMXINSTANCE_NONE:
+            return
+        inst = self.load_pool_instance(CATEGORY_IDLE)
+        if inst > OMXINSTANCE_NONE:
+            print_verbose('preloading omxplayer instance[{}] into the pool',
+                          VERBOSE_STATE, inst)
+
     def shorten_duration(self, inst):
         ## original from self.state_prepare_cntdn_video()
         #self.pl[inst_playing].duration = \
@@ -827,61 +4478,121 @@ class StateMachine:
         #    + self.timeslot
         if self.pl[inst].playback_status == 'Playing' or \
            self.pl[inst].playback_status == 'Paused':
-            try:
+            # Take the extrapolated position of the playback clock:
+            self.pl[inst].updt_playback_status(self.tick)
+            if self.pl[inst].position >= 0:
                 self.pl[inst].duration = \
-                              self.pl[inst].omxplayer.position() \
+                              self.pl[inst].current_position() \
                               + self.pl[inst].fadetime_end \
                               + self.timeslot
-            except Exception:
-                # Don't mind if it doesn't work 
-                # due to some rare error conditions(?)
-                # caused by bad timing(?) of buzzer pressure.
-                pass
+
+    def active_instances(self):
+        # Instances taking part in the video sequence. Warm instances of the
+        # pool and the armed countdown instance are paused and need no
+        # service:
+        return [inst for inst in range(len(self.pl))
+                if self.pl[inst].omxplayer is not None and
+                   inst not in self.warm and
+                   inst not in self.loading and
+                   not (inst == self.inst_armed and self.armed)]
+
+    def refresh_status(self, insts):
+        # Take a status snapshot of the given instances for the current
+        # tick. The D-Bus round trips of the instances which need one are
+        # done in parallel, the others are extrapolated below:
+        now = gl_clock.monotonic()
+        queried = [inst for inst in insts
+                   if self.pl[inst].status_tick != self.tick and
+                      self.pl[inst].needs_query(now)]
+        if len(queried) > 1:
+            futures = [self.status_executor.submit(
+                                self.pl[inst].updt_playback_status, self.tick)
+                       for inst in queried]
+            for future in futures:
+                future.result()
+        for inst in insts:
+            # This returns the snapshot if it has been already taken:
+            self.pl[inst].updt_playback_status(self.tick)
 
     def manage_players(self):
-        self.pl[self.manage_instance].updt_playback_status()
+        insts = self.active_instances()
+        self.refresh_status(insts)
+        for inst in insts:
+            self.manage_player(inst)
+        self.measure_visibility(insts)
+
+    def measure_visibility(self, insts):
+        # Metrics of the buzzer latency and the gaps between two videos:
+        visible = [inst for inst in insts if self.pl[inst].last_alpha > 0]
+        now = gl_clock.monotonic()
+        if len(visible) == 0:
+            if self.visible:
+                self.dark_since = now
+        elif self.dark_since is not None:
+            gl_metrics.black_gap.observe(now - self.dark_since)
+            self.dark_since = None
+        self.visible = len(visible) > 0
+        if self.buzzer_time is not None:
+            for inst in visible:
+                if self.pl[inst].category == CATEGORY_CNTDN:
+                    gl_metrics.buzzer.observe(now - self.buzzer_time)
+                    print_verbose('countdown video visible {:.3f}s after '
+                                  'the buzzer press', VERBOSE_DEBUG,
+                                  now - self.buzzer_time)
+                    self.buzzer_time = None
+                    break
+
+    def manage_player(self, inst):
         # Delete finished omxplayer instance: 
-        if self.pl[self.manage_instance].playback_status == 'Stopped' or \
-           self.pl[self.manage_instance].playback_status[0:9] == 'Exception':
+        if self.pl[inst].playback_status == 'Stopped' or \
+           self.pl[inst].playback_status[0:9] == 'Exception':
             print_verbose('--- unload omxplayer instance @self.manage_players() '
                           '---',
                           VERBOSE_SHOW_INSTANCES) # Debug!
             self.show_omxinstances() # Debug!
             print_verbose('unloading omxplayer instance[{}]'
-                              ' ({})'.format(self.manage_instance, 
-                              self.pl[self.manage_instance].playback_status),
-                          VERBOSE_STATE)
-            self.pl[self.manage_instance].unload_omxplayer()
+                          ' ({})', VERBOSE_STATE, inst,
+                          self.pl[inst].playback_status)
+            if gl_verbosity >= VERBOSE_DEBUG:
+                print_verbose('instance[{}] playback clock: {}',
+                              VERBOSE_DEBUG, inst,
+                              self.pl[inst].clock.drift_info())
+            print_verbose('instance[{}] fadings: {} alpha and {} volume '
+                          'updates', VERBOSE_DEBUG, inst,
+                          self.pl[inst].alpha_updates,
+                          self.pl[inst].volume_updates)
+            self.pl[inst].unload_omxplayer()
+            # Hand the slot back to the pool:
+            if inst == self.inst_running:
+                self.inst_running = OMXINSTANCE_NONE
+            if inst == self.inst_waiting:
+                self.inst_waiting = OMXINSTANCE_NONE
             self.show_omxinstances() # Debug!
             print_verbose('', VERBOSE_SHOW_INSTANCES) # Debug!
             # Enable buzzer if CNTDN video has been completely
             # finished and unloaded:
-            if type(self.pl[self.manage_instance].gpio_pin) \
-               == gpiozero.output_devices.LED:
+            if self.pl[inst].gpio_pin is not None:
                 self.buzzer_enabled = 10 # True in 5 * self.timeslot (counter)
                 print_verbose('   buzzer re-enabled because '
                               'countdown video sequence has been ended.',
                           VERBOSE_GPIO)
+                self.trigger.finish()
                 # remove gpio_pin as marker of the CNTDN video:
-                self.pl[self.manage_instance].gpio_pin = None
-                self.pl[self.manage_instance].gpio_on = 0
-                self.pl[self.manage_instance].gpio_off = 0
+                self.pl[inst].gpio_pin = None
+                self.pl[inst].gpio_on = 0
+                self.pl[inst].gpio_off = 0
 
         
         # Check if position > shortened duration
         # due to requested CNTDN video sequence (i.e. pressure of buzzer):
-        if self.pl[self.manage_instance].playback_status == 'Playing':
-            if self.pl[self.manage_instance].position \
-               > (self.pl[self.manage_instance].duration + 2 * self.timeslot):
-                   self.pl[self.manage_instance].omxplayer.quit()
+        if self.pl[inst].playback_status == 'Playing':
+            if self.pl[inst].position \
+               > (self.pl[inst].duration + 2 * self.timeslot):
+                   self.pl[inst].command(self.pl[inst].omxplayer.quit)
         
 
         # Video fading:
-        self.pl[self.manage_instance].fade()
-
-        self.manage_instance += 1
-        if self.manage_instance >= len(self.pl):
-            self.manage_instance = 0
+        self.pl[inst].fade()
 
     #### Common states ####
     def state_error(self):
@@ -889,23 +4600,47 @@ class StateMachine:
 
     #### video states ####
     def state_prepare_cntdn_video(self):
-        if False == \
-           self.pl[OMXINSTANCE_VIDEO1].is_fading or \
-           self.pl[OMXINSTANCE_VIDEO2].is_fading: # "not fading" condition:
+        if self.inst_swapping != OMXINSTANCE_NONE:
+            if self.inst_swapping not in self.loading:
+                self.finish_cntdn_swap()
+            elif self.inst_waiting != OMXINSTANCE_NONE and \
+                 self.inst_waiting != self.inst_swapping and \
+                 self.running_video_ending():
+                # The countdown video is being loaded. Meanwhile the idle
+                # videos go on:
+                self.start_waiting_video()
+            return
+        if self.inst_armed != OMXINSTANCE_NONE and not self.is_fading():
+            if self.armed:
+                self.start_armed_cntdn_video()
+                return
+            if self.inst_armed in self.loading:
+                # The countdown instance is being armed: Wait for it.
+                return
+            # Otherwise no countdown video could be armed. Try it by the
+            # instances of the pool:
+        if not self.is_fading():
             # To replace the file of a waiting ('Paused') omxplayer instance
             # there must be one instance 'Paused' and the other one 'Playing':
+            inst_playing = self.inst_running \
+                           if self.inst_running != OMXINSTANCE_NONE and \
+                           self.pl[self.inst_running].playback_status \
+                           == 'Playing' \
+                           else -1
+            # Prefer the most recently preloaded idle instance of the pool
+            # because its video is the last one taken from the idle list:
             inst_paused = -1
-            inst_playing = -1
-            inst_none = 0 # count how many instances are 'omxplayer is None'
-            for inst in range(OMXINSTANCE_VIDEO1, OMXINSTANCE_VIDEO2 + 1):
-                playback_status = self.pl[inst].playback_status
-                if playback_status == 'Paused':
+            inst_paused_warm = False
+            for inst in reversed(self.warm):
+                if self.pl[inst].category != CATEGORY_CNTDN and \
+                   self.pl[inst].playback_status == 'Paused':
                     inst_paused = inst
-                    inst_paused_playback_status = playback_status
-                if playback_status == 'Playing':    
-                    inst_playing = inst
-                if playback_status == 'None':
-                    inst_none += 1
+                    inst_paused_warm = True
+                    break
+            if inst_paused < 0 and \
+               self.inst_waiting != OMXINSTANCE_NONE and \
+               self.pl[self.inst_waiting].playback_status == 'Paused':
+                inst_paused = self.inst_waiting
     
             if inst_paused >= 0 and inst_playing >= 0:
                 print_verbose('::: prepare countdown video '
@@ -915,9 +4650,8 @@ class StateMachine:
     
                 ######## Handle 'Paused' omxplayer instance ########
                 print_verbose('changing paused omxplayer instance[{}] from '
-                                'idle to countdown video sequence.'.format(
-                                inst_paused), 
-                                VERBOSE_STATE)
+                              'idle to countdown video sequence.',
+                              VERBOSE_STATE, inst_paused)
                 
                 # Due to some weird behaviour of the omxplayer and/or
                 # https://github.com/willprice/python-omxplayer-wrapper v0.3.3
@@ -927,185 +4661,195 @@ class StateMachine:
                 
                 # Workaround -- a so-called Würgaround in Denglish language :-)
                 # 1st: Make the waiting (paused) idle video sequence invisible:
-                self.pl[inst_paused].omxplayer.set_alpha(0)
+                self.pl[inst_paused].command(
+                                self.pl[inst_paused].omxplayer.set_alpha, 0)
                 # 2nd: Start playback of waiting idle video sequence:
-                self.pl[inst_paused].omxplayer.play()
+                self.pl[inst_paused].play()
                 # 3rd: Replace video file via .load() method:
-                video = self.random_video(+1)
-                self.random_video(-1, STATE_SELECT_IDLE_VIDEO) #keep idle order
-                # todo: update default parameters for CNTDN
-                self.pl[inst_paused].gpio_pin = self.gpio_triggerpin
-                self.pl[inst_paused].gpio_on = self.cfg.gpio_on_cntdn
-                self.pl[inst_paused].gpio_off = self.cfg.gpio_off_cntdn
-                # todo: load video-specific meta file
-                print_verbose('file to exchange: "{}"'.format(
-                        video[VID_FILENAM]),
-                    VERBOSE_DEBUG) # todo: try-catch wrong filename!
-                # Catch some well-known long-lasting error conditions:
-                ret = 0
+                video = self.random_video(CATEGORY_CNTDN)
+                # Put the replaced video back to keep its order:
+                self.selectors[self.pl[inst_paused].category].undo(
+                                            self.pl[inst_paused].video_index)
+                print_verbose('file to exchange: "{}"', VERBOSE_DEBUG,
+                              video[VID_FILENAM])
+                # Measured by the prefetcher when the video was pinned:
+                cached = self.prefetcher.resident.get(video[VID_FILENAM])
+                if cached is not None:
+                    print_verbose('{:.1f} of {:.1f} MB of the countdown '
+                                  'video in the page cache', VERBOSE_DEBUG,
+                                  cached[0] / 1048576, cached[1] / 1048576)
+                self.prefetch_videos() # lock the next countdown video
+                # The countdown videos have been validated in the background.
+                # Only if there is no playable one at all it's an error:
                 if video[VID_FILENAM] is None:
-                    # No video filename was given, e.g. due to empty video list:
-                    ret = 10
-                elif not os.path.exists(video[VID_FILENAM]):
-                    # Given filename doesn't exist:
-                    ret = 11
-                elif os.path.isdir(video[VID_FILENAM]):
-                #elif os.path.ismount(filenam) or os.path.isdir(filenam):
-                    # Given filename is a (mount point) directory:
-                    ret = 12
-                elif not os.access(video[VID_FILENAM], os.R_OK):
-                    # Read permission denied to filenam:
-                    ret = 13
-                if ret != 0:
-                    # An error occurred when selecting the CNTDN video sequence
-                    if ret == 10:
-                        self.errmsg = 'ret=={}: ' \
-                            'No countdown video filename was given ' \
-                            'due to empty countdown video list.'.format(
-                                ret)
-                    elif ret == 11:
-                        self.errmsg = 'ret=={}: ' \
-                            'Countdown video file "{}" not found.'.format(
-                                ret,
-                                video[VID_FILENAM])
-                    elif ret == 12:
-                        self.errmsg = 'ret=={}: ' \
-                            'Countdown video file "{}" is a directory.'.format(
-                                ret,
-                                video[VID_FILENAM])
-                    elif ret == 13:
-                        self.errmsg = 'ret=={}: ' \
-                            'Read permission denied to countdown video file ' \
-                            '"{}".'.format(
-                                ret,
-                                video[VID_FILENAM])
-                    else:
-                        self.errmsg = 'ret=={}: ' \
-                            'Unknown error at initialisation of countdown ' \
-                            'video instance[{}] with file "{}".'.format(
-                                ret,
-                                inst_paused,
-                                video[VID_FILENAM])
+                    self.errmsg = 'ret==10: No playable countdown video ' \
+                                  'was found.'
                     self.state = STATE_ERROR
                 else: # The video file seems to be (almost) OK :-)
-                    self.pl[inst_paused].omxplayer.load(video[VID_FILENAM],
-                                                        True)
-                    # 4th: really important!
-                    #   Adjust inst.duration to length of CNTDN video sequence!
-                    self.pl[inst_paused].duration = \
-                         self.pl[inst_paused].omxplayer.duration()
-                    # 5th: Set next state:
-                    #   skip STATE_SELECT_CNTDN_VIDEO because it was done here:
-                    if inst_paused == OMXINSTANCE_VIDEO1:
-                        self.state = STATE_START_IDLE1_VIDEO
-                    elif inst_paused == OMXINSTANCE_VIDEO2:
-                        self.state = STATE_START_IDLE2_VIDEO
-                    
-                    ######## Handle 'Playing' omxplayer instance ########
-                    print_verbose('shorten playing idle omxplayer ' \
-                                    'instance[{}] due to requested start ' \
-                                    'of countdown video.'.format(
-                                        inst_playing), 
-                                        VERBOSE_STATE)
-                    
-                    print_verbose('original OMXINSTANCE_VIDEO[{}] before '
-                                  'start of countdown video:\n'
-                                  '  fadetime_start=={}\n'
-                                  '  fadetime_end=={}\n'
-                                  '  position=={}\n'
-                                  '  duration=={}'.format(inst_playing,
-                                        self.pl[inst_playing].fadetime_start,
-                                        self.pl[inst_playing].fadetime_end,
-                                        self.pl[inst_playing].position,
-                                        self.pl[inst_playing].duration),
-                                  VERBOSE_DEBUG)
-                    # Initiate now fading of idle video sequence
-                    # due to requested CNTDN:
-                    
-                    # Exit from eventually fading-in:
-                    self.pl[inst_playing].fadetime_start = 0
-                    # Adjust the fade-out time of the running idle video
-                    # sequence to the defined fade-out time of the planned
-                    # CNTDN video sequence:
-                    self.pl[inst_playing].fadetime_end = \
-                         self.cfg.fadetime_end_cntdn # todo!
-                    # Shorten the duration of the running idle video sequence
-                    # to "now" + fade_out time of CNTDN video sequence:
-                    self.shorten_duration(inst_playing)
-                    print_verbose('shorten OMXINSTANCE_VIDEO[{}] due to '
-                                  'start of countdown video:\n'
-                                  '  fadetime_start=={}\n'
-                                  '  fadetime_end=={}\n'
-                                  '  position=={}\n'
-                                  '  duration=={}'.format(inst_playing,
-                                        self.pl[inst_playing].fadetime_start,
-                                        self.pl[inst_playing].fadetime_end,
-                                        self.pl[inst_playing].position,
-                                        self.pl[inst_playing].duration),
-                                  VERBOSE_DEBUG)
-            elif inst_none >= 1:
+                    self.pl[inst_paused].category = CATEGORY_CNTDN
+                    self.pl[inst_paused].video_index = video[VID_INDEX]
+                    self.assign_video_params(inst_paused)
+                    if inst_paused_warm:
+                        # Don't hand it out of the pool while loading:
+                        self.warm.remove(inst_paused)
+                    # The omxplayer wrapper respawns the omxplayer, so the
+                    # load is done by the loader thread. The swap is
+                    # finished by self.finish_cntdn_swap() when ready:
+                    self.inst_swapping = inst_paused
+                    self.swap_warm = inst_paused_warm
+                    self.loading[inst_paused] = video[VID_FILENAM]
+                    self.swapper.request(inst_paused, self.pl[inst_paused],
+                                         video[VID_FILENAM], None, None,
+                                         self.video_duration(
+                                                video[VID_FILENAM]),
+                                         self.staged_path(video[VID_FILENAM]),
+                                         swap=True)
+            elif self.get_free_idle_instance() != OMXINSTANCE_NONE or \
+                 len(self.warm) > 0:
                 self.state = STATE_SELECT_CNTDN_VIDEO
 
+    def finish_cntdn_swap(self):
+        # The countdown video has been loaded into the former paused idle
+        # instance by the loader thread:
+        inst_paused = self.inst_swapping
+        self.inst_swapping = OMXINSTANCE_NONE
+        if self.pl[inst_paused].omxplayer is None:
+            # The load failed and the instance has been unloaded. Try it
+            # again by another instance on the next tick:
+            if inst_paused == self.inst_waiting:
+                self.inst_waiting = OMXINSTANCE_NONE
+            return
+        inst_playing = self.inst_running \
+                       if self.inst_running != OMXINSTANCE_NONE and \
+                       self.pl[self.inst_running].playback_status \
+                       == 'Playing' \
+                       else -1
+        # 4th: really important!
+        #   inst.duration has been adjusted to the length of the CNTDN
+        #   video sequence by the loader thread.
+        # 5th: Set next state:
+        #   skip STATE_SELECT_CNTDN_VIDEO because it was done here:
+        if self.swap_warm:
+            # The former waiting idle instance goes back to the
+            # pool and will be played after the countdown:
+            if self.inst_waiting != OMXINSTANCE_NONE:
+                self.warm.insert(0, self.inst_waiting)
+        self.inst_waiting = inst_paused
+        self.state = STATE_START_IDLE_VIDEO
+        if inst_playing < 0:
+            # The idle video has ended meanwhile:
+            return
+        
+        ######## Handle 'Playing' omxplayer instance ########
+        print_verbose('shorten playing idle omxplayer ' \
+                      'instance[{}] due to requested start ' \
+                      'of countdown video.', VERBOSE_STATE,
+                      inst_playing)
+        
+        print_verbose('original OMXINSTANCE_VIDEO[{}] before '
+                      'start of countdown video:\n'
+                      '  fadetime_start=={}\n'
+                      '  fadetime_end=={}\n'
+                      '  position=={}\n'
+                      '  duration=={}', VERBOSE_DEBUG,
+                      inst_playing,
+                      self.pl[inst_playing].fadetime_start,
+                      self.pl[inst_playing].fadetime_end,
+                      self.pl[inst_playing].position,
+                      self.pl[inst_playing].duration)
+        # Initiate now fading of idle video sequence
+        # due to requested CNTDN:
+        
+        # Exit from eventually fading-in:
+        self.pl[inst_playing].fadetime_start = 0
+        # Adjust the fade-out time of the running idle video
+        # sequence to the defined fade-out time of the planned
+        # CNTDN video sequence:
+        self.pl[inst_playing].fadetime_end = \
+             self.video_cfg(self.pl[inst_paused].filenam).fadetime_end_cntdn
+        # Shorten the duration of the running idle video sequence
+        # to "now" + fade_out time of CNTDN video sequence:
+        self.shorten_duration(inst_playing)
+        print_verbose('shorten OMXINSTANCE_VIDEO[{}] due to '
+                      'start of countdown video:\n'
+                      '  fadetime_start=={}\n'
+                      '  fadetime_end=={}\n'
+                      '  position=={}\n'
+                      '  duration=={}', VERBOSE_DEBUG,
+                      inst_playing,
+                      self.pl[inst_playing].fadetime_start,
+                      self.pl[inst_playing].fadetime_end,
+                      self.pl[inst_playing].position,
+                      self.pl[inst_playing].duration)
+
     def state_select_idle_video(self):
-        if False == \
-           self.pl[OMXINSTANCE_VIDEO1].is_fading or \
-           self.pl[OMXINSTANCE_VIDEO2].is_fading: # "not fading" condition:
-                # The method self.random_video() selects the appropriate
-                # video sequence by regarding the current state, as there are:
-                #    STATE_SELECT_CNTDN_VIDEO
-                #    STATE_SELECT_APPL_VIDEO
-                #    STATE_SELECT_IDLE_VIDEO
-                video = self.random_video(+1)
-                # todo: load video-specific meta file
-                inst = self.select_video(video[VID_FILENAM])
-                if inst == OMXINSTANCE_NONE:
-                    # Do nothing if there is no free omxplayer instance.
-                    # Even don't touch the state of the state machine.
-                    # But restore the previous video to keep the given order:
-                    self.random_video(-1) 
-                elif inst == OMXINSTANCE_VIDEO1:
-                    if self.state == STATE_SELECT_CNTDN_VIDEO:
-                        # shorten the other instance!
-                        self.shorten_duration(OMXINSTANCE_VIDEO2)
-                    self.state = STATE_START_IDLE1_VIDEO
-                elif inst == OMXINSTANCE_VIDEO2:
-                    if self.state == STATE_SELECT_CNTDN_VIDEO:
-                        # shorten the other instance!
-                        self.shorten_duration(OMXINSTANCE_VIDEO1)
-                    self.state = STATE_START_IDLE2_VIDEO
-                else: # OMXINSTANCE_ERR_NO_VIDEO
-                    # self.errmsg is already set from self.select_video(...)
-                    self.exitcode = 1
-                    self.state = STATE_ERROR
+        # The method self.state_category() selects the appropriate
+        # video category by regarding the current state, as there are:
+        #    STATE_SELECT_CNTDN_VIDEO
+        #    STATE_SELECT_APPL_VIDEO
+        #    STATE_SELECT_IDLE_VIDEO
+        category = self.state_category()
+        # A warm instance of the pool can be taken at once:
+        inst = self.take_warm_instance(category)
+        if inst == OMXINSTANCE_NONE and not self.is_loading(category):
+            # Otherwise request a new omxplayer instance from the loader
+            # and keep on ticking until it is ready:
+            if self.get_free_idle_instance() == OMXINSTANCE_NONE:
+                self.evict_warm_instance()
+            self.load_pool_instance(category)
+        if inst > OMXINSTANCE_NONE:
+            self.assign_video_params(inst)
+            if self.state == STATE_SELECT_CNTDN_VIDEO and \
+               self.inst_running != OMXINSTANCE_NONE:
+                # shorten the running instance!
+                self.shorten_duration(self.inst_running)
+            self.inst_waiting = inst
+            self.state = STATE_START_IDLE_VIDEO
+        # Otherwise do nothing while there is no warm omxplayer instance.
+        # Even don't touch the state of the state machine.
             
-    def state_start_idle_video(self, inst_waiting):
-        inst_running = OMXINSTANCE_VIDEO1 \
-                       if inst_waiting != OMXINSTANCE_VIDEO1 \
-                       else OMXINSTANCE_VIDEO2
-        # is the waiting video ...?
-        if self.pl[inst_waiting].playback_status == 'None':
-            pass
+    def running_video_ending(self):
         # is the current video fading out yet?
-        if (self.pl[inst_running].duration \
-            - self.pl[inst_running].position \
-            <= self.pl[inst_running].fadetime_end \
-               + 3 * self.timeslot) \
-           or \
-           (self.pl[inst_running].playback_status == 'None'):
-                if inst_waiting == OMXINSTANCE_VIDEO1:
-                    self.state = STATE_PLAY_IDLE1_VIDEO
-                elif inst_waiting == OMXINSTANCE_VIDEO2:
-                    self.state = STATE_PLAY_IDLE2_VIDEO
-        else:
-            # do nothing!
-            pass
+        inst_running = self.inst_running
+        return (inst_running == OMXINSTANCE_NONE) \
+               or \
+               (self.pl[inst_running].duration \
+                - self.pl[inst_running].position \
+                <= self.pl[inst_running].fadetime_end \
+                   + 3 * self.timeslot) \
+               or \
+               (self.pl[inst_running].playback_status == 'None')
 
-    def state_play_idle_video(self, inst):
+    def start_waiting_video(self):
+        # The waiting instance becomes the running one:
+        inst = self.inst_waiting
         if not self.pl[inst].omxplayer is None:
-            self.pl[inst].omxplayer.set_position(0)
+            self.pl[inst].set_position(0)
             self.pl[inst].set_alpha(self.pl[inst].alpha_start)
-            self.pl[inst].omxplayer.play()
-        if type(self.pl[inst].gpio_pin) == gpiozero.output_devices.LED:
+            self.pl[inst].play()
+        self.inst_running = inst
+        self.inst_waiting = OMXINSTANCE_NONE
+        return inst
+
+    def state_start_idle_video(self):
+        inst_waiting = self.inst_waiting
+        # is the waiting video ...?
+        if inst_waiting == OMXINSTANCE_NONE:
+            # The waiting instance got lost, e.g. due to an omxplayer error:
+            self.state = STATE_SELECT_IDLE_VIDEO
+        elif self.running_video_ending():
+            self.state = STATE_PLAY_IDLE_VIDEO
+        else:
+            # Use the time until the next fading to fill up the pool:
+            self.prefill_pool()
+
+    def state_play_idle_video(self):
+        inst = self.inst_waiting
+        if inst == OMXINSTANCE_NONE:
+            self.state = STATE_SELECT_IDLE_VIDEO
+            return
+        self.start_waiting_video()
+        if self.pl[inst].gpio_pin is not None:
             # select an applause video sequence after a countdown:
             self.state = STATE_SELECT_APPL_VIDEO
         else:
@@ -1113,102 +4857,279 @@ class StateMachine:
 
 
     #### Loop of the state machine ####    
-    def run(self):
-        last_state = STATE_EXIT
+    def reload_config(self):
+        # Take a changed config file. The new parameters are used for the
+        # next selected video, the running videos aren't touched:
+        cfg = self.config_watcher.take()
+        if cfg is None:
+            return
+        print_verbose('config file "{}" reloaded', VERBOSE_STATE,
+                      self.config_watcher.filenam)
+        for attr in ('pool_size', 'cntdn_mode', 'metadata_index',
+                     'validate_workers', 'watch', 'watch_poll',
+                     'staging_dir', 'staging_size', 'metrics_file',
+                     'metrics_port', 'metrics_interval', 'no_repeat',
+                     'randomindex_idle', 'randomindex_cntdn',
+                     'randomindex_appl'):
+            if getattr(cfg, attr) != getattr(self.cfg, attr):
+                print_verbose('config key "{}" is taken on the next start',
+                              VERBOSE_WARNING, attr)
+        cfg.apply_verbosity()
+        if cfg.log_json != self.cfg.log_json:
+            gl_log.open_json(cfg.log_json)
+        self.cfg = cfg
+        self.timeslot = cfg.timeslot
+        self.inputs.debounce = cfg.debounce
+        self.watchdog.timeout = cfg.dbus_timeout
+        self.validator.retry = cfg.validate_retry
+        for pl in self.pl:
+            pl.clock.resync_interval = cfg.resync_interval
+        cfg.print_properties(caption='RELOADED CONFIGURATION')
 
-        last_buzzer = None
-        buzzer_debounce = 0
-        
-        last_exitbtn = None
-        exitbtn_debounce = 0
-        
-        last_warnmsg = ''
-        last_errmsg = ''
+    def step(self):
+        # One tick of the state machine:
+        start = gl_clock.monotonic()
+        if self.last_tick is not None:
+            gl_metrics.tick_period.observe(start - self.last_tick)
+        self.last_tick = start
+        self.step_states()
+
+    def count_overrun(self, overrun):
+        # A tick took longer than the period until the next tick:
+        self.overruns += 1
+        gl_metrics.tick_overrun.observe(overrun)
+        print_verbose('tick {} overran its deadline by {:.3f}s',
+                      VERBOSE_DEBUG, self.tick, overrun)
+
+    def step_states(self):
+        self.reload_config()
+        self.collect_loaded_instances()
+        self.manage_players()
+        self.arm_cntdn_instance()
+
+        # Print current state of the state machine:
+        if self.state != self.last_state:
+            print_verbose('STATE=={:2}: "{}" ', VERBOSE_STATE, self.state,
+                          self.state_name())
+        else:
+            print_verbose('.',
+                          VERBOSE_STATE_PROGRESS,
+                          newline=False)
+        self.last_state = self.state
         
-        while self.state:
-            time.sleep(self.timeslot)
-            self.manage_players()
-
-            # Print current state of the state machine:
-            if self.state != last_state:
-                print_verbose('STATE=={:2}: "{}" '.format(self.state,
-                                                          self.state_name()),
-                              VERBOSE_STATE)
-            else:
-                print_verbose('.',
-                              VERBOSE_STATE_PROGRESS,
-                              newline=False)
-            last_state = self.state
-            
-            # Check for buzzer button
-            # and ignore it if it has been already pressed:
-            if self.buzzer_enabled == 0:
-                buzzer = self.gpio_buzzer.is_pressed
-                if buzzer == last_buzzer:
-                    buzzer_debounce += 1
-                else:
-                    buzzer_debounce = 0
-                last_buzzer = buzzer
-                if buzzer == True and buzzer_debounce == 2:
-                    print_verbose('<= buzzer has been tied to GND',
-                                  VERBOSE_GPIO)
-                    self.buzzer_enabled = -1 # False
-                    print_verbose('   buzzer disabled',
-                                  VERBOSE_GPIO)
-                    self.state = STATE_PREPARE_CNTDN_VIDEO
-            elif self.buzzer_enabled > 0: # decrement internal countdown
-                self.buzzer_enabled -= 1
-            
-            # Check for exit button:
-            exitbtn = self.gpio_exitbtn.is_pressed
-            if exitbtn == last_exitbtn:
-                exitbtn_debounce += 1
-            else:
-                exitbtn_debounce = 0
-            last_exitbtn = exitbtn
-            if exitbtn == True and exitbtn_debounce == 2:
+        # Check the edges of the buzzer and exit buttons. The buzzer is
+        # ignored if it has been already pressed:
+        events = self.inputs.events()
+        now = gl_clock.monotonic()
+        for name, pressed, when in events:
+            if not pressed:
+                continue
+            if name == 'exit':
                 print_verbose('<= exitpin has been tied to GND'
                               + ' (debounced) ',
                               VERBOSE_GPIO)
+                gl_metrics.input_exit.observe(now - when)
                 self.state = STATE_EXIT # exit the state machine loop
+            elif self.buzzer_enabled == 0 and self.state != STATE_EXIT:
+                print_verbose('<= buzzer has been tied to GND',
+                              VERBOSE_GPIO)
+                gl_metrics.input_buzzer.observe(now - when)
+                self.buzzer_enabled = -1 # False
+                self.buzzer_time = when
+                print_verbose('   buzzer disabled',
+                              VERBOSE_GPIO)
+                self.state = STATE_PREPARE_CNTDN_VIDEO
+        if self.buzzer_enabled > 0: # decrement internal countdown
+            self.buzzer_enabled -= 1
 
 
-            # Check the current state:
-            if self.state == STATE_ERROR:
-                self.state_error()
-            elif self.state == STATE_PREPARE_CNTDN_VIDEO:
-                self.state_prepare_cntdn_video()
-            elif self.state == STATE_SELECT_APPL_VIDEO or \
-                 self.state == STATE_SELECT_IDLE_VIDEO or \
-                 self.state == STATE_SELECT_CNTDN_VIDEO:
-                self.state_select_idle_video()
-            elif self.state == STATE_START_IDLE1_VIDEO:
-                self.state_start_idle_video(OMXINSTANCE_VIDEO1)
-            elif self.state == STATE_START_IDLE2_VIDEO:
-                self.state_start_idle_video(OMXINSTANCE_VIDEO2)
-            elif self.state == STATE_PLAY_IDLE1_VIDEO:
-                self.state_play_idle_video(OMXINSTANCE_VIDEO1)
-            elif self.state == STATE_PLAY_IDLE2_VIDEO:
-                self.state_play_idle_video(OMXINSTANCE_VIDEO2)
-                
-            # print occurred warnings and errors:
-            if self.warnmsg != last_warnmsg:
-                if self.warnmsg != '':
-                    print_verbose(self.warnmsg, VERBOSE_WARNING)
-                last_warnmsg = self.warnmsg
-            if self.errmsg != last_errmsg:
-                if self.errmsg != '':
-                    print_verbose(self.errmsg, VERBOSE_ERROR)
-                last_errmsg = self.errmsg
+        # Check the current state:
+        if self.state == STATE_ERROR:
+            self.state_error()
+        elif self.state == STATE_PREPARE_CNTDN_VIDEO:
+            self.state_prepare_cntdn_video()
+        elif self.state == STATE_SELECT_APPL_VIDEO or \
+             self.state == STATE_SELECT_IDLE_VIDEO or \
+             self.state == STATE_SELECT_CNTDN_VIDEO:
+            self.state_select_idle_video()
+        elif self.state == STATE_START_IDLE_VIDEO:
+            self.state_start_idle_video()
+        elif self.state == STATE_PLAY_IDLE_VIDEO:
+            self.state_play_idle_video()
+            
+        # print occurred warnings and errors:
+        if self.warnmsg != self.last_warnmsg:
+            if self.warnmsg != '':
+                print_verbose(self.warnmsg, VERBOSE_WARNING)
+            self.last_warnmsg = self.warnmsg
+        if self.errmsg != self.last_errmsg:
+            if self.errmsg != '':
+                print_verbose(self.errmsg, VERBOSE_ERROR)
+            self.last_errmsg = self.errmsg
+
+    def next_deadline(self):
+        # Time in seconds until the state machine has got something to do
+        # if no external event (GPIO edge, finished load) occurs before.
+        waiting_for_load = (self.state == STATE_SELECT_IDLE_VIDEO or
+                            self.state == STATE_SELECT_APPL_VIDEO or
+                            self.state == STATE_SELECT_CNTDN_VIDEO) and \
+                           self.is_loading(self.state_category())
+        if (self.state != STATE_START_IDLE_VIDEO and not waiting_for_load) \
+           or self.is_fading() \
+           or self.buzzer_enabled > 0 \
+           or self.inputs.bouncing():
+            # Transitions, fadings and debouncing need every tick:
+            return self.timeslot
+        delay = self.cfg.timeslot_idle
+        for inst in self.active_instances():
+            pl = self.pl[inst]
+            if pl.playback_status != 'Playing':
+                continue
+            remaining = pl.duration - pl.position
+            # start of fading-out and end of the video sequence:
+            deadlines = [remaining - pl.fadetime_end, remaining]
+            if inst == self.inst_running:
+                # start of the waiting video in STATE_START_IDLE_VIDEO:
+                deadlines.append(remaining - pl.fadetime_end
+                                 - 3 * self.timeslot)
+            for deadline in deadlines:
+                if 0 < deadline < delay:
+                    delay = deadline
+        return max(delay, TICK_MIN)
 
+    def run(self):
+        self.run_poll()
+        self.cleanup()
+
+    def run_poll(self):
+        # Tick at absolute deadlines, so the work of a tick doesn't delay
+        # the following ticks. The period is the timeslot while something
+        # is time-critical and up to timeslot_idle during a steady
+        # playback (see next_deadline()). A button edge or a finished load
+        # starts a tick at once. A missed deadline is skipped instead of
+        # being caught up in a burst. It is an overrun if the tick took
+        # longer than the timeslot.
+        wakeup = threading.Event()
+        self.inputs.notify = wakeup.set
+        self.loader.notify = wakeup.set
+        self.swapper.notify = wakeup.set
+        deadline = gl_clock.monotonic() + self.timeslot
+        while self.state:
+            gl_clock.sleep(max(0.0, deadline - gl_clock.monotonic()), wakeup)
+            if wakeup.is_set():
+                wakeup.clear()
+                deadline = gl_clock.monotonic()
+            self.tick += 1
+            start = gl_clock.monotonic()
+            self.step()
+            deadline += self.next_deadline()
+            now = gl_clock.monotonic()
+            if now > deadline:
+                overrun = now - max(deadline, start + self.timeslot)
+                if overrun > 0:
+                    self.count_overrun(overrun)
+                deadline = now
+        self.inputs.notify = None
+        self.loader.notify = None
+        self.swapper.notify = None
+
+    def cleanup(self):
         # cleanup all omxplayer instances
+        gl_clock.stop()
+        self.inputs.stop()
+        self.trigger.stop()
+        self.loader.stop()
+        self.swapper.stop()
+        self.status_executor.shutdown()
+        self.validator.stop()
+        self.config_watcher.stop()
+        if self.watcher is not None:
+            self.watcher.stop()
+        self.prefetcher.stop()
+        if self.staging is not None:
+            self.staging.stop()
+            if gl_verbosity >= VERBOSE_VIDEOINFO:
+                print_verbose('{}', VERBOSE_VIDEOINFO, self.staging.stats())
+        if self.metadata is not None:
+            self.metadata.stop()
+        self.exporter.stop()
+        print_verbose('{} ticks, {} overruns', VERBOSE_DEBUG, self.tick,
+                      self.overruns)
+        gl_metrics.print_summary()
         for pl in self.pl:
             pl.unload_omxplayer()
+        self.watchdog.stop()
+        if self.watchdog.recoveries > 0:
+            print_verbose('{} hung or failed omxplayer instances recovered',
+                          VERBOSE_STATE, self.watchdog.recoveries)
+        gl_log.flush()
         if gl_verbosity >= VERBOSE_STATE:
             print()
 
 
+def simulate_main(argv):
+    # Command line: ravidplay.py --simulate SECONDS [--spawn=SECONDS]
+    #               [--duration=SECONDS] [--dbus=SECONDS] [--errors=RATE]
+    #               [--hangs=RATE] [--buzzer=SECONDS] [--seed=N]
+    #               config parameters...
+    # Runs the state machine against the simulated backend for the given
+    # time of the virtual clock. The buzzer is pressed at random intervals.
+    try:
+        seconds = float(argv[0])
+    except (IndexError, ValueError):
+        print('usage: ravidplay.py --simulate SECONDS [--spawn=SECONDS] '
+              '[--duration=SECONDS] [--dbus=SECONDS] [--errors=RATE] '
+              '[--hangs=RATE] [--buzzer=SECONDS] [--seed=N] '
+              '-idle: ... -cntdn: ...')
+        return 2
+    options = {'spawn': DEFAULT_SIM_SPAWN, 'duration': DEFAULT_SIM_DURATION,
+               'dbus': DEFAULT_SIM_DBUS, 'errors': 0.0, 'hangs': 0.0,
+               'buzzer': DEFAULT_SIM_BUZZER, 'seed': None}
+    params = []
+    for w in argv[1:]:
+        key = w[2:].split('=')[0]
+        if w.startswith('--') and key in options and '=' in w:
+            options[key] = float(w.split('=', 1)[1])
+        else:
+            params.append(w)
+    seed = None if options['seed'] is None else int(options['seed'])
+    random.seed(seed)
+    backend = SimulationBackend(options['spawn'], options['duration'],
+                                options['dbus'], options['errors'], seed,
+                                hang_rate=options['hangs'])
+    statemachine = StateMachine(params, backend)
+    when = 0.0
+    while options['buzzer'] > 0:
+        when += backend.random.expovariate(1.0 / options['buzzer'])
+        if when >= seconds:
+            break
+        backend.press(GPIO_BUZZER, when)
+    backend.press(GPIO_EXITBTN, seconds, None)
+    t0 = time.monotonic()
+    statemachine.run()
+    print()
+    print('{:.0f}s simulated in {:.1f}s: {} ticks, {} omxplayer spawns, '
+          '{} D-Bus calls ({} failed, {} hung), {} recovered, '
+          '{} camera triggers'.format(
+              backend.clock.monotonic(), time.monotonic() - t0,
+              statemachine.tick, backend.spawns, backend.dbus_calls,
+              backend.dbus_errors, backend.hangs,
+              statemachine.watchdog.recoveries,
+              len([edge for edge in backend.leds[GPIO_TRIGGERPIN].edges
+                   if edge[1]])))
+    gl_metrics.print_summary(VERBOSE_NONE)
+    return statemachine.exitcode
+
+
 if __name__ == '__main__':
+    if len(sys.argv) > 1 and sys.argv[1] == '--probe':
+        # Examine the given video files and exit:
+        sys.exit(probe_main(sys.argv[2:]))
+    if len(sys.argv) > 1 and sys.argv[1] == '--simulate':
+        # Run the state machine without Raspberry Pi:
+        sys.exit(simulate_main(sys.argv[2:]))
+    if gl_import_error is not None:
+        raise gl_import_error
     random.seed()
     statemachine = StateMachine()
     statemachine.run()
@@ -0,0 +1,75 @@
+#!/usr/bin/python3
+
+# test_videoselector.py -- Tests of the video selection of ravidplay.py
+# Copyright (C) 2021 schlizbäda
+#
+# test_videoselector.py is free software: you can redistribute it and/or
+# modify it under the terms of the GNU General Public License as published
+# by the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# usage: python3 -m unittest discover tests
+
+
+import os
+import sys
+import random
+import unittest
+
+TESTDIR = os.path.dirname(os.path.realpath(__file__))
+sys.path.insert(0, os.path.dirname(TESTDIR))
+import ravidplay
+
+
+DRAWS = 3000
+
+
+class Weights:
+    # Weights of the videos like the SidecarCache:
+    def __init__(self, weights):
+        self.weights = weights
+        self.version = 0
+
+    def weight(self, filenam):
+        return self.weights.get(filenam, 1.0)
+
+
+def selection(count, no_repeat, weights=None):
+    # Indices of DRAWS random selections among count videos:
+    playlist = ravidplay.Playlist(ravidplay.CATEGORY_IDLE)
+    for i in range(count):
+        playlist.add('video{}.mp4'.format(i))
+    sidecars = None if weights is None else Weights(weights)
+    selector = ravidplay.VideoSelector(playlist, -1, no_repeat, sidecars)
+    return [selector.next()[ravidplay.VID_INDEX] for i in range(DRAWS)]
+
+
+def repeats(indices, window):
+    # Number of selections taken again within the given window:
+    return sum(1 for i in range(len(indices))
+               if indices[i] in indices[max(0, i - window):i])
+
+
+class VideoSelectorTest(unittest.TestCase):
+    def setUp(self):
+        random.seed(1)
+
+    def test_no_repeat_window(self):
+        for weights in (None, {'video0.mp4': 10.0}):
+            self.assertEqual(repeats(selection(6, 3, weights), 3), 0)
+
+    def test_not_more_videos_than_no_repeat(self):
+        # The window can't be kept, but no video is played twice in a row
+        # and all of them are taken in turn:
+        for count, no_repeat in ((2, 3), (3, 3), (4, 5)):
+            for weights in (None, {'video0.mp4': 10.0}):
+                indices = selection(count, no_repeat, weights)
+                self.assertEqual(repeats(indices, 1), 0)
+                self.assertEqual(repeats(indices, count - 1), 0)
+
+    def test_single_video(self):
+        self.assertEqual(set(selection(1, 3)), {0})
+
+
+if __name__ == '__main__':
+    unittest.main()